@@ -5,15 +5,24 @@
 参考:
 >https://qiita.com/nohanaga/items/1263f4a6bc909b6524c8
 """
-import os
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import AnalyzeResult
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+from azure.core.polling.base_polling import LROBasePolling
+from common.client_registry import get_env
 from common.load_config import load_config
-from dotenv import load_dotenv
-from typing_extensions import Any
+from common.rate_limiter import get_rate_limiter
+from typing_extensions import Any, Iterator
+
+# ステータスコードによらずリトライする例外(接続エラー)
+RETRY_ON = (ServiceRequestError, ServiceResponseError)
+
+# 解析結果のポーリング間隔の秒数(クライアントの既定値と同じ)
+POLLING_INTERVAL = 1
 
 
 class AzAIServices:
@@ -28,9 +37,8 @@ class AzAIServices:
 
     def __init__(self):
         """イニシャライザ"""
-        load_dotenv()
-        self.api_key = os.getenv("AZURE_AI_SERVICES_API_KEY")
-        self.endpoint = os.getenv("AZURE_AI_SERVICES_ENDPOINT")
+        self.api_key = get_env("AZURE_AI_SERVICES_API_KEY")
+        self.endpoint = get_env("AZURE_AI_SERVICES_ENDPOINT")
 
 
 class AzAIDocumentIntelligence(AzAIServices):
@@ -42,6 +50,7 @@ class AzAIDocumentIntelligence(AzAIServices):
     Attributes:
         document_intelligence_client: AIDIクライアント
         config_aidi: AIDIの設定値
+        rate_limiter: 解析依頼のAPI実行のレート制限
     """
 
     def __init__(self):
@@ -53,6 +62,8 @@ class AzAIDocumentIntelligence(AzAIServices):
         )
         config = load_config()
         self.config_aidi = config["az_ai_document_intelligence"]
+        self.rate_limiter = get_rate_limiter(
+            "az_ai_document_intelligence", RETRY_ON)
 
     def get_analyzed_result(
             self,
@@ -61,6 +72,8 @@ class AzAIDocumentIntelligence(AzAIServices):
         """ドキュメントの構造解析を実行する関数
 
         API実行によりレイアウトモデルの解析結果を取得する.
+        解析の依頼はレート制限の範囲内で実行し,失敗時はレート制限側でリトライする.
+        解析結果のポーリングはクライアントのリトライ設定に従い,一時的なエラーはクライアント側でリトライする.
 
         Args:
             path_input_file: 解析対象ドキュメントのパス
@@ -68,15 +81,50 @@ class AzAIDocumentIntelligence(AzAIServices):
         Returns:
             構造解析結果
         """
+        # リトライ時に同じ内容を再送できるよう先に読み込む
         with open(path_input_file, "rb") as f:
-            poller = self.document_intelligence_client.begin_analyze_document(
-                model_id=self.config_aidi["model_id"],
-                body=f,
-                output_content_format=self.config_aidi["output_content_format"],
-            )
+            body = f.read()
+        poller = self.rate_limiter.call(
+            self.document_intelligence_client.begin_analyze_document,
+            model_id=self.config_aidi["model_id"],
+            body=body,
+            output_content_format=self.config_aidi["output_content_format"],
+            retry_total=0,  # 解析の依頼のリトライはレート制限側で行う
+            # 依頼時の引数はポーリングにも引き継がれるため,ポーリング方法を明示してリトライを有効に保つ
+            polling=LROBasePolling(
+                POLLING_INTERVAL,
+                path_format_arguments={"endpoint": self.endpoint},
+            ),
+        )
         result: AnalyzeResult = poller.result()
         return result
 
+    def get_analyzed_results(
+            self,
+            paths_input_file: list[Path],
+            max_workers: int,
+    ) -> Iterator[tuple[Path, Future]]:
+        """複数ドキュメントの構造解析を並行して実行する関数
+
+        最大 max_workers 件の解析を同時に依頼し,各ポーラーの完了を並行して待つ.
+        解析結果は完了した順に返却する.
+
+        Args:
+            paths_input_file: 解析対象ドキュメントのパス群
+            max_workers: 同時に解析するドキュメント数の上限
+
+        Returns:
+            解析対象ドキュメントのパスおよび構造解析結果を保持する Future
+            解析に失敗した場合は Future.result() で例外が送出される
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.get_analyzed_result, path): path
+                for path in paths_input_file
+            }
+            for future in as_completed(futures):
+                yield futures[future], future
+
     def get_content(
             self,
             result: AnalyzeResult,
@@ -1,11 +1,206 @@
 """Azure OpenAI Service (AOAI) による機能をまとめたモジュール
 
 各スクリプトで AOAI の処理が必要なときは本モジュールから呼び出す.
+ChatモデルのAPI実行の要求内容の作成および応答の処理は common.model_request に共通化している.
 """
-import os
+from functools import lru_cache, partial
 
-from dotenv import load_dotenv
-from openai import AzureOpenAI
+from common.cache_utils import get_response_cache, make_cache_key
+from common.client_registry import (get_async_azure_openai_client,
+                                    get_azure_openai_client, get_env)
+from common.load_config import load_config
+from common.model_request import (AsyncChatModelMixin, ChatModelMixin,
+                                  ModelRequest)
+from common.rate_limiter import get_rate_limiter
+from common.string_utils import count_tokens_many, resolve_model_name
+from openai import APIConnectionError
+from typing_extensions import Any, Iterator
+
+config = load_config()
+CONFIG_CHAT = config["azure_openai"]["chat"]
+CONFIG_EMBEDDING = config["azure_openai"]["embedding"]
+
+# ステータスコードによらずリトライする例外(タイムアウトを含む接続エラー)
+RETRY_ON = (APIConnectionError,)
+
+
+def pack_texts(
+        texts: list[str],
+        model_name: str,
+        max_inputs_per_request: int,
+        max_tokens_per_request: int,
+) -> list[list[int]]:
+    """埋め込み対象のテキストをリクエスト単位にまとめる関数
+
+    1リクエストあたりの入力数およびトークン数の上限を超えない範囲で,
+    入力順を保ったまま可能な限り多くのテキストを1リクエストにまとめる.
+
+    Args:
+        texts: 埋め込み対象のテキスト群
+        model_name: トークン数カウントに使用するモデル名
+        max_inputs_per_request: 1リクエストあたりの最大入力数
+        max_tokens_per_request: 1リクエストあたりの最大トークン数
+
+    Returns:
+        リクエストごとのテキストのインデックス
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for i, tokens in enumerate(count_tokens_many(texts, model_name)):
+        # 上限を超える場合は現在のリクエストを確定し次のリクエストに詰める
+        if batch and (
+            len(batch) >= max_inputs_per_request
+            or batch_tokens + tokens > max_tokens_per_request
+        ):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def parse_embeddings(
+        response: Any,
+) -> list[list[float]]:
+    """Embeddingモデルの応答から入力順の埋め込みベクトル群を取り出す関数
+
+    応答の順序は保証されないため index をもとに入力順に戻す.
+
+    Args:
+        response: Embeddingモデルの応答
+
+    Returns:
+        埋め込みベクトル群
+    """
+    embedding_vectors = [None] * len(response.data)
+    for item in response.data:
+        embedding_vectors[item.index] = item.embedding
+    return embedding_vectors
+
+
+class EmbeddingRequestMixin:
+    """Embeddingモデルの要求内容を作成する機能をまとめたクラス
+
+    継承先のクラスは cache, rate_limiter, dep_id_embedding_comp, model_name,
+    max_inputs_per_request および max_tokens_per_request を持つ.
+    """
+
+    def make_cache_key(
+            self,
+            text: str,
+    ) -> str:
+        """埋め込みベクトルのキャッシュのキーを作成するメソッド
+
+        Args:
+            text: 埋め込み対象のテキスト
+
+        Returns:
+            キャッシュのキー
+        """
+        return make_cache_key(
+            "embedding",
+            f"azure_openai:{self.dep_id_embedding_comp}",
+            {},
+            text,
+        )
+
+    def make_embedding_request(
+            self,
+            text: str,
+    ) -> ModelRequest:
+        """1件のテキストの埋め込みの要求内容を作成するメソッド
+
+        Args:
+            text: 埋め込み対象のテキスト
+
+        Returns:
+            API実行の要求内容
+        """
+        kwargs = {
+            "tokens": self.rate_limiter.count_tokens(text),
+            "input": text,
+            "model": self.dep_id_embedding_comp,
+        }
+        cache_key = self.make_cache_key(text) if self.cache is not None else None
+        return ModelRequest.with_cache(
+            kwargs,
+            lambda response: response.data[0].embedding,
+            self.cache,
+            cache_key,
+        )
+
+    def make_embedding_requests(
+            self,
+            texts: list[str],
+    ) -> tuple[list[int], list[list[float]], list[tuple[list[int], ModelRequest]]]:
+        """複数テキストの埋め込みの要求内容をリクエスト単位で作成するメソッド
+
+        キャッシュに存在するテキストは API の実行対象から除く.
+        残りのテキストはトークン数に応じて最小限のリクエストにまとめる.
+
+        Args:
+            texts: 埋め込み対象のテキスト群
+
+        Returns:
+            キャッシュに存在するテキストのインデックス群および埋め込みベクトル群,
+            リクエストごとの入力テキストのインデックス群および要求内容
+        """
+        cache_keys = [None] * len(texts)
+        indices_hit, vectors_hit = [], []
+        if self.cache is not None:
+            for i, text in enumerate(texts):
+                cache_keys[i] = self.make_cache_key(text)
+                embedding_vector = self.cache.get(cache_keys[i])
+                if embedding_vector is not None:
+                    indices_hit.append(i)
+                    vectors_hit.append(embedding_vector)
+
+        # キャッシュに存在しないテキストのみ API を実行する
+        set_hit = set(indices_hit)
+        indices_miss = [i for i in range(len(texts)) if i not in set_hit]
+        batches = pack_texts(
+            [texts[i] for i in indices_miss],
+            self.model_name,
+            self.max_inputs_per_request,
+            self.max_tokens_per_request,
+        )
+        requests = []
+        for batch in batches:
+            indices = [indices_miss[j] for j in batch]
+            inputs = [texts[i] for i in indices]
+            kwargs = {
+                "tokens": self.rate_limiter.count_tokens(*inputs),
+                "input": inputs,
+                "model": self.dep_id_embedding_comp,
+            }
+            store = None
+            if self.cache is not None:
+                store = partial(self.store_vectors, [cache_keys[i] for i in indices])
+            requests.append(
+                (indices, ModelRequest(kwargs, parse_embeddings, store=store)))
+
+        return indices_hit, vectors_hit, requests
+
+    def store_vectors(
+            self,
+            cache_keys: list[str],
+            embedding_vectors: list[list[float]],
+    ) -> None:
+        """リクエスト単位の埋め込みベクトル群をキャッシュに保存するメソッド
+
+        Args:
+            cache_keys: 各入力テキストのキャッシュのキー
+            embedding_vectors: 各入力テキストの埋め込みベクトル
+
+        Returns:
+            None
+        """
+        for cache_key, embedding_vector in zip(cache_keys, embedding_vectors):
+            self.cache.set(cache_key, embedding_vector)
 
 
 class AOAIModel:
@@ -15,97 +210,222 @@ class AOAIModel:
 
     Attributes:
         client: AOAIクライアント
+        cache: 応答のキャッシュ(無効の場合は None)
+        rate_limiter: API実行のレート制限(サブクラスで設定する)
     """
 
+    provider = "azure_openai"
+
     def __init__(self):
         """イニシャライザ"""
-        load_dotenv()
-        self.client = AzureOpenAI(
-            api_key=os.getenv("AOAI_API_KEY"),
-            azure_endpoint=os.getenv("AOAI_ENDPOINT"),
-            api_version=os.getenv("AOAI_API_VERSION"),
-        )
+        self.client = get_azure_openai_client()  # プロセス内で共有するクライアント
+        self.cache = get_response_cache()
 
 
-class AOAIChatModel(AOAIModel):
+class AOAIChatModel(AOAIModel, ChatModelMixin):
     """Azure OpenAI Services (AOAI) の Chat モデルの機能をまとめたクラス
 
     必要なパラメータを設定し, AOAIのAPIを実行する.
 
     Attributes:
         dep_id_chat_comp: ChatモデルID
-        system_content: システムプロンプト
+        model_name: トークン数カウントに使用するモデル名
+        system_content: システムプロンプトの既定値
     """
 
     def __init__(
             self,
-            system_content: str,
+            system_content: str = "",
     ):
         """イニシャライザ
 
+        クライアントはプロセス内で共有するため,インスタンスを使い回す場合は
+        呼び出しごとにシステムプロンプトを指定する.
+
         Args:
-            system_content: システムプロンプト
+            system_content: システムプロンプトの既定値
         """
         super().__init__()
-        self.dep_id_chat_comp = os.getenv(
+        self.dep_id_chat_comp = get_env(
             "AOAI_DEPLOYMENT_ID_FOR_CHAT_COMPLETION")
+        self.model_name = resolve_model_name(
+            self.dep_id_chat_comp, CONFIG_CHAT["model_name"])
         self.system_content = system_content
+        self.rate_limiter = get_rate_limiter("azure_openai_chat", RETRY_ON)
+
+
+class AOAIEmbeddingModel(AOAIModel, EmbeddingRequestMixin):
+    """Azure OpenAI Services (AOAI) の Embedding モデルの機能をまとめたクラス
 
-    def get_response_only_text(
+    必要なパラメータを設定し, AOAIのAPIを実行する.
+
+    Attributes:
+        dep_id_embedding_comp: EmbeddingモデルID
+        model_name: トークン数カウントに使用するモデル名
+        max_inputs_per_request: 1リクエストあたりの最大入力数
+        max_tokens_per_request: 1リクエストあたりの最大トークン数
+    """
+
+    def __init__(self):
+        """イニシャライザ"""
+        super().__init__()
+        self.dep_id_embedding_comp = get_env(
+            "AOAI_DEPLOYMENT_ID_FOR_EMBEDDING")
+        self.model_name = resolve_model_name(
+            self.dep_id_embedding_comp, CONFIG_EMBEDDING["model_name"])
+        self.max_inputs_per_request = CONFIG_EMBEDDING["max_inputs_per_request"]
+        self.max_tokens_per_request = CONFIG_EMBEDDING["max_tokens_per_request"]
+        self.rate_limiter = get_rate_limiter("azure_openai_embedding", RETRY_ON)
+
+    def get_response(
             self,
-            user_content: str,
-            max_tokens: int = 4000,
-            temperature: float = 0.2,
-    ) -> str:
-        """AOAIのChatモデルのAPIを実行し応答を取得するメソッド
+            text: str,
+    ) -> list[float]:
+        """AOAIのEmbeddingモデルのAPIを実行し応答を取得するメソッド
 
-        インプットはテキストのみを想定する.
-        Chat履歴をリセットしてAPIを実行する.
+        使用するモデルにより埋め込みの次元数が異なることに注意する.
+        キャッシュに存在するテキストは API を実行しない.
 
         Args:
-            user_content: ユーザープロンプト
-            max_tokens: Chatモデル入出力合計トークン数の上限値
-            temperature: Chatモデル応答のランダム性(創造性)
+            text: 埋め込み対象のテキスト
 
         Returns:
-            Chatモデルが生成した応答テキスト
+            埋め込みベクトル
         """
-        messages = [
-            {"role": "system", "content": self.system_content},
-            {"role": "user", "content": user_content},
-        ]
-        response = self.client.chat.completions.create(
-            model=self.dep_id_chat_comp,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-        ).choices[0].message.content
+        request = self.make_embedding_request(text)
+        if request.cached is not None:
+            return request.cached
+        return request.finish(self.rate_limiter.call(
+            self.client.embeddings.create, **request.kwargs))
 
-        return response
+    def iter_responses(
+            self,
+            texts: list[str],
+    ) -> Iterator[tuple[list[int], list[list[float]]]]:
+        """複数テキストの埋め込みをリクエスト単位で逐次取得するメソッド
 
+        テキスト群はトークン数に応じて最小限のリクエストにまとめて API を実行する.
+        キャッシュに存在するテキストは API の実行対象から除き,最初にまとめて返却する.
+        リクエストが完了するたびに結果を返却するため,呼び出し元で逐次保存できる.
 
-class AOAIEmbeddingModel(AOAIModel):
-    """Azure OpenAI Services (AOAI) の Embedding モデルの機能をまとめたクラス
+        Args:
+            texts: 埋め込み対象のテキスト群
 
-    必要なパラメータを設定し, AOAIのAPIを実行する.
+        Returns:
+            入力テキストのインデックス群および対応する埋め込みベクトル群
+        """
+        indices_hit, vectors_hit, requests = self.make_embedding_requests(texts)
+        if indices_hit:
+            yield indices_hit, vectors_hit
+        for indices, request in requests:
+            yield indices, request.finish(self.rate_limiter.call(
+                self.client.embeddings.create, **request.kwargs))
+
+    def get_responses(
+            self,
+            texts: list[str],
+    ) -> list[list[float]]:
+        """複数テキストの埋め込みをまとめて取得するメソッド
+
+        テキスト群はトークン数に応じて最小限のリクエストにまとめて API を実行する.
+        キャッシュに存在するテキストは API の実行対象から除く.
+        戻り値の埋め込みベクトルの順序は入力テキストの順序と一致する.
+
+        Args:
+            texts: 埋め込み対象のテキスト群
+
+        Returns:
+            埋め込みベクトル群
+        """
+        embedding_vectors = [None] * len(texts)
+        for indices, vectors in self.iter_responses(texts):
+            for i, embedding_vector in zip(indices, vectors):
+                embedding_vectors[i] = embedding_vector
+
+        return embedding_vectors
+
+
+class AsyncAOAIModel:
+    """Azure OpenAI Services (AOAI) のLLMモデルの非同期処理の機能をまとめたクラス
+
+    各モデル利用のための共通機能をまとめる.
+
+    Attributes:
+        client: AOAI非同期クライアント
+        cache: 応答のキャッシュ(無効の場合は None)
+        rate_limiter: API実行のレート制限(サブクラスで設定する)
+    """
+
+    provider = "azure_openai"
+
+    def __init__(self):
+        """イニシャライザ"""
+        self.client = get_async_azure_openai_client()  # プロセス内で共有するクライアント
+        self.cache = get_response_cache()
+
+
+class AsyncAOAIChatModel(AsyncAOAIModel, AsyncChatModelMixin):
+    """Azure OpenAI Services (AOAI) の Chat モデルの非同期処理の機能をまとめたクラス
+
+    必要なパラメータを設定し, AOAIのAPIを非同期で実行する.
+
+    Attributes:
+        dep_id_chat_comp: ChatモデルID
+        model_name: トークン数カウントに使用するモデル名
+        system_content: システムプロンプトの既定値
+    """
+
+    def __init__(
+            self,
+            system_content: str = "",
+    ):
+        """イニシャライザ
+
+        クライアントはプロセス内で共有するため,インスタンスを使い回す場合は
+        呼び出しごとにシステムプロンプトを指定する.
+
+        Args:
+            system_content: システムプロンプトの既定値
+        """
+        super().__init__()
+        self.dep_id_chat_comp = get_env(
+            "AOAI_DEPLOYMENT_ID_FOR_CHAT_COMPLETION")
+        self.model_name = resolve_model_name(
+            self.dep_id_chat_comp, CONFIG_CHAT["model_name"])
+        self.system_content = system_content
+        self.rate_limiter = get_rate_limiter("azure_openai_chat", RETRY_ON)
+
+
+class AsyncAOAIEmbeddingModel(AsyncAOAIModel, EmbeddingRequestMixin):
+    """Azure OpenAI Services (AOAI) の Embedding モデルの非同期処理の機能をまとめたクラス
+
+    必要なパラメータを設定し, AOAIのAPIを非同期で実行する.
 
     Attributes:
         dep_id_embedding_comp: EmbeddingモデルID
+        model_name: トークン数カウントに使用するモデル名
+        max_inputs_per_request: 1リクエストあたりの最大入力数
+        max_tokens_per_request: 1リクエストあたりの最大トークン数
     """
 
     def __init__(self):
         """イニシャライザ"""
         super().__init__()
-        self.dep_id_embedding_comp = os.getenv(
+        self.dep_id_embedding_comp = get_env(
             "AOAI_DEPLOYMENT_ID_FOR_EMBEDDING")
+        self.model_name = resolve_model_name(
+            self.dep_id_embedding_comp, CONFIG_EMBEDDING["model_name"])
+        self.max_inputs_per_request = CONFIG_EMBEDDING["max_inputs_per_request"]
+        self.max_tokens_per_request = CONFIG_EMBEDDING["max_tokens_per_request"]
+        self.rate_limiter = get_rate_limiter("azure_openai_embedding", RETRY_ON)
 
-    def get_response(
+    async def get_response(
             self,
             text: str,
     ) -> list[float]:
-        """AOAIのEmbeddingモデルのAPIを実行し応答を取得するメソッド
+        """AOAIのEmbeddingモデルのAPIを非同期で実行し応答を取得するメソッド
 
-        使用するモデルにより埋め込みの次元数が異なることに注意する.
+        処理内容は AOAIEmbeddingModel.get_response と同一である.
 
         Args:
             text: 埋め込み対象のテキスト
@@ -113,9 +433,64 @@ class AOAIEmbeddingModel(AOAIModel):
         Returns:
             埋め込みベクトル
         """
-        embedding_vector = self.client.embeddings.create(
-            input=text,
-            model=self.dep_id_embedding_comp,
-        ).data[0].embedding
+        request = self.make_embedding_request(text)
+        if request.cached is not None:
+            return request.cached
+        return request.finish(await self.rate_limiter.call_async(
+            self.client.embeddings.create, **request.kwargs))
+
+    async def get_responses(
+            self,
+            texts: list[str],
+    ) -> list[list[float]]:
+        """複数テキストの埋め込みをまとめて非同期で取得するメソッド
+
+        処理内容は AOAIEmbeddingModel.get_responses と同一である.
+
+        Args:
+            texts: 埋め込み対象のテキスト群
+
+        Returns:
+            埋め込みベクトル群
+        """
+        embedding_vectors = [None] * len(texts)
+        indices_hit, vectors_hit, requests = self.make_embedding_requests(texts)
+        for i, embedding_vector in zip(indices_hit, vectors_hit):
+            embedding_vectors[i] = embedding_vector
+        for indices, request in requests:
+            vectors = request.finish(await self.rate_limiter.call_async(
+                self.client.embeddings.create, **request.kwargs))
+            for i, embedding_vector in zip(indices, vectors):
+                embedding_vectors[i] = embedding_vector
+
+        return embedding_vectors
+
+
+@lru_cache(maxsize=None)
+def get_aoai_chat_model() -> AOAIChatModel:
+    """プロセス内で共有する AOAI の Chat モデルを取得する関数
 
-        return embedding_vector
+    システムプロンプトは呼び出しごとに get_response_only_text に指定する.
+
+    Args:
+        None
+
+    Returns:
+        AOAI の Chat モデル
+    """
+    return AOAIChatModel()
+
+
+@lru_cache(maxsize=None)
+def get_async_aoai_chat_model() -> AsyncAOAIChatModel:
+    """プロセス内で共有する AOAI の Chat モデル(非同期)を取得する関数
+
+    システムプロンプトは呼び出しごとに get_response_only_text に指定する.
+
+    Args:
+        None
+
+    Returns:
+        AOAI の Chat モデル(非同期)
+    """
+    return AsyncAOAIChatModel()
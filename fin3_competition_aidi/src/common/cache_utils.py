@@ -0,0 +1,218 @@
+"""共通的なキャッシュの機能をまとめたモジュール
+
+LLMモデルの応答をディスク上(SQLite)にキャッシュし,同一の入力に対するAPI実行を省略する.
+キャッシュのキーはモデル名,パラメータおよび入力テキストのハッシュ値とする.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from common.load_config import load_config
+from typing_extensions import Any
+
+
+def make_cache_key(
+        kind: str,
+        model: str,
+        params: dict[str, Any],
+        text: str,
+) -> str:
+    """キャッシュのキーを作成する関数
+
+    内容が同一であれば実行のたびに同じキーとなる.
+
+    Args:
+        kind: 応答の種類(chat, embedding など)
+        model: プロバイダーおよびモデル名(デプロイ名)
+        params: 応答に影響するパラメータ
+        text: 入力テキスト
+
+    Returns:
+        キャッシュのキー(SHA-256)
+    """
+    payload = json.dumps(
+        {"kind": kind, "model": model, "params": params, "text": text},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LLMモデルの応答をキャッシュするクラス
+
+    キャッシュの合計サイズが上限を超えた場合は最終アクセスが古いものから削除する(LRU).
+    複数スレッドからの利用を想定し,DBアクセスはロックで排他する.
+
+    Attributes:
+        path: キャッシュのDBファイルのパス
+        max_bytes: キャッシュの合計サイズの上限
+        hits: キャッシュヒット数
+        misses: キャッシュミス数
+        evictions: 削除したキャッシュ数
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            max_bytes: int,
+    ):
+        """イニシャライザ
+
+        Args:
+            path: キャッシュのDBファイルのパス
+            max_bytes: キャッシュの合計サイズの上限
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON cache(last_access)"
+        )
+        self.conn.commit()
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()[0]
+
+    def get(
+            self,
+            key: str,
+    ) -> Any | None:
+        """キャッシュから値を取得するメソッド
+
+        取得できた場合は最終アクセス時刻を更新する.
+
+        Args:
+            key: キャッシュのキー
+
+        Returns:
+            キャッシュされた値
+            キャッシュが存在しない場合は None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE cache SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(
+            self,
+            key: str,
+            value: Any,
+    ) -> None:
+        """キャッシュに値を格納するメソッド
+
+        合計サイズが上限を超えた場合は古いキャッシュを削除する.
+
+        Args:
+            key: キャッシュのキー
+            value: キャッシュする値(JSONに変換可能であること)
+
+        Returns:
+            None
+        """
+        value_json = json.dumps(value, ensure_ascii=False)
+        size = len(value_json.encode("utf-8"))
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.total_bytes -= row[0]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value_json, size, time.time()),
+            )
+            self.total_bytes += size
+            self.evict()
+            self.conn.commit()
+
+    def evict(self) -> None:
+        """合計サイズが上限を下回るまで古いキャッシュを削除するメソッド
+
+        呼び出し元でロックを取得していることを前提とする.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM cache ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.evictions += 1
+
+    def report(self) -> str:
+        """キャッシュの利用状況を文字列で返却するメソッド
+
+        Args:
+            None
+
+        Returns:
+            ヒット数,ミス数,ヒット率および合計サイズ
+        """
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0.0
+        return (
+            f"cache: {self.hits} hits, {self.misses} misses "
+            f"(hit rate {hit_rate:.1%}), {self.evictions} evictions, "
+            f"{self.total_bytes / 1024 / 1024:.1f} MiB / "
+            f"{self.max_bytes / 1024 / 1024:.1f} MiB"
+        )
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> ResponseCache | None:
+    """プロセス内で共有するキャッシュを取得する関数
+
+    設定値はconfig.jsonに定義されている.
+    キャッシュが無効に設定されている場合は None を返却する.
+
+    Args:
+        None
+
+    Returns:
+        キャッシュ
+    """
+    config_cache = load_config()["cache"]
+    if not config_cache["enabled"]:
+        return None
+    return ResponseCache(
+        path=Path(config_cache["path"]),
+        max_bytes=config_cache["max_bytes"],
+    )
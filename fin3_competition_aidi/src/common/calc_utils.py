@@ -26,6 +26,120 @@ def cos_similarity(
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 
+class VectorIndex:
+    """類似度検索用のベクトル群をまとめたクラス
+
+    ベクトル群は正規化済みの float32 の行列として保持する.
+    内積のみでコサイン類似度を算出できるため,検索は行列演算1回で完了する.
+
+    Attributes:
+        keys: 各ベクトルのキー
+        matrix: 正規化済みのベクトル群(行がベクトル)
+    """
+
+    def __init__(
+            self,
+            keys: list[int | str],
+            vectors: list[list[float]] | np.ndarray,
+    ):
+        """イニシャライザ
+
+        Args:
+            keys: 各ベクトルのキー
+            vectors: 類似候補のベクトル群
+        """
+        self.keys = list(keys)
+        self.matrix = normalize_vectors(vectors)
+
+    @classmethod
+    def from_dict(
+            cls,
+            dict_vectors: dict[int | str, list[float]],
+    ) -> "VectorIndex":
+        """ディクショナリからインスタンスを作成するメソッド
+
+        Args:
+            dict_vectors: キーとベクトルのディクショナリ
+
+        Returns:
+            VectorIndex のインスタンス
+        """
+        return cls(list(dict_vectors.keys()), list(dict_vectors.values()))
+
+    def search(
+            self,
+            vector_origin: list[float] | np.ndarray,
+            top: int,
+    ) -> list[tuple[int | str, float]]:
+        """類似度検索し上位の結果を取得するメソッド
+
+        Args:
+            vector_origin: 検索対象ベクトル
+            top: 取得する検索結果の上位件数
+
+        Returns:
+            上位の検索結果(類似度の降順)
+        """
+        return self.search_batch([vector_origin], top)[0]
+
+    def search_batch(
+            self,
+            vectors_origin: list[list[float]] | np.ndarray,
+            top: int,
+    ) -> list[list[tuple[int | str, float]]]:
+        """複数ベクトルの類似度検索をまとめて実行し上位の結果を取得するメソッド
+
+        検索対象ベクトル群と類似候補のベクトル群の行列積で全ての類似度を算出する.
+        上位件数の抽出には全件のソートではなく argpartition を使用する.
+
+        Args:
+            vectors_origin: 検索対象ベクトル群
+            top: 取得する検索結果の上位件数
+
+        Returns:
+            検索対象ベクトルごとの上位の検索結果(類似度の降順)
+        """
+        queries = normalize_vectors(vectors_origin)
+        top = min(top, len(self.keys))
+        if top <= 0:  # 類似候補がない場合は行列積を実行しない
+            return [[] for _ in range(queries.shape[0])]
+        scores = queries @ self.matrix.T  # (検索対象数, 候補数)
+
+        # 上位件数のみを部分的に選択した後,選択した範囲のみソートする
+        indices = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+        top_scores = np.take_along_axis(scores, indices, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        results = []
+        for row_indices, row_scores in zip(indices, top_scores):
+            results.append(
+                [(self.keys[j], float(score))
+                 for j, score in zip(row_indices, row_scores)]
+            )
+        return results
+
+
+def normalize_vectors(
+        vectors: list[list[float]] | np.ndarray,
+) -> np.ndarray:
+    """ベクトル群をL2正規化する関数
+
+    ノルムが0のベクトルはそのまま返却する.
+
+    Args:
+        vectors: 正規化対象のベクトル群
+
+    Returns:
+        正規化済みのベクトル群(float32 の2次元配列)
+    """
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)
+
+
 def get_similar_vectors(
     vector_origin: list[float],
     dict_vectors: dict[int | str, float],
@@ -34,6 +148,7 @@ def get_similar_vectors(
     """類似度検索し上位の結果を取得する関数
 
     取得する件数を指定する.
+    同じ候補に対し繰り返し検索する場合は VectorIndex を使用すること.
 
     Args:
         vector_origin: 検索対象ベクトル
@@ -43,10 +158,4 @@ def get_similar_vectors(
     Returns:
         上位の検索結果
     """
-    list_similarities = []
-    for key, vector in dict_vectors.items():
-        score = cos_similarity(vector_origin, vector)
-        list_similarities.append((key, score))
-    list_similarities.sort(key=lambda x: x[1], reverse=True)  # 類似度スコアが高い順にソート
-
-    return list_similarities[0:top]
+    return VectorIndex.from_dict(dict_vectors).search(vector_origin, top)
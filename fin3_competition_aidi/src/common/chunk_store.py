@@ -0,0 +1,147 @@
+"""共通的なチャンクの格納の機能をまとめたモジュール
+
+チャンク分割結果のコンテンツおよびメタデータを1つのDBファイル(SQLite)にまとめて格納する.
+チャンクは (ドキュメントID, チャンクID) をキーとして1件ずつ取得できる.
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+from typing_extensions import Any, Iterable, Iterator
+
+
+class ChunkStore:
+    """チャンク分割結果を格納するクラス
+
+    複数プロセスから同じDBファイルに書き込むことを想定し,WALモードかつロック待ちを許容する.
+    複数スレッドからの利用を想定し,DBアクセスはロックで排他する.
+
+    Attributes:
+        path: DBファイルのパス
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            timeout: float = 60.0,
+    ):
+        """イニシャライザ
+
+        Args:
+            path: DBファイルのパス
+            timeout: 他プロセスの書き込み完了を待つ秒数
+        """
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(
+            self.path, timeout=timeout, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "doc_id TEXT NOT NULL, chunk_id INTEGER NOT NULL, "
+            "content TEXT NOT NULL, metadata TEXT NOT NULL, "
+            "PRIMARY KEY (doc_id, chunk_id))"
+        )
+        self.conn.commit()
+
+    def put_document(
+            self,
+            doc_id: str,
+            items: Iterable[tuple[int, dict[str, Any]]],
+    ) -> int:
+        """1ドキュメント分のチャンクを格納するメソッド
+
+        同じドキュメントIDの格納済チャンクは削除してから格納する(1トランザクション).
+
+        Args:
+            doc_id: ドキュメントID
+            items: チャンクIDおよびチャンク(content, metadata)の組
+
+        Returns:
+            格納したチャンク数
+        """
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            cursor = self.conn.executemany(
+                "INSERT INTO chunks (doc_id, chunk_id, content, metadata) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        doc_id,
+                        int(chunk_id),
+                        item["content"],
+                        json.dumps(item["metadata"], ensure_ascii=False),
+                    )
+                    for chunk_id, item in items
+                ),
+            )
+        return cursor.rowcount
+
+    def get(
+            self,
+            doc_id: str,
+            chunk_id: int,
+    ) -> dict[str, Any] | None:
+        """チャンクを1件取得するメソッド
+
+        Args:
+            doc_id: ドキュメントID
+            chunk_id: チャンクID
+
+        Returns:
+            チャンク(content, metadata)
+            格納されていない場合は None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content, metadata FROM chunks "
+                "WHERE doc_id = ? AND chunk_id = ?",
+                (doc_id, int(chunk_id)),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"metadata": json.loads(row[1]), "content": row[0]}
+
+    def iter_document(
+            self,
+            doc_id: str,
+    ) -> Iterator[tuple[int, dict[str, Any]]]:
+        """1ドキュメント分のチャンクをチャンクID順に取得するメソッド
+
+        Args:
+            doc_id: ドキュメントID
+
+        Returns:
+            チャンクIDおよびチャンク(content, metadata)の組
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT chunk_id, content, metadata FROM chunks "
+                "WHERE doc_id = ? ORDER BY chunk_id",
+                (doc_id,),
+            ).fetchall()
+        for chunk_id, content, metadata in rows:
+            yield chunk_id, {"metadata": json.loads(metadata), "content": content}
+
+    def doc_ids(self) -> list[str]:
+        """格納済のドキュメントIDを取得するメソッド
+
+        Args:
+            None
+
+        Returns:
+            ドキュメントID群
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT doc_id FROM chunks ORDER BY doc_id"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        """DBの接続を閉じるメソッド"""
+        with self.lock:
+            self.conn.close()
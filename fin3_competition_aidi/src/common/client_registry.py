@@ -0,0 +1,169 @@
+"""共通的なAPIクライアントの管理の機能をまとめたモジュール
+
+プロバイダーおよびエンドポイントごとに1つのクライアントをプロセス内で共有する.
+各クライアントはコネクションプール付きの HTTP クライアントを保持するため,
+クライアントを再利用することで呼び出しごとの TLS ハンドシェイクを省略できる.
+.env ファイルの読み込みもプロセス内で1度だけ行う.
+"""
+import os
+from functools import lru_cache
+
+import httpx
+from common.load_config import load_config
+from dotenv import load_dotenv
+from openai import AsyncAzureOpenAI, AsyncOpenAI, AzureOpenAI, OpenAI
+
+try:
+    import h2  # noqa: F401 HTTP/2 を利用する場合のみ必要
+except ImportError:
+    h2 = None
+
+config = load_config()
+CONFIG_HTTP_CLIENT = config["http_client"]
+
+
+@lru_cache(maxsize=None)
+def load_env() -> None:
+    """.env ファイルの内容を環境変数に読み込む関数
+
+    プロセス内で1度だけ読み込む.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    load_dotenv()
+
+
+def get_env(
+        key: str,
+) -> str | None:
+    """環境変数の値を取得する関数
+
+    初回の呼び出し時に .env ファイルを読み込む.
+
+    Args:
+        key: 環境変数名
+
+    Returns:
+        環境変数の値(未設定の場合は None)
+    """
+    load_env()
+    return os.getenv(key)
+
+
+def make_http_client_kwargs() -> dict:
+    """HTTP クライアントの共通の設定値を作成する関数
+
+    HTTP/2 は設定値が有効かつ h2 パッケージがインストールされている場合のみ使用する.
+
+    Args:
+        None
+
+    Returns:
+        httpx.Client および httpx.AsyncClient のキーワード引数
+    """
+    return {
+        "limits": httpx.Limits(
+            max_connections=CONFIG_HTTP_CLIENT["max_connections"],
+            max_keepalive_connections=CONFIG_HTTP_CLIENT["max_keepalive_connections"],
+            keepalive_expiry=CONFIG_HTTP_CLIENT["keepalive_expiry"],
+        ),
+        "timeout": httpx.Timeout(
+            CONFIG_HTTP_CLIENT["timeout"],
+            connect=CONFIG_HTTP_CLIENT["connect_timeout"],
+        ),
+        "http2": CONFIG_HTTP_CLIENT["http2"] and h2 is not None,
+    }
+
+
+@lru_cache(maxsize=None)
+def get_openai_client(
+        api_key: str | None = None,
+) -> OpenAI:
+    """OpenAI クライアントを取得する関数
+
+    APIキーごとに1つのクライアントを作成し再利用する.
+
+    Args:
+        api_key: APIキー(None の場合は環境変数 OPENAI_API_KEY)
+
+    Returns:
+        OpenAI クライアント
+    """
+    return OpenAI(
+        api_key=api_key or get_env("OPENAI_API_KEY"),
+        max_retries=0,  # リトライはレート制限側で行う
+        http_client=httpx.Client(**make_http_client_kwargs()),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_openai_client(
+        api_key: str | None = None,
+) -> AsyncOpenAI:
+    """OpenAI 非同期クライアントを取得する関数
+
+    APIキーごとに1つのクライアントを作成し再利用する.
+    コネクションはイベントループに紐づくため,1つのイベントループ内で使用する.
+
+    Args:
+        api_key: APIキー(None の場合は環境変数 OPENAI_API_KEY)
+
+    Returns:
+        OpenAI 非同期クライアント
+    """
+    return AsyncOpenAI(
+        api_key=api_key or get_env("OPENAI_API_KEY"),
+        max_retries=0,  # リトライはレート制限側で行う
+        http_client=httpx.AsyncClient(**make_http_client_kwargs()),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_azure_openai_client(
+        azure_endpoint: str | None = None,
+) -> AzureOpenAI:
+    """AOAIクライアントを取得する関数
+
+    エンドポイントごとに1つのクライアントを作成し再利用する.
+
+    Args:
+        azure_endpoint: エンドポイント(None の場合は環境変数 AOAI_ENDPOINT)
+
+    Returns:
+        AOAIクライアント
+    """
+    return AzureOpenAI(
+        api_key=get_env("AOAI_API_KEY"),
+        azure_endpoint=azure_endpoint or get_env("AOAI_ENDPOINT"),
+        api_version=get_env("AOAI_API_VERSION"),
+        max_retries=0,  # リトライはレート制限側で行う
+        http_client=httpx.Client(**make_http_client_kwargs()),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_azure_openai_client(
+        azure_endpoint: str | None = None,
+) -> AsyncAzureOpenAI:
+    """AOAI非同期クライアントを取得する関数
+
+    エンドポイントごとに1つのクライアントを作成し再利用する.
+    コネクションはイベントループに紐づくため,1つのイベントループ内で使用する.
+
+    Args:
+        azure_endpoint: エンドポイント(None の場合は環境変数 AOAI_ENDPOINT)
+
+    Returns:
+        AOAI非同期クライアント
+    """
+    return AsyncAzureOpenAI(
+        api_key=get_env("AOAI_API_KEY"),
+        azure_endpoint=azure_endpoint or get_env("AOAI_ENDPOINT"),
+        api_version=get_env("AOAI_API_VERSION"),
+        max_retries=0,  # リトライはレート制限側で行う
+        http_client=httpx.AsyncClient(**make_http_client_kwargs()),
+    )
@@ -0,0 +1,312 @@
+"""共通的な企業名の照合の機能をまとめたモジュール
+
+既知の企業名(ドキュメントごとの企業名)から別名の辞書と文字 n-gram の索引を事前に作成し,
+クエリの文字列から対象の企業をローカルで特定する.
+企業名の表記ゆれ(全角/半角,ひらがな/カタカナ,旧字体/新字体,法人格の有無など)は正規化により吸収する.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from typing_extensions import Any
+
+# 正規化時に除く法人格の表記
+LEGAL_FORMS = [
+    "株式会社", "有限会社", "合同会社", "合資会社", "合名会社",
+    "(株)", "(有)", "(同)", "co.,ltd.", "co.ltd.", "inc.", "corporation", "corp.",
+]
+
+# 別名の作成時に除く企業グループを表す接尾辞
+GROUP_SUFFIXES = ["ホールディングス", "グループ", "hd", "hldgs", "holdings", "group"]
+
+# 旧字体・異体字から新字体への対応
+KANJI_VARIANTS = str.maketrans({
+    "髙": "高", "﨑": "崎", "嵜": "崎", "邊": "辺", "邉": "辺", "齋": "斉", "齊": "斉",
+    "澤": "沢", "濱": "浜", "國": "国", "德": "徳", "櫻": "桜", "廣": "広", "會": "会",
+    "鐵": "鉄", "藝": "芸", "發": "発", "與": "与", "處": "処", "眞": "真", "惠": "恵",
+    "曾": "曽", "龍": "竜", "來": "来", "條": "条", "萬": "万", "寶": "宝", "豐": "豊",
+})
+
+# 長音符・ハイフンの表記ゆれ
+HYPHENS = re.compile(r"[\-‐‑‒–—―−ｰ]")
+
+# 照合時に無視する記号(空白,中黒,括弧など)
+IGNORED_CHARS = re.compile(r"[\s・･·「」『』\"'`、,。]")
+
+
+def katakana_to_hiragana(
+        text: str,
+) -> str:
+    """カタカナをひらがなに変換する関数
+
+    Args:
+        text: 変換対象のテキスト
+
+    Returns:
+        変換後のテキスト
+    """
+    return "".join(
+        chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c
+        for c in text
+    )
+
+
+def normalize_company_name(
+        text: str,
+) -> str:
+    """照合用に企業名(またはクエリ)を正規化する関数
+
+    NFKC 正規化,小文字化,旧字体の置換,長音符の統一,カタカナのひらがな化を行い,記号を除く.
+
+    Args:
+        text: 正規化対象のテキスト
+
+    Returns:
+        正規化後のテキスト
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = text.translate(KANJI_VARIANTS)
+    text = HYPHENS.sub("ー", text)
+    text = katakana_to_hiragana(text)
+    return IGNORED_CHARS.sub("", text)
+
+
+def remove_affixes(
+        name: str,
+        affixes: list[str],
+) -> str:
+    """正規化済の企業名から先頭または末尾の接辞を除く関数
+
+    Args:
+        name: 正規化済の企業名
+        affixes: 除く対象の接辞群(正規化前の表記)
+
+    Returns:
+        接辞を除いた企業名
+    """
+    for affix in affixes:
+        affix = normalize_company_name(affix)
+        if name.startswith(affix):
+            name = name[len(affix):]
+        if name.endswith(affix):
+            name = name[:-len(affix)]
+    return name
+
+
+def make_ngrams(
+        text: str,
+        n: int,
+) -> set[str]:
+    """文字 n-gram の集合を作成する関数
+
+    n 文字未満のテキストはテキスト全体を1つの n-gram とする.
+
+    Args:
+        text: 対象のテキスト
+        n: n-gram の文字数
+
+    Returns:
+        文字 n-gram の集合
+    """
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i+n] for i in range(len(text) - n + 1)}
+
+
+class CompanyResolver:
+    """クエリから対象の企業をローカルで特定するクラス
+
+    企業名ごとに正規化した別名(法人格やグループを表す接尾辞を除いたものを含む)を作成する.
+    クエリに別名がそのまま含まれる場合は最も長い別名の企業を特定結果とする.
+    含まれない場合は別名の先頭と末尾の文字 n-gram がともにクエリに含まれ(別名の一部ではなく全体にわたって一致し),
+    かつ一致率が閾値以上で2位の企業と十分な差がある場合のみ特定結果とする.
+    いずれにも該当しない(曖昧な)場合は特定結果なしとし,呼び出し元で LLM および埋め込みベクトルによる特定に切り替える.
+
+    Attributes:
+        names: ドキュメントIDごとの企業名
+        aliases: 正規化済の別名とドキュメントIDの組(別名の長い順)
+        ngram: n-gram の文字数
+        min_coverage: 特定結果とする別名の n-gram の一致率の下限
+        min_margin: 特定結果とする1位と2位の一致率の差の下限
+        index: n-gram から別名のインデックスへの転置索引
+    """
+
+    def __init__(
+            self,
+            names: dict[Any, str],
+            ngram: int = 2,
+            min_coverage: float = 0.8,
+            min_margin: float = 0.2,
+            min_alias_length: int = 2,
+    ):
+        """イニシャライザ
+
+        Args:
+            names: ドキュメントIDごとの企業名
+            ngram: n-gram の文字数
+            min_coverage: 特定結果とする別名の n-gram の一致率の下限
+            min_margin: 特定結果とする1位と2位の一致率の差の下限
+            min_alias_length: 別名とする最小の文字数(短すぎる別名による誤一致を防ぐ)
+        """
+        self.names = dict(names)
+        self.ngram = ngram
+        self.min_coverage = min_coverage
+        self.min_margin = min_margin
+
+        # 別名からドキュメントIDへの対応(複数の企業で共通する別名は曖昧なため除く)
+        alias_to_doc_ids = defaultdict(set)
+        for doc_id, name in self.names.items():
+            if (not name) or (name == "-"):
+                continue
+            for alias in self.make_aliases(name):
+                if len(alias) >= min_alias_length:
+                    alias_to_doc_ids[alias].add(doc_id)
+        self.aliases = sorted(
+            [
+                (alias, next(iter(doc_ids)))
+                for alias, doc_ids in alias_to_doc_ids.items()
+                if len(doc_ids) == 1
+            ],
+            key=lambda item: -len(item[0]),
+        )
+
+        self.alias_ngrams = [make_ngrams(alias, ngram) for alias, _ in self.aliases]
+        self.index = defaultdict(list)
+        for i, ngrams in enumerate(self.alias_ngrams):
+            for gram in ngrams:
+                self.index[gram].append(i)
+
+    @staticmethod
+    def make_aliases(
+            name: str,
+    ) -> set[str]:
+        """企業名から正規化済の別名を作成するメソッド
+
+        Args:
+            name: 企業名
+
+        Returns:
+            正規化済の別名群
+        """
+        normalized = normalize_company_name(name)
+        base = remove_affixes(normalized, LEGAL_FORMS)
+        core = remove_affixes(base, GROUP_SUFFIXES)
+        return {alias for alias in [normalized, base, core] if alias}
+
+    def resolve(
+            self,
+            text: str,
+    ) -> Any | None:
+        """テキストが対象とする企業のドキュメントIDを特定するメソッド
+
+        Args:
+            text: 企業名を含むことが想定されるテキスト(クエリ)
+
+        Returns:
+            ドキュメントID
+            特定できない(曖昧な)場合は None
+        """
+        normalized = normalize_company_name(text)
+
+        # 別名がそのまま含まれる場合は最も長い別名を採用する(別名は長い順)
+        matches = [
+            (alias, doc_id) for alias, doc_id in self.aliases
+            if alias in normalized
+        ]
+        if matches:
+            doc_ids = {doc_id for _, doc_id in matches}
+            if len(doc_ids) == 1:
+                return matches[0][1]
+            # 最長の別名が他の企業の別名を包含する場合のみ最長の別名を採用する
+            longest, doc_id_longest = matches[0]
+            if all(
+                alias in longest for alias, doc_id in matches
+                if doc_id != doc_id_longest
+            ):
+                return doc_id_longest
+            return None
+
+        # n-gram の一致率で企業ごとの最大値を算出する
+        ngrams = make_ngrams(normalized, self.ngram)
+        counts = defaultdict(int)
+        for gram in ngrams:
+            for i in self.index.get(gram, []):
+                counts[i] += 1
+        coverages = defaultdict(float)
+        for i, count in counts.items():
+            # 別名の一部(一般的な語など)のみの一致は除く
+            if not self.covers_alias(i, ngrams):
+                continue
+            doc_id = self.aliases[i][1]
+            coverages[doc_id] = max(
+                coverages[doc_id], count / len(self.alias_ngrams[i]))
+        if not coverages:
+            return None
+        ranking = sorted(coverages.items(), key=lambda item: -item[1])
+        doc_id_best, coverage_best = ranking[0]
+        coverage_second = ranking[1][1] if len(ranking) > 1 else 0.0
+        if (coverage_best >= self.min_coverage) and \
+                (coverage_best - coverage_second >= self.min_margin):
+            return doc_id_best
+        return None
+
+    def covers_alias(
+            self,
+            i: int,
+            ngrams: set[str],
+    ) -> bool:
+        """n-gram の一致が別名の全体にわたるかを判定するメソッド
+
+        別名の先頭と末尾の n-gram がともに含まれる場合に別名の全体にわたる一致とする.
+
+        Args:
+            i: 別名のインデックス
+            ngrams: クエリの n-gram の集合
+
+        Returns:
+            別名の全体にわたる一致の場合は True
+        """
+        alias = self.aliases[i][0]
+        if len(alias) <= self.ngram:
+            return alias in ngrams
+        return (alias[:self.ngram] in ngrams) and (alias[-self.ngram:] in ngrams)
+
+    def get_name(
+            self,
+            doc_id: Any,
+    ) -> str:
+        """ドキュメントIDに対応する企業名を取得するメソッド
+
+        Args:
+            doc_id: ドキュメントID
+
+        Returns:
+            企業名
+        """
+        return self.names[doc_id]
+
+    def get_surfaces(
+            self,
+            doc_id: Any,
+    ) -> list[str]:
+        """ドキュメントIDに対応する企業名の表記(法人格などを除いたものを含む)を取得するメソッド
+
+        クエリから企業名を除く際に使用するため,正規化は NFKC のみとする.
+
+        Args:
+            doc_id: ドキュメントID
+
+        Returns:
+            企業名の表記群(長い順)
+        """
+        name = unicodedata.normalize("NFKC", self.names[doc_id]).strip()
+        surfaces = [name]
+        for affixes in [LEGAL_FORMS, GROUP_SUFFIXES]:
+            for affix in affixes:
+                affix = unicodedata.normalize("NFKC", affix)
+                if name.lower().startswith(affix):
+                    name = name[len(affix):].strip()
+                if name.lower().endswith(affix):
+                    name = name[:-len(affix)].strip()
+            surfaces.append(name)
+        return sorted({surface for surface in surfaces if surface}, key=len, reverse=True)
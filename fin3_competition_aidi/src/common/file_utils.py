@@ -4,9 +4,51 @@
 """
 import csv
 import json
+import os
 from pathlib import Path
 
-from typing_extensions import Any
+from typing_extensions import Any, Iterable, Iterator
+
+try:
+    import orjson
+except ImportError:  # orjson がない環境では標準の json で代替する
+    orjson = None
+
+
+def dumps_json_line(
+        record: Any,
+) -> bytes:
+    """レコードをJSON Lines の1行(改行を含む)に変換する関数
+
+    orjson が利用可能な場合は orjson で変換する.
+
+    Args:
+        record: 変換対象のレコード
+
+    Returns:
+        UTF-8でエンコードした1行
+    """
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def loads_json_line(
+        line: bytes | str,
+) -> Any:
+    """JSON Lines の1行をレコードに変換する関数
+
+    orjson が利用可能な場合は orjson で変換する.
+
+    Args:
+        line: 変換対象の1行
+
+    Returns:
+        レコード
+    """
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
 
 
 def str_to_md_file(
@@ -54,21 +96,56 @@ def dict_to_json(
         dict_for_json: dict[Any, Any],
         path_file_json: Path,
         encoding: str = "utf-8",
+        indent: int | None = 4,
 ) -> None:
     """ディクショナリ型からJSONファイルに書き出す関数
 
     指定したパスに.jsonファイルを作成する.
+    インデントしない場合は, orjson が利用可能であれば orjson で変換する.
 
     Args:
         dict_for_json: .json書き出し対象のディクショナリ
         path_file_json: 作成する.jsonのパス
         encoding: 文字エンコード
+        indent: インデント幅(None の場合はインデントせずに書き出す)
 
     Returns:
         None
     """
     with open(path_file_json, "w", encoding=encoding) as f:
-        json.dump(dict_for_json, f, ensure_ascii=False, indent=4)
+        if indent is None and orjson is not None:
+            f.write(orjson.dumps(dict_for_json).decode("utf-8"))
+        else:
+            json.dump(dict_for_json, f, ensure_ascii=False, indent=indent)
+
+
+def items_to_json(
+        items: Iterator[tuple[Any, Any]],
+        path_file_json: Path,
+        encoding: str = "utf-8",
+) -> None:
+    """キーと値の組を逐次JSONファイルに書き出す関数
+
+    全ての要素をメモリに保持せずに,dict_to_json と同じ形式の.jsonファイルを作成する.
+
+    Args:
+        items: .json書き出し対象のキーと値の組
+        path_file_json: 作成する.jsonのパス
+        encoding: 文字エンコード
+
+    Returns:
+        None
+    """
+    with open(path_file_json, "w", encoding=encoding) as f:
+        f.write("{")
+        separator = "\n"
+        for key, value in items:
+            value_json = json.dumps(value, ensure_ascii=False, indent=4)
+            value_json = value_json.replace("\n", "\n    ")  # 1階層分インデントする
+            key_json = json.dumps(str(key), ensure_ascii=False)
+            f.write(f"{separator}    {key_json}: {value_json}")
+            separator = ",\n"
+        f.write("}" if separator == "\n" else "\n}")
 
 
 def json_to_dict(
@@ -134,3 +211,149 @@ def list_to_csv(
     with open(path_file_csv, "w", encoding=encoding, newline="") as f:
         writer = csv.writer(f)
         writer.writerows(list_for_csv)
+
+
+def iter_jsonl(
+        path_file_jsonl: Path,
+) -> Iterator[Any]:
+    """JSON Lines ファイルを1行ずつ読み込む関数
+
+    ファイル全体をメモリに読み込まずにレコードを1件ずつ返却する.
+    orjson が利用可能な場合は orjson で変換する.
+
+    Args:
+        path_file_jsonl: 読み込み対象の.jsonlのパス(UTF-8)
+
+    Returns:
+        各行のレコード
+    """
+    with open(path_file_jsonl, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads_json_line(line)
+
+
+def records_to_jsonl(
+        records: Iterable[Any],
+        path_file_jsonl: Path,
+) -> int:
+    """レコードを逐次 JSON Lines ファイルに書き出す関数
+
+    全てのレコードをメモリに保持せずに1件ずつ書き出す.
+
+    Args:
+        records: 書き出し対象のレコード
+        path_file_jsonl: 作成する.jsonlのパス(UTF-8)
+
+    Returns:
+        書き出したレコード数
+    """
+    count = 0
+    with open(path_file_jsonl, "wb") as f:
+        for record in records:
+            f.write(dumps_json_line(record))
+            count += 1
+    return count
+
+
+def append_jsonl(
+        records: list[Any],
+        path_file_jsonl: Path,
+) -> None:
+    """JSON Lines ファイルにレコードを追記する関数
+
+    追記後はディスクへの書き込みまで完了させるため,異常終了時も追記済のレコードは失われない.
+
+    Args:
+        records: 追記対象のレコード群
+        path_file_jsonl: 追記先の.jsonlのパス(UTF-8)
+
+    Returns:
+        None
+    """
+    lines = b"".join(dumps_json_line(record) for record in records)
+    with open(path_file_jsonl, "ab") as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def repair_jsonl(
+        path_file_jsonl: Path,
+        block_size: int = 1024 * 1024,
+) -> None:
+    """JSON Lines ファイル末尾の書き込み途中の行を取り除く関数
+
+    追記中の異常終了により改行で終わっていない行がある場合,その行を切り捨てる.
+    大きなファイルでもメモリを消費しないよう,末尾からブロック単位で最後の改行を探す.
+
+    Args:
+        path_file_jsonl: 対象の.jsonlのパス
+        block_size: 1回に読み込むバイト数
+
+    Returns:
+        None
+    """
+    with open(path_file_jsonl, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(position - block_size, 0)
+            f.seek(start)
+            block = f.read(position - start)
+            index = block.rfind(b"\n")
+            if index >= 0:
+                position = start + index + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+
+
+def items_to_file(
+        items: Iterable[tuple[Any, Any]],
+        path_file: Path,
+        key_name: str,
+) -> None:
+    """キーと値の組を拡張子に応じた形式で逐次書き出す関数
+
+    .jsonl の場合は1組を1行({key_name: キー, **値})として書き出す.
+    それ以外の場合は items_to_json と同じ形式で書き出す.
+
+    Args:
+        items: 書き出し対象のキーと値(ディクショナリ)の組
+        path_file: 作成するファイルのパス
+        key_name: .jsonl の各行にキーを格納する項目名
+
+    Returns:
+        None
+    """
+    if Path(path_file).suffix == ".jsonl":
+        records_to_jsonl(
+            ({key_name: key, **value} for key, value in items), path_file)
+    else:
+        items_to_json(items, path_file)
+
+
+def iter_items(
+        path_file: Path,
+        key_name: str,
+) -> Iterator[tuple[str, Any]]:
+    """拡張子に応じた形式のファイルからキーと値の組を逐次読み込む関数
+
+    .jsonl の場合は1行ずつ読み込むため,ファイル全体をメモリに保持しない.
+    それ以外の場合は json_to_dict で読み込む.
+
+    Args:
+        path_file: 読み込み対象のファイルのパス
+        key_name: .jsonl の各行にキーが格納されている項目名
+
+    Returns:
+        キー(文字列)と値の組
+    """
+    if Path(path_file).suffix == ".jsonl":
+        for record in iter_jsonl(path_file):
+            key = record.pop(key_name)
+            yield str(key), record
+    else:
+        yield from json_to_dict(path_file).items()
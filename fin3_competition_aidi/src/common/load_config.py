@@ -52,3 +52,19 @@ def get_output_dir() -> Path:
     """
     config = load_config()
     return Path(config["directories"]["output"])
+
+
+def get_artifact_suffix() -> str:
+    """中間ファイル(チャンク分割結果,埋め込みベクトルの結果)の拡張子を取得する関数
+
+    設定値はconfig.jsonに定義されている
+    jsonl の場合は1チャンクを1行とするため,1チャンクずつ読み書きできる
+
+    Args:
+        None
+
+    Returns:
+        中間ファイルの拡張子(.json または .jsonl)
+    """
+    config = load_config()
+    return f".{config['artifacts']['format']}"
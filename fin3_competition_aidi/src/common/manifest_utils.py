@@ -0,0 +1,147 @@
+"""共通的なマニフェスト操作の機能をまとめたモジュール
+
+パイプラインの各ステージで処理済の単位(ドキュメント)ごとに,入力・設定・出力のハッシュ値を記録する.
+記録内容と現在の内容を比較し,変更があった単位のみ再処理する判定に使用する.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from typing_extensions import Any
+
+
+def file_sha256(
+        path_file: Path,
+        block_size: int = 1024 * 1024,
+) -> str:
+    """ファイル内容のハッシュ値を算出する関数
+
+    大きなファイルでもメモリを消費しないようブロック単位で読み込む.
+
+    Args:
+        path_file: 対象ファイルのパス
+        block_size: 1回に読み込むバイト数
+
+    Returns:
+        SHA-256 のハッシュ値
+    """
+    sha256 = hashlib.sha256()
+    with open(path_file, "rb") as f:
+        while block := f.read(block_size):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def dict_sha256(
+        dict_for_hash: dict[str, Any],
+) -> str:
+    """ディクショナリ内容のハッシュ値を算出する関数
+
+    キーの順序によらず同じ内容であれば同じハッシュ値となる.
+
+    Args:
+        dict_for_hash: 対象のディクショナリ
+
+    Returns:
+        SHA-256 のハッシュ値
+    """
+    payload = json.dumps(dict_for_hash, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StageManifest:
+    """パイプラインの1ステージの処理状況を記録するクラス
+
+    単位ごとの処理完了時に即時にファイルへ保存するため,異常終了後も完了済の単位から再開できる.
+
+    Attributes:
+        path_file_manifest: マニフェストファイルのパス
+        units: 単位ごとの入力・設定・出力のハッシュ値
+    """
+
+    def __init__(
+            self,
+            path_file_manifest: Path,
+    ):
+        """イニシャライザ
+
+        Args:
+            path_file_manifest: マニフェストファイルのパス
+        """
+        self.path_file_manifest = Path(path_file_manifest)
+        self.units = {}
+        if self.path_file_manifest.exists():
+            with open(self.path_file_manifest, "r", encoding="utf-8") as f:
+                self.units = json.load(f)["units"]
+
+    def is_up_to_date(
+            self,
+            unit: str,
+            inputs: list[Path],
+            config_hash: str,
+            outputs: list[Path],
+    ) -> bool:
+        """単位が処理済かつ入力・設定・出力に変更がないかを判定するメソッド
+
+        Args:
+            unit: 処理単位のキー
+            inputs: 入力ファイルのパス群
+            config_hash: 処理に影響する設定値のハッシュ値
+            outputs: 出力ファイルのパス群
+
+        Returns:
+            再処理が不要な場合は True
+        """
+        record = self.units.get(unit)
+        if record is None or record["config"] != config_hash:
+            return False
+        for path in inputs:
+            if (not path.exists()) or (record["inputs"].get(path.name) != file_sha256(path)):
+                return False
+        for path in outputs:
+            if (not path.exists()) or (record["outputs"].get(path.name) != file_sha256(path)):
+                return False
+        return True
+
+    def record(
+            self,
+            unit: str,
+            inputs: list[Path],
+            config_hash: str,
+            outputs: list[Path],
+    ) -> None:
+        """単位の処理完了を記録しマニフェストファイルに保存するメソッド
+
+        Args:
+            unit: 処理単位のキー
+            inputs: 入力ファイルのパス群
+            config_hash: 処理に影響する設定値のハッシュ値
+            outputs: 出力ファイルのパス群
+
+        Returns:
+            None
+        """
+        self.units[unit] = {
+            "inputs": {path.name: file_sha256(path) for path in inputs},
+            "config": config_hash,
+            "outputs": {path.name: file_sha256(path) for path in outputs},
+        }
+        self.save()
+
+    def save(self) -> None:
+        """マニフェストファイルを保存するメソッド
+
+        書き込み途中で異常終了してもファイルが壊れないよう,一時ファイルに書き込んでから置き換える.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.path_file_manifest.parent.mkdir(parents=True, exist_ok=True)
+        path_tmp = self.path_file_manifest.with_suffix(".tmp")
+        with open(path_tmp, "w", encoding="utf-8") as f:
+            json.dump({"units": self.units}, f, ensure_ascii=False, indent=4)
+        os.replace(path_tmp, self.path_file_manifest)
@@ -0,0 +1,511 @@
+"""共通的なLLMモデルのAPI実行の要求内容の作成の機能をまとめたモジュール
+
+API実行の引数,キャッシュの参照および応答の解析・キャッシュへの保存を1つの要求(ModelRequest)にまとめる.
+同期処理と非同期処理で異なるのは API の実行(rate_limiter.call / call_async)のみとし,
+要求内容の作成と応答の処理はプロバイダー(OpenAI / AOAI)および同期・非同期によらず本モジュールの処理を使用する.
+"""
+import json
+import time
+from contextlib import aclosing, closing
+
+from common.cache_utils import make_cache_key
+from common.stream_utils import aiter_stream_text, iter_stream_text, update_stats
+from typing_extensions import Any, AsyncIterator, Callable, Iterator
+
+
+class StructuredOutputError(ValueError):
+    """JSONスキーマに沿った応答を取得できなかった場合の例外
+
+    出力トークン数の上限による打ち切り,応答の拒否,空の応答または不正なJSONの場合に送出する.
+    """
+
+
+class ModelRequest:
+    """LLMモデルの1回のAPI実行の要求内容をまとめたクラス
+
+    Attributes:
+        kwargs: rate_limiter.call (call_async) に渡すキーワード引数(tokens を含む)
+        parse: API の応答から結果を取り出す関数
+        cached: キャッシュ済の結果(存在しない場合は None)
+        store: 結果をキャッシュに保存する関数(キャッシュしない場合は None)
+    """
+
+    def __init__(
+            self,
+            kwargs: dict[str, Any],
+            parse: Callable[[Any], Any],
+            cached: Any | None = None,
+            store: Callable[[Any], None] | None = None,
+    ):
+        """イニシャライザ
+
+        Args:
+            kwargs: rate_limiter.call (call_async) に渡すキーワード引数(tokens を含む)
+            parse: API の応答から結果を取り出す関数
+            cached: キャッシュ済の結果(存在しない場合は None)
+            store: 結果をキャッシュに保存する関数(キャッシュしない場合は None)
+        """
+        self.kwargs = kwargs
+        self.parse = parse
+        self.cached = cached
+        self.store = store
+
+    @classmethod
+    def with_cache(
+            cls,
+            kwargs: dict[str, Any],
+            parse: Callable[[Any], Any],
+            cache: Any | None,
+            cache_key: str | None,
+    ) -> "ModelRequest":
+        """キャッシュのキーに対応するキャッシュの参照および保存を設定した要求を作成するメソッド
+
+        Args:
+            kwargs: rate_limiter.call (call_async) に渡すキーワード引数(tokens を含む)
+            parse: API の応答から結果を取り出す関数
+            cache: 応答のキャッシュ(無効の場合は None)
+            cache_key: キャッシュのキー(キャッシュしない場合は None)
+
+        Returns:
+            API実行の要求内容
+        """
+        if (cache is None) or (cache_key is None):
+            return cls(kwargs, parse)
+        return cls(
+            kwargs,
+            parse,
+            cached=cache.get(cache_key),
+            store=lambda result: cache.set(cache_key, result),
+        )
+
+    def finish(
+            self,
+            response: Any,
+    ) -> Any:
+        """API の応答から結果を取り出し,キャッシュに保存するメソッド
+
+        Args:
+            response: API の応答
+
+        Returns:
+            応答から取り出した結果
+        """
+        result = self.parse(response)
+        if (self.store is not None) and (result is not None):
+            self.store(result)
+        return result
+
+
+def parse_text(
+        response: Any,
+) -> str | None:
+    """Chatモデルの応答からテキストを取り出す関数
+
+    Args:
+        response: Chatモデルの応答
+
+    Returns:
+        応答テキスト
+    """
+    return response.choices[0].message.content
+
+
+def parse_json(
+        response: Any,
+) -> dict[str, Any]:
+    """Chatモデルの応答からJSONスキーマに沿ったディクショナリを取り出す関数
+
+    応答が打ち切られた(finish_reason が length),拒否された,または空の場合は
+    StructuredOutputError を送出する(キャッシュには保存されない).
+
+    Args:
+        response: Chatモデルの応答
+
+    Returns:
+        応答(JSONスキーマに沿ったディクショナリ)
+    """
+    choice = response.choices[0]
+    refusal = getattr(choice.message, "refusal", None)
+    if refusal:
+        raise StructuredOutputError(f"refused: {refusal}")
+    if choice.finish_reason == "length":
+        raise StructuredOutputError("truncated by max_tokens")
+    if choice.message.content is None:
+        raise StructuredOutputError(
+            f"empty content (finish_reason: {choice.finish_reason})")
+    try:
+        return json.loads(choice.message.content)
+    except json.JSONDecodeError as e:
+        raise StructuredOutputError(f"invalid JSON: {e}") from e
+
+
+class ChatRequestMixin:
+    """Chatモデルの要求内容を作成する機能をまとめたクラス
+
+    継承先のクラスは provider, client, cache, rate_limiter, dep_id_chat_comp および system_content を持つ.
+    """
+
+    provider = ""
+
+    def make_chat_request(
+            self,
+            kind: str,
+            user_content: str,
+            max_tokens: int,
+            temperature: float,
+            system_content: str | None,
+            parse: Callable[[Any], Any],
+            cache_params: dict[str, Any] | None = None,
+            **params: Any,
+    ) -> ModelRequest:
+        """Chatモデルの要求内容を作成するメソッド
+
+        temperature が 0 の場合のみ応答のキャッシュを利用する.
+
+        Args:
+            kind: キャッシュの種別
+            user_content: ユーザープロンプト
+            max_tokens: Chatモデル出力トークン数の上限値
+            temperature: Chatモデル応答のランダム性(創造性)
+            system_content: システムプロンプト(None の場合は既定値)
+            parse: API の応答から結果を取り出す関数
+            cache_params: キャッシュのキーに含める追加のパラメータ
+            params: API に渡す追加の引数
+
+        Returns:
+            API実行の要求内容
+        """
+        if system_content is None:
+            system_content = self.system_content
+
+        cache_key = None
+        if temperature == 0:
+            # 応答が決定的な場合のみキャッシュを利用する
+            cache_key = make_cache_key(
+                kind,
+                f"{self.provider}:{self.dep_id_chat_comp}",
+                {
+                    "system_content": system_content,
+                    "max_tokens": max_tokens,
+                    **(cache_params or {}),
+                },
+                user_content,
+            )
+
+        kwargs = {
+            # 出力トークン数もトークン数/分の消費として扱われる(上限値ではなく見積りで予約する)
+            "tokens": self.rate_limiter.count_tokens(system_content, user_content)
+            + self.rate_limiter.estimate_completion_tokens(max_tokens),
+            "model": self.dep_id_chat_comp,
+            "messages": [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": user_content},
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            **params,
+        }
+        return ModelRequest.with_cache(kwargs, parse, self.cache, cache_key)
+
+    def make_text_request(
+            self,
+            user_content: str,
+            max_tokens: int,
+            temperature: float,
+            system_content: str | None,
+    ) -> ModelRequest:
+        """応答テキストを取得する要求内容を作成するメソッド
+
+        Args:
+            user_content: ユーザープロンプト
+            max_tokens: Chatモデル出力トークン数の上限値
+            temperature: Chatモデル応答のランダム性(創造性)
+            system_content: システムプロンプト(None の場合は既定値)
+
+        Returns:
+            API実行の要求内容
+        """
+        return self.make_chat_request(
+            "chat", user_content, max_tokens, temperature, system_content,
+            parse_text,
+        )
+
+    def make_stream_request(
+            self,
+            user_content: str,
+            max_tokens: int,
+            temperature: float,
+            system_content: str | None,
+            stop: list[str] | None,
+    ) -> ModelRequest:
+        """応答テキストをストリーミングで取得する要求内容を作成するメソッド
+
+        finish には API の応答ではなく,受信した応答テキスト全体を渡す.
+
+        Args:
+            user_content: ユーザープロンプト
+            max_tokens: Chatモデル出力トークン数の上限値
+            temperature: Chatモデル応答のランダム性(創造性)
+            system_content: システムプロンプト(None の場合は既定値)
+            stop: 生成を停止する文字列群(API側で判定する)
+
+        Returns:
+            API実行の要求内容
+        """
+        return self.make_chat_request(
+            "chat_stream", user_content, max_tokens, temperature, system_content,
+            lambda text: text,
+            cache_params={"stop": stop},
+            stop=stop,
+            stream=True,
+        )
+
+    def make_json_request(
+            self,
+            user_content: str,
+            json_schema: dict[str, Any],
+            max_tokens: int,
+            temperature: float,
+            system_content: str | None,
+    ) -> ModelRequest:
+        """JSONスキーマに沿った応答を取得する要求内容を作成するメソッド
+
+        Args:
+            user_content: ユーザープロンプト
+            json_schema: 応答のJSONスキーマ(name および schema を含む)
+            max_tokens: Chatモデル出力トークン数の上限値
+            temperature: Chatモデル応答のランダム性(創造性)
+            system_content: システムプロンプト(None の場合は既定値)
+
+        Returns:
+            API実行の要求内容
+        """
+        return self.make_chat_request(
+            "chat_json", user_content, max_tokens, temperature, system_content,
+            parse_json,
+            cache_params={"json_schema": json_schema},
+            response_format={
+                "type": "json_schema",
+                "json_schema": {**json_schema, "strict": True},
+            },
+        )
+
+
+class ChatModelMixin(ChatRequestMixin):
+    """Chatモデルの API を実行する機能をまとめたクラス"""
+
+    def get_response_only_text(
+            self,
+            user_content: str,
+            max_tokens: int = 4000,
+            temperature: float = 0.2,
+            system_content: str | None = None,
+    ) -> str:
+        """ChatモデルのAPIを実行し応答を取得するメソッド
+
+        インプットはテキストのみを想定する.
+        Chat履歴をリセットしてAPIを実行する.
+        temperature が 0 の場合は応答のキャッシュを利用する.
+
+        Args:
+            user_content: ユーザープロンプト
+            max_tokens: Chatモデル出力トークン数の上限値
+            temperature: Chatモデル応答のランダム性(創造性)
+            system_content: システムプロンプト(None の場合は既定値)
+
+        Returns:
+            Chatモデルが生成した応答テキスト
+        """
+        request = self.make_text_request(
+            user_content, max_tokens, temperature, system_content)
+        if request.cached is not None:
+            return request.cached
+        return request.finish(self.rate_limiter.call(
+            self.client.chat.completions.create, **request.kwargs))
+
+    def get_response_only_text_stream(
+            self,
+            user_content: str,
+            max_tokens: int = 4000,
+            temperature: float = 0.2,
+            system_content: str | None = None,
+            stop: list[str] | None = None,
+            stop_condition: Callable[[str], bool] | None = None,
+            stats: dict[str, Any] | None = None,
+    ) -> Iterator[str]:
+        """ChatモデルのAPIをストリーミングで実行し応答を逐次取得するメソッド
+
+        インプットはテキストのみを想定する.
+        max_tokens を出力トークン数の予算とし, stop_condition が累積テキストに対して真となった時点で生成を中断する.
+        stats を指定した場合は ttft(秒), elapsed(秒), chunks, stopped を記録する.
+        temperature が 0 の場合は応答のキャッシュを利用する(中断した応答はキャッシュしない).
+
+        Args:
+            user_content: ユーザープロンプト
+            max_tokens: Chatモデル出力トークン数の上限値
+            temperature: Chatモデル応答のランダム性(創造性)
+            system_content: システムプロンプト(None の場合は既定値)
+            stop: 生成を停止する文字列群(API側で判定する)
+            stop_condition: 累積テキストを受け取り,生成を中断する場合に真を返す関数
+            stats: 計測結果の格納先
+
+        Returns:
+            Chatモデルが生成した応答テキストの差分
+        """
+        if stats is None:
+            stats = {}
+        time_start = time.perf_counter()
+        request = self.make_stream_request(
+            user_content, max_tokens, temperature, system_content, stop)
+        if request.cached is not None:
+            stats["ttft"] = time.perf_counter() - time_start
+            yield request.cached
+            update_stats(stats, time_start, 0, False)
+            return
+
+        stream = self.rate_limiter.call(
+            self.client.chat.completions.create, **request.kwargs)
+        response = ""
+        with closing(iter_stream_text(
+                stream, time_start, stop_condition, stats)) as deltas:
+            for delta in deltas:
+                response += delta
+                yield delta
+        if not stats["stopped"]:
+            request.finish(response)
+
+    def get_response_json(
+            self,
+            user_content: str,
+            json_schema: dict[str, Any],
+            max_tokens: int = 4000,
+            temperature: float = 0.2,
+            system_content: str | None = None,
+    ) -> dict[str, Any]:
+        """ChatモデルのAPIを実行しJSONスキーマに沿った応答を取得するメソッド
+
+        Structured Outputs により応答は json_schema の形式に従う.
+        temperature が 0 の場合は応答のキャッシュを利用する.
+        JSONスキーマに沿った応答を取得できない場合は StructuredOutputError を送出する.
+
+        Args:
+            user_content: ユーザープロンプト
+            json_schema: 応答のJSONスキーマ(name および schema を含む)
+            max_tokens: Chatモデル出力トークン数の上限値
+            temperature: Chatモデル応答のランダム性(創造性)
+            system_content: システムプロンプト(None の場合は既定値)
+
+        Returns:
+            Chatモデルが生成した応答(JSONスキーマに沿ったディクショナリ)
+        """
+        request = self.make_json_request(
+            user_content, json_schema, max_tokens, temperature, system_content)
+        if request.cached is not None:
+            return request.cached
+        return request.finish(self.rate_limiter.call(
+            self.client.chat.completions.create, **request.kwargs))
+
+
+class AsyncChatModelMixin(ChatRequestMixin):
+    """Chatモデルの API を非同期で実行する機能をまとめたクラス
+
+    処理内容は ChatModelMixin と同一である.
+    """
+
+    async def get_response_only_text(
+            self,
+            user_content: str,
+            max_tokens: int = 4000,
+            temperature: float = 0.2,
+            system_content: str | None = None,
+    ) -> str:
+        """ChatモデルのAPIを非同期で実行し応答を取得するメソッド
+
+        Args:
+            user_content: ユーザープロンプト
+            max_tokens: Chatモデル出力トークン数の上限値
+            temperature: Chatモデル応答のランダム性(創造性)
+            system_content: システムプロンプト(None の場合は既定値)
+
+        Returns:
+            Chatモデルが生成した応答テキスト
+        """
+        request = self.make_text_request(
+            user_content, max_tokens, temperature, system_content)
+        if request.cached is not None:
+            return request.cached
+        return request.finish(await self.rate_limiter.call_async(
+            self.client.chat.completions.create, **request.kwargs))
+
+    async def get_response_only_text_stream(
+            self,
+            user_content: str,
+            max_tokens: int = 4000,
+            temperature: float = 0.2,
+            system_content: str | None = None,
+            stop: list[str] | None = None,
+            stop_condition: Callable[[str], bool] | None = None,
+            stats: dict[str, Any] | None = None,
+    ) -> AsyncIterator[str]:
+        """ChatモデルのAPIを非同期のストリーミングで実行し応答を逐次取得するメソッド
+
+        Args:
+            user_content: ユーザープロンプト
+            max_tokens: Chatモデル出力トークン数の上限値
+            temperature: Chatモデル応答のランダム性(創造性)
+            system_content: システムプロンプト(None の場合は既定値)
+            stop: 生成を停止する文字列群(API側で判定する)
+            stop_condition: 累積テキストを受け取り,生成を中断する場合に真を返す関数
+            stats: 計測結果の格納先
+
+        Returns:
+            Chatモデルが生成した応答テキストの差分
+        """
+        if stats is None:
+            stats = {}
+        time_start = time.perf_counter()
+        request = self.make_stream_request(
+            user_content, max_tokens, temperature, system_content, stop)
+        if request.cached is not None:
+            stats["ttft"] = time.perf_counter() - time_start
+            yield request.cached
+            update_stats(stats, time_start, 0, False)
+            return
+
+        stream = await self.rate_limiter.call_async(
+            self.client.chat.completions.create, **request.kwargs)
+        response = ""
+        async with aclosing(aiter_stream_text(
+                stream, time_start, stop_condition, stats)) as deltas:
+            async for delta in deltas:
+                response += delta
+                yield delta
+        if not stats["stopped"]:
+            request.finish(response)
+
+    async def get_response_json(
+            self,
+            user_content: str,
+            json_schema: dict[str, Any],
+            max_tokens: int = 4000,
+            temperature: float = 0.2,
+            system_content: str | None = None,
+    ) -> dict[str, Any]:
+        """ChatモデルのAPIを非同期で実行しJSONスキーマに沿った応答を取得するメソッド
+
+        Args:
+            user_content: ユーザープロンプト
+            json_schema: 応答のJSONスキーマ(name および schema を含む)
+            max_tokens: Chatモデル出力トークン数の上限値
+            temperature: Chatモデル応答のランダム性(創造性)
+            system_content: システムプロンプト(None の場合は既定値)
+
+        Returns:
+            Chatモデルが生成した応答(JSONスキーマに沿ったディクショナリ)
+        """
+        request = self.make_json_request(
+            user_content, json_schema, max_tokens, temperature, system_content)
+        if request.cached is not None:
+            return request.cached
+        return request.finish(await self.rate_limiter.call_async(
+            self.client.chat.completions.create, **request.kwargs))
@@ -0,0 +1,373 @@
+"""共通的なAPI実行のレート制限およびリトライの機能をまとめたモジュール
+
+プロバイダー(およびモデル種別)ごとに1つのレート制限をプロセス内で共有する.
+リクエスト数/分およびトークン数/分の上限をトークンバケットで管理し,上限に達する前にAPI実行を待機させる.
+レート制限(429)やサーバーエラーで失敗した場合は,Retry-After ヘッダーを尊重しつつジッター付きの指数バックオフでリトライする.
+429を受けた場合は同じレート制限を共有する全ての呼び出しを待機させる.
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+
+from common.load_config import load_config
+from common.string_utils import count_tokens_many
+from typing_extensions import Any, Awaitable, Callable
+
+
+class TokenBucket:
+    """1分あたりの上限をもとに消費量を管理するトークンバケットのクラス
+
+    消費量は即時に予約し,不足分が補充されるまでの待機秒数を返却する.
+    待機自体は呼び出し元で行うため,同期処理および非同期処理の両方から利用できる.
+
+    Attributes:
+        capacity: 1分あたりの上限(バケットの容量)
+        rate: 1秒あたりの補充量
+        level: 現在の残量(予約により負の値となる)
+        updated_at: 残量を最後に更新した時刻
+        lock: 残量の更新を排他するロック
+    """
+
+    def __init__(
+            self,
+            capacity: int,
+    ):
+        """イニシャライザ
+
+        Args:
+            capacity: 1分あたりの上限
+        """
+        self.capacity = capacity
+        self.rate = capacity / 60
+        self.level = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(
+            self,
+            amount: int,
+    ) -> float:
+        """消費量を予約し,実行可能になるまでの待機秒数を取得するメソッド
+
+        容量を超える消費量は容量として扱う(バケットが満タンになれば実行できる).
+
+        Args:
+            amount: 消費量
+
+        Returns:
+            待機秒数
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(
+                self.capacity,
+                self.level + (now - self.updated_at) * self.rate,
+            )
+            self.updated_at = now
+            self.level -= min(amount, self.capacity)
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.rate
+
+
+def get_status_code(
+        error: Exception,
+) -> int | None:
+    """例外からHTTPステータスコードを取得する関数
+
+    openai の APIStatusError および azure-core の HttpResponseError に対応する.
+
+    Args:
+        error: API実行時の例外
+
+    Returns:
+        HTTPステータスコード(取得できない場合は None)
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+    return status_code
+
+
+def get_retry_after(
+        error: Exception,
+) -> float | None:
+    """例外のレスポンスヘッダーから再実行までの待機秒数を取得する関数
+
+    retry-after-ms (ミリ秒) を優先し,なければ retry-after (秒または HTTP-date) を参照する.
+
+    Args:
+        error: API実行時の例外
+
+    Returns:
+        待機秒数(ヘッダーがない場合は None)
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value) * scale
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None  # 解釈できない値はバックオフに任せる
+        if retry_at.tzinfo is None:  # HTTP-date は GMT で表される
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, retry_at.timestamp() - time.time())
+    return None
+
+
+class RateLimiter:
+    """API実行のレート制限およびリトライを行うクラス
+
+    Attributes:
+        requests_bucket: リクエスト数/分のバケット(上限なしの場合は None)
+        tokens_bucket: トークン数/分のバケット(上限なしの場合は None)
+        model_name: トークン数の見積りに使用するモデル名
+        completion_tokens_ratio: 出力トークン数の上限に対する出力トークン数の見積りの比率
+        max_retries: 最大リトライ回数
+        backoff_base: バックオフの初期秒数
+        backoff_max: バックオフの最大秒数
+        retry_on: ステータスコードによらずリトライする例外の型
+        resume_at: 429を受けて全体の実行を再開する時刻
+        lock: resume_at の更新を排他するロック
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: int | None = None,
+            tokens_per_minute: int | None = None,
+            model_name: str | None = None,
+            completion_tokens_ratio: float = 1.0,
+            max_retries: int = 6,
+            backoff_base: float = 1.0,
+            backoff_max: float = 60.0,
+            retry_on: tuple[type[Exception], ...] = (),
+    ):
+        """イニシャライザ
+
+        Args:
+            requests_per_minute: リクエスト数/分の上限
+            tokens_per_minute: トークン数/分の上限
+            model_name: トークン数の見積りに使用するモデル名
+            completion_tokens_ratio: 出力トークン数の上限に対する出力トークン数の見積りの比率
+            max_retries: 最大リトライ回数
+            backoff_base: バックオフの初期秒数
+            backoff_max: バックオフの最大秒数
+            retry_on: ステータスコードによらずリトライする例外の型(接続エラーなど)
+        """
+        self.requests_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens_bucket = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        )
+        self.model_name = model_name
+        self.completion_tokens_ratio = completion_tokens_ratio
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_on = retry_on
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def count_tokens(
+            self,
+            *texts: str,
+    ) -> int:
+        """API実行で消費するトークン数を見積もるメソッド
+
+        トークン数/分の上限がない場合はカウントを省略して0を返却する.
+
+        Args:
+            texts: 入力テキスト群
+
+        Returns:
+            トークン数
+        """
+        if self.tokens_bucket is None:
+            return 0
+        return sum(count_tokens_many(list(texts), self.model_name))
+
+    def estimate_completion_tokens(
+            self,
+            max_tokens: int,
+    ) -> int:
+        """API実行で消費する出力トークン数を見積もるメソッド
+
+        出力は上限に達しないことが多いため,上限値に比率を掛けた値を見積りとする.
+        見積りを超えた分は429を受けた場合のリトライで吸収する.
+
+        Args:
+            max_tokens: 出力トークン数の上限値
+
+        Returns:
+            出力トークン数の見積り
+        """
+        return math.ceil(max_tokens * self.completion_tokens_ratio)
+
+    def reserve(
+            self,
+            tokens: int = 0,
+    ) -> float:
+        """1リクエスト分の実行枠を予約し,実行可能になるまでの待機秒数を取得するメソッド
+
+        Args:
+            tokens: リクエストで消費するトークン数の見積り
+
+        Returns:
+            待機秒数
+        """
+        with self.lock:
+            resume_at = self.resume_at
+        wait = max(0.0, resume_at - time.monotonic())
+        if self.requests_bucket is not None:
+            wait = max(wait, self.requests_bucket.reserve(1))
+        if self.tokens_bucket is not None and tokens > 0:
+            wait = max(wait, self.tokens_bucket.reserve(tokens))
+        return wait
+
+    def is_retryable(
+            self,
+            error: Exception,
+    ) -> bool:
+        """リトライ対象の例外か否かを判定するメソッド
+
+        Args:
+            error: API実行時の例外
+
+        Returns:
+            リトライ対象の場合は True
+        """
+        if isinstance(error, self.retry_on):
+            return True
+        status_code = get_status_code(error)
+        return status_code is not None and (
+            status_code in (408, 409, 429) or status_code >= 500
+        )
+
+    def get_backoff(
+            self,
+            error: Exception,
+            attempt: int,
+    ) -> float:
+        """リトライまでの待機秒数を算出するメソッド
+
+        Retry-After ヘッダーがある場合はその秒数,ない場合は指数バックオフとし,いずれもジッターを加える.
+        429の場合は同じレート制限を共有する全ての呼び出しをその秒数だけ待機させる.
+
+        Args:
+            error: API実行時の例外
+            attempt: 失敗した実行の回数(0始まり)
+
+        Returns:
+            待機秒数
+        """
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, self.backoff_base)
+        else:
+            # フルジッター: 同時に失敗した呼び出しのリトライを分散させる
+            delay = random.uniform(
+                0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if get_status_code(error) == 429:
+            with self.lock:
+                self.resume_at = max(self.resume_at, time.monotonic() + delay)
+        return delay
+
+    def call(
+            self,
+            func: Callable[..., Any],
+            *args: Any,
+            tokens: int = 0,
+            **kwargs: Any,
+    ) -> Any:
+        """レート制限の範囲内で関数を実行し,失敗時はリトライするメソッド
+
+        Args:
+            func: API実行する関数
+            args: 関数の位置引数
+            tokens: 1回の実行で消費するトークン数の見積り
+            kwargs: 関数のキーワード引数
+
+        Returns:
+            関数の戻り値
+        """
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self.reserve(tokens))
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                time.sleep(self.get_backoff(e, attempt))
+
+    async def call_async(
+            self,
+            func: Callable[..., Awaitable[Any]],
+            *args: Any,
+            tokens: int = 0,
+            **kwargs: Any,
+    ) -> Any:
+        """レート制限の範囲内で非同期関数を実行し,失敗時はリトライするメソッド
+
+        Args:
+            func: API実行する非同期関数
+            args: 関数の位置引数
+            tokens: 1回の実行で消費するトークン数の見積り
+            kwargs: 関数のキーワード引数
+
+        Returns:
+            関数の戻り値
+        """
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self.reserve(tokens))
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                await asyncio.sleep(self.get_backoff(e, attempt))
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(
+        provider: str,
+        retry_on: tuple[type[Exception], ...] = (),
+) -> RateLimiter:
+    """プロセス内で共有するレート制限を取得する関数
+
+    設定値はconfig.jsonの rate_limits に定義されている.
+    プロバイダーの設定がない場合は上限なし(リトライのみ)とする.
+
+    Args:
+        provider: プロバイダーおよびモデル種別のキー(azure_openai_chat など)
+        retry_on: ステータスコードによらずリトライする例外の型
+
+    Returns:
+        レート制限
+    """
+    config_rate_limits = load_config()["rate_limits"]
+    config_provider = config_rate_limits["providers"].get(provider, {})
+    return RateLimiter(
+        requests_per_minute=config_provider.get("requests_per_minute"),
+        tokens_per_minute=config_provider.get("tokens_per_minute"),
+        model_name=config_provider.get("model_name"),
+        completion_tokens_ratio=config_rate_limits["completion_tokens_ratio"],
+        max_retries=config_rate_limits["max_retries"],
+        backoff_base=config_rate_limits["backoff_base"],
+        backoff_max=config_rate_limits["backoff_max"],
+        retry_on=retry_on,
+    )
@@ -0,0 +1,131 @@
+"""共通的なChatモデルのストリーミング応答の処理をまとめたモジュール
+
+ストリーミング応答(stream=True)からテキストの差分を逐次取り出し,最初のトークンまでの時間(TTFT)などを計測する.
+打ち切り条件を満たした時点でストリームを閉じ,以降の生成を中断する.
+"""
+import time
+
+from typing_extensions import Any, AsyncIterator, Callable, Iterator
+
+
+def get_delta_text(
+        chunk: Any,
+) -> str:
+    """ストリーミング応答のチャンクからテキストの差分を取り出す関数
+
+    Args:
+        chunk: ストリーミング応答のチャンク
+
+    Returns:
+        テキストの差分(含まれない場合は空文字)
+    """
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+def update_stats(
+        stats: dict[str, Any] | None,
+        time_start: float,
+        num_chunks: int,
+        stopped: bool,
+) -> None:
+    """ストリーミング応答の計測結果を記録する関数
+
+    Args:
+        stats: 計測結果の格納先(None の場合は記録しない)
+        time_start: リクエストの開始時刻
+        num_chunks: テキストを含むチャンク数(おおよその出力トークン数)
+        stopped: 打ち切り条件により中断したか否か
+
+    Returns:
+        None
+    """
+    if stats is None:
+        return
+    stats["elapsed"] = time.perf_counter() - time_start
+    stats["chunks"] = num_chunks
+    stats["stopped"] = stopped
+
+
+def iter_stream_text(
+        stream: Any,
+        time_start: float,
+        stop_condition: Callable[[str], bool] | None = None,
+        stats: dict[str, Any] | None = None,
+) -> Iterator[str]:
+    """ストリーミング応答からテキストの差分を逐次取得する関数
+
+    stop_condition が累積テキストに対して真となった時点でストリームを閉じ,生成を中断する.
+    stats を指定した場合は ttft(秒),elapsed(秒),chunks,stopped を記録する.
+
+    Args:
+        stream: Chatモデルのストリーミング応答
+        time_start: リクエストの開始時刻(time.perf_counter)
+        stop_condition: 累積テキストを受け取り,打ち切る場合に真を返す関数
+        stats: 計測結果の格納先
+
+    Returns:
+        テキストの差分
+    """
+    text = ""
+    num_chunks = 0
+    stopped = False
+    try:
+        for chunk in stream:
+            delta = get_delta_text(chunk)
+            if not delta:
+                continue
+            if (num_chunks == 0) and (stats is not None):
+                stats["ttft"] = time.perf_counter() - time_start
+            num_chunks += 1
+            text += delta
+            yield delta
+            if (stop_condition is not None) and stop_condition(text):
+                stopped = True
+                break
+    finally:
+        # 中断した場合も接続を閉じ,サーバー側の生成を止める
+        stream.close()
+        update_stats(stats, time_start, num_chunks, stopped)
+
+
+async def aiter_stream_text(
+        stream: Any,
+        time_start: float,
+        stop_condition: Callable[[str], bool] | None = None,
+        stats: dict[str, Any] | None = None,
+) -> AsyncIterator[str]:
+    """非同期のストリーミング応答からテキストの差分を逐次取得する関数
+
+    処理内容は iter_stream_text と同一である.
+
+    Args:
+        stream: Chatモデルの非同期のストリーミング応答
+        time_start: リクエストの開始時刻(time.perf_counter)
+        stop_condition: 累積テキストを受け取り,打ち切る場合に真を返す関数
+        stats: 計測結果の格納先
+
+    Returns:
+        テキストの差分
+    """
+    text = ""
+    num_chunks = 0
+    stopped = False
+    try:
+        async for chunk in stream:
+            delta = get_delta_text(chunk)
+            if not delta:
+                continue
+            if (num_chunks == 0) and (stats is not None):
+                stats["ttft"] = time.perf_counter() - time_start
+            num_chunks += 1
+            text += delta
+            yield delta
+            if (stop_condition is not None) and stop_condition(text):
+                stopped = True
+                break
+    finally:
+        # 中断した場合も接続を閉じ,サーバー側の生成を止める
+        await stream.close()
+        update_stats(stats, time_start, num_chunks, stopped)
@@ -2,9 +2,57 @@
 
 各スクリプトにおける文字列操作は，本モジュールに定義された機能を呼び出す.
 """
+from bisect import bisect_left
+from functools import lru_cache
+
 import tiktoken
 
 
+@lru_cache(maxsize=None)
+def get_encoding(
+        model_name: str,
+) -> tiktoken.Encoding:
+    """モデルに対応するエンコーダーを取得する関数
+
+    エンコーダーの取得はコストが高いため,モデルごとに1度だけ取得し再利用する.
+
+    Args:
+        model_name: エンコードに使用するモデル名
+
+    Returns:
+        エンコーダー
+    """
+    return tiktoken.encoding_for_model(
+        model_name=model_name
+    )
+
+
+def resolve_model_name(
+        deployment: str | None,
+        model_name: str,
+) -> str:
+    """トークン数カウントに使用するモデル名を決定する関数
+
+    実際に実行するモデル(デプロイ名)と異なるエンコーダーでカウントしないよう,
+    デプロイ名が tiktoken の認識できるモデル名である場合はデプロイ名を使用する.
+    デプロイ名が任意の名前(Azure OpenAI のデプロイIDなど)の場合は設定値のモデル名を使用する.
+
+    Args:
+        deployment: API実行時に指定するモデル名またはデプロイ名
+        model_name: 設定値のモデル名
+
+    Returns:
+        トークン数カウントに使用するモデル名
+    """
+    if deployment:
+        try:
+            tiktoken.encoding_name_for_model(deployment)
+            return deployment
+        except KeyError:
+            pass
+    return model_name
+
+
 def count_tokens(
         text: str,
         model_name: str,
@@ -20,7 +68,129 @@ def count_tokens(
     Returns:
         トークン数
     """
-    encoding = tiktoken.encoding_for_model(
-        model_name=model_name
-    )
+    encoding = get_encoding(model_name)
     return len(encoding.encode(text))
+
+
+def count_tokens_many(
+        texts: list[str],
+        model_name: str,
+        num_threads: int = 8,
+) -> list[int]:
+    """複数テキストのトークン数をまとめてカウントする関数
+
+    エンコードは複数スレッドで並列に実行する.
+
+    Args:
+        texts: トークン数カウント対象のテキスト群
+        model_name: エンコードに使用するモデル名
+        num_threads: エンコードに使用するスレッド数
+
+    Returns:
+        各テキストのトークン数
+    """
+    if not texts:
+        return []
+    encoding = get_encoding(model_name)
+    return [
+        len(tokens)
+        for tokens in encoding.encode_batch(texts, num_threads=num_threads)
+    ]
+
+
+def count_tokens_upper_bound(
+        text: str,
+) -> int:
+    """トークン数の上限値をエンコードせずに算出する関数
+
+    バイト単位のBPEでは1トークンが1バイト以上となるため,UTF-8のバイト数はトークン数以上となる.
+
+    Args:
+        text: トークン数カウント対象のテキスト
+
+    Returns:
+        トークン数の上限値
+    """
+    return len(text.encode("utf-8"))
+
+
+def split_text_by_tokens(
+        text: str,
+        model_name: str,
+        max_tokens: int,
+        overlap_tokens: int = 0,
+        separators: list[str] = ["\n\n", "\n", "。", "、", " "],
+        snap_ratio: float = 0.25,
+) -> list[str]:
+    """テキストをトークン数の上限ごとに分割する関数
+
+    テキストは1度だけエンコードし,トークン位置と文字位置の対応をもとに分割する.
+    分割位置は各チャンクの末尾 snap_ratio の範囲で優先度の高い区切り文字の直後に寄せる.
+    区切り文字がない場合はトークンの境界で分割する(文字の途中では分割しない).
+    各チャンクのトークン数は max_tokens 以下となる.
+
+    Args:
+        text: 分割対象の文字列
+        model_name: エンコードに使用するモデル名
+        max_tokens: 1チャンクの最大トークン数
+        overlap_tokens: 隣接するチャンク間で重複させるトークン数
+        separators: 優先度の高い分割ポイント
+        snap_ratio: 区切り文字を探索するチャンク末尾の範囲(最大トークン数に対する割合)
+
+    Returns:
+        分割結果
+    """
+    if count_tokens_upper_bound(text) <= max_tokens:
+        return [text]
+    encoding = get_encoding(model_name)
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return [text]
+
+    # 各トークンの開始文字位置と,トークンが文字の先頭から始まるか否かを取得する
+    # 文字の途中から始まるトークンの位置はその文字の位置とする(decode_with_offsets と同じ)
+    offsets = []
+    is_char_start = []
+    text_len = 0
+    for token_bytes in encoding.decode_tokens_bytes(tokens):
+        is_continuation = 0x80 <= token_bytes[0] < 0xC0
+        offsets.append(max(0, text_len - is_continuation))
+        is_char_start.append(not is_continuation)
+        text_len += sum(1 for c in token_bytes if not 0x80 <= c < 0xC0)
+    n_tokens = len(tokens)
+    is_char_start.append(True)  # テキストの末尾
+    snap_tokens = int(max_tokens * snap_ratio)
+    chunks = []
+    start = 0
+    while start < n_tokens:
+        end = min(start + max_tokens, n_tokens)
+        if end < n_tokens:
+            # チャンク末尾の範囲で区切り文字の直後のトークン境界を探す
+            lower = max(start + 1, end - snap_tokens)
+            char_lower, char_end = offsets[lower], offsets[end]
+            for separator in separators:
+                position = text.rfind(separator, char_lower, char_end)
+                if position < 0:
+                    continue
+                # 区切り文字がチャンクの末尾で終わる場合は分割位置を変えない
+                end = bisect_left(
+                    offsets, position + len(separator), lower, end)
+                break
+            # 文字の途中では分割しない(1文字で上限を超える場合のみ文字の末尾まで含める)
+            boundary = end
+            while boundary > start + 1 and not is_char_start[boundary]:
+                boundary -= 1
+            while not is_char_start[boundary]:
+                boundary += 1
+            end = boundary
+        char_start = offsets[start]
+        char_end = offsets[end] if end < n_tokens else len(text)
+        chunks.append(text[char_start:char_end])
+        if end >= n_tokens:
+            break
+        # 重複させる場合も必ず1トークン以上進める
+        start = max(end - overlap_tokens, start + 1)
+        # 文字の途中から始まるトークンは文字全体を含めると上限を超えるため飛ばす
+        while not is_char_start[start]:
+            start += 1
+    return chunks
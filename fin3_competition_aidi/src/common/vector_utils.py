@@ -0,0 +1,193 @@
+"""共通的な埋め込みベクトルのファイル操作の機能をまとめたモジュール
+
+埋め込みベクトルは以下3ファイルの組(ベクトルアーティファクト)として保存する:
+ - {base}.npy: 埋め込みベクトルの行列(float32, 行がベクトル)
+ - {base}.meta.jsonl: 各行のID,コンテンツの位置およびメタデータ
+ - {base}.content.txt: 各行のコンテンツを連結したテキスト(UTF-8)
+
+読み込み時はベクトルの行列をメモリマップするため,ファイル全体をメモリにコピーしない.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+from typing_extensions import Any, Iterator
+
+
+def get_artifact_paths(
+        path_file_npy: Path,
+) -> tuple[Path, Path, Path]:
+    """ベクトルアーティファクトを構成するファイルのパスを取得する関数
+
+    Args:
+        path_file_npy: ベクトルの行列の.npyのパス
+
+    Returns:
+        .npy, .meta.jsonl および .content.txt のパス
+    """
+    path_file_npy = Path(path_file_npy)
+    path_base = path_file_npy.with_suffix("")
+    return (
+        path_file_npy,
+        path_base.with_name(path_base.name + ".meta.jsonl"),
+        path_base.with_name(path_base.name + ".content.txt"),
+    )
+
+
+def select_vector_source(
+        path_file_npy: Path,
+        paths_file_json: list[Path],
+) -> Path:
+    """埋め込みベクトルの読み込み元のファイルを選択する関数
+
+    ベクトルアーティファクト(.npy)が変換元のJSON(.json, .jsonl)以降に更新されている場合は.npyを選択する.
+    JSONの方が新しい場合は古い埋め込みベクトルを使用しないよう,警告を表示して最も新しいJSONを選択する.
+
+    Args:
+        path_file_npy: ベクトルアーティファクトの.npyのパス
+        paths_file_json: JSONのパス群(更新日時が同じ場合は先頭を優先する)
+
+    Returns:
+        読み込み元のファイルのパス
+        いずれも存在しない場合は paths_file_json の末尾のパス
+    """
+    path_file_npy = Path(path_file_npy)
+    paths_file_json = [Path(path) for path in paths_file_json]
+    path_file_json = max(
+        [path for path in paths_file_json if path.exists()],
+        key=lambda path: path.stat().st_mtime,
+        default=None,
+    )
+    if path_file_npy.exists():
+        if (path_file_json is None) or \
+                (path_file_npy.stat().st_mtime >= path_file_json.stat().st_mtime):
+            return path_file_npy
+        print(
+            f"warning: {path_file_json.name} is newer than {path_file_npy.name}; "
+            "ignoring the vector artifact (re-run make_npy_vectors_from_json.py)"
+        )
+    if path_file_json is not None:
+        return path_file_json
+    return paths_file_json[-1]
+
+
+def save_vector_artifact(
+        path_file_npy: Path,
+        ids: list[str],
+        vectors: list[list[float]] | np.ndarray,
+        contents: list[str],
+        metadata: list[dict[str, Any]],
+        encoding: str = "utf-8",
+) -> None:
+    """ベクトルアーティファクトを保存する関数
+
+    Args:
+        path_file_npy: 作成するベクトルの行列の.npyのパス
+        ids: 各行のID
+        vectors: 各行の埋め込みベクトル
+        contents: 各行のコンテンツ
+        metadata: 各行のメタデータ
+        encoding: 文字エンコード
+
+    Returns:
+        None
+    """
+    path_file_npy, path_file_meta, path_file_content = get_artifact_paths(
+        path_file_npy)
+    np.save(path_file_npy, np.asarray(vectors, dtype=np.float32))
+
+    offset = 0
+    with open(path_file_meta, "w", encoding=encoding) as f_meta, \
+            open(path_file_content, "wb") as f_content:
+        for id, content, meta in zip(ids, contents, metadata):
+            content_bytes = content.encode(encoding)
+            f_content.write(content_bytes)
+            record = {
+                "id": id,
+                "content_offset": offset,
+                "content_length": len(content_bytes),
+                "metadata": meta,
+            }
+            f_meta.write(json.dumps(record, ensure_ascii=False) + "\n")
+            offset += len(content_bytes)
+
+
+class VectorArtifact:
+    """ベクトルアーティファクトを読み込むクラス
+
+    ベクトルの行列はメモリマップで参照し,コンテンツは必要な行のみファイルから読み込む.
+
+    Attributes:
+        vectors: 埋め込みベクトルの行列(読み取り専用のメモリマップ)
+        ids: 各行のID
+        metadata: 各行のメタデータ
+        content_offsets: 各行のコンテンツのバイト位置およびバイト長
+        path_file_content: コンテンツの.content.txtのパス
+        encoding: 文字エンコード
+    """
+
+    def __init__(
+            self,
+            path_file_npy: Path,
+            encoding: str = "utf-8",
+    ):
+        """イニシャライザ
+
+        Args:
+            path_file_npy: ベクトルの行列の.npyのパス
+            encoding: 文字エンコード
+        """
+        path_file_npy, path_file_meta, self.path_file_content = get_artifact_paths(
+            path_file_npy)
+        self.encoding = encoding
+        self.vectors = np.load(path_file_npy, mmap_mode="r")
+        self.ids = []
+        self.metadata = []
+        self.content_offsets = []
+        with open(path_file_meta, "r", encoding=encoding) as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.metadata.append(record["metadata"])
+                self.content_offsets.append(
+                    (record["content_offset"], record["content_length"]))
+
+    def __len__(self) -> int:
+        """行数を返却するメソッド"""
+        return len(self.ids)
+
+    def get_content(
+            self,
+            index: int,
+    ) -> str:
+        """指定した行のコンテンツを読み込むメソッド
+
+        Args:
+            index: 行番号
+
+        Returns:
+            コンテンツ
+        """
+        offset, length = self.content_offsets[index]
+        with open(self.path_file_content, "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode(self.encoding)
+
+    def iter_records(self) -> Iterator[dict[str, Any]]:
+        """各行のID,コンテンツ,メタデータおよび埋め込みベクトルを順に返却するメソッド
+
+        Args:
+            None
+
+        Returns:
+            各行のレコード
+        """
+        with open(self.path_file_content, "rb") as f:
+            for i, (offset, length) in enumerate(self.content_offsets):
+                f.seek(offset)
+                yield {
+                    "id": self.ids[i],
+                    "content": f.read(length).decode(self.encoding),
+                    "metadata": self.metadata[i],
+                    "vector": self.vectors[i],
+                }
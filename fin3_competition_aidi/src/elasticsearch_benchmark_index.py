@@ -0,0 +1,381 @@
+"""埋め込みベクトルのインデックス設定ごとにインデックスサイズと検索性能を計測するスクリプト
+
+量子化方式(index_options.type)ごとにベンチマーク用のインデックスを作成し,同じデータを登録して以下を出力する:
+ - size: インデックス全体のサイズ(プライマリシャード)
+ - vector: 埋め込みベクトルのフィールドのディスク使用量(HNSW グラフおよび量子化ベクトルを含む)
+ - p50/p95: kNN 検索のレイテンシ(クライアント計測)
+ - recall: 量子化しない総当たり検索(script_score)の上位 k 件に対する再現率
+
+類似度は config.json の設定値を使用する(登録時の正規化の有無が類似度に依存するため).
+m および ef_construction は config.json の設定値を既定値とし,コマンドライン引数で上書きできる.
+クエリには登録したチャンクの埋め込みベクトルから無作為に抽出したものを使用する.
+クエリ自身のチャンクはどの検索でも必ず最上位となるため,再現率の算出時は検索結果から除く.
+本スクリプト実行前に,elasticsearch_store_data.py と同じく埋め込みベクトルの結果ファイルをinputディレクトリに格納しておく.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+from common.load_config import load_config
+from elasticsearch import Elasticsearch
+from elasticsearch_store_data import (INDEX_NAME_DOC, INDEX_OPTIONS,
+                                      SIMILARITY, create_index,
+                                      get_embeddings_file, load_docs,
+                                      restore_settings, set_bulk_settings,
+                                      store_embeddings_file)
+from typing_extensions import Any
+
+config = load_config()
+
+# Elasticsearch の各設定値を読み込む
+URL = config["elasticsearch"]["url"]
+
+# コンペルールに伴う設定値を読み込む
+DOCS_NUM = config["rules"]["docs_num"]
+
+# 類似度ごとの総当たり検索のスクリプト(スコアの大小関係が kNN 検索と一致する)
+SCRIPTS_EXACT = {
+    "l2_norm": "1 / (1 + l2norm(params.query_vector, 'embedding'))",
+    "cosine": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
+    "dot_product": "dotProduct(params.query_vector, 'embedding') + 1.0",
+    "max_inner_product": "dotProduct(params.query_vector, 'embedding') + 1.0",
+}
+
+
+def parse_arguments() -> argparse.Namespace:
+    """コマンドライン引数をパースする関数"""
+    parser = argparse.ArgumentParser(
+        description="埋め込みベクトルの量子化方式ごとにインデックスサイズと検索性能を計測する"
+    )
+
+    parser.add_argument(
+        "-t",
+        "--types",
+        type=str,
+        nargs="+",
+        choices=["hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw"],
+        default=["hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw"],
+        help="計測対象の量子化方式を1個以上指定する"
+    )
+
+    parser.add_argument(
+        "--m",
+        type=int,
+        default=INDEX_OPTIONS.get("m", 16),
+        help="HNSW グラフの各ノードの最大接続数"
+    )
+
+    parser.add_argument(
+        "--ef-construction",
+        type=int,
+        default=INDEX_OPTIONS.get("ef_construction", 100),
+        help="HNSW グラフ構築時の候補数"
+    )
+
+    parser.add_argument(
+        "-n",
+        "--num-queries",
+        type=int,
+        default=100,
+        help="計測に使用するクエリ数"
+    )
+
+    parser.add_argument(
+        "-k",
+        "--top",
+        type=int,
+        default=10,
+        help="kNN 検索の検索件数"
+    )
+
+    parser.add_argument(
+        "--num-candidates",
+        type=int,
+        default=50,
+        help="kNN 検索の類似度計算の候補数"
+    )
+
+    parser.add_argument(
+        "--docs-num",
+        type=int,
+        default=DOCS_NUM,
+        help="登録するドキュメント数(先頭から)"
+    )
+
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="計測後にベンチマーク用のインデックスを削除しない"
+    )
+
+    return parser.parse_args()
+
+
+def sample_query_vectors(
+        docs_num: int,
+        num_queries: int,
+        seed: int = 0,
+) -> list[tuple[tuple[str, int], list[float]]]:
+    """登録対象のチャンクの埋め込みベクトルからクエリを無作為に抽出する関数
+
+    全チャンクを保持しないようにリザーバサンプリングで抽出する.
+    再現率の算出時にクエリ自身のチャンクを除けるよう,チャンクのキーも合わせて返却する.
+
+    Args:
+        docs_num: 対象のドキュメント数
+        num_queries: 抽出するクエリ数
+        seed: 乱数のシード
+
+    Returns:
+        クエリのチャンクのキー(ドキュメントID,チャンクID)および埋め込みベクトルの組
+    """
+    rng = random.Random(seed)
+    samples = []
+    count = 0
+    for doc_id in range(1, docs_num+1):
+        for doc in load_docs(f"{doc_id}.pdf", get_embeddings_file(doc_id)):
+            count += 1
+            sample = ((doc["doc_id"], doc["chunk_id"]), doc["embedding"])
+            if len(samples) < num_queries:
+                samples.append(sample)
+            else:
+                i = rng.randrange(count)
+                if i < num_queries:
+                    samples[i] = sample
+    return samples
+
+
+def build_index(
+        es: Elasticsearch,
+        index_name: str,
+        docs_num: int,
+        similarity: str,
+        index_options: dict[str, Any],
+) -> None:
+    """ベンチマーク用のインデックスを作成しデータを登録する関数
+
+    登録後は1セグメントにマージし,検索時の条件をそろえる.
+    登録に失敗したチャンクがある場合は,不完全なインデックスを計測しないよう例外を送出する.
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 作成するインデックス名
+        docs_num: 登録するドキュメント数
+        similarity: 類似度の算出方法
+        index_options: HNSW のパラメータ
+
+    Returns:
+        None
+    """
+    if es.indices.exists(index=index_name):
+        es.indices.delete(index=index_name)
+    create_index(es, index_name, similarity, index_options)
+
+    original_settings = set_bulk_settings(es, index_name)
+    total_failed = 0
+    try:
+        for doc_id in range(1, docs_num+1):
+            _, failed = store_embeddings_file(
+                es,
+                index_name,
+                f"{doc_id}.pdf",
+                get_embeddings_file(doc_id),
+            )
+            total_failed += failed
+    finally:
+        restore_settings(es, index_name, original_settings)
+    if total_failed > 0:
+        raise RuntimeError(
+            f"{total_failed} chunks failed to be indexed into '{index_name}'")
+    es.indices.forcemerge(index=index_name, max_num_segments=1)
+    es.indices.refresh(index=index_name)
+
+
+def get_index_size(
+        es: Elasticsearch,
+        index_name: str,
+) -> tuple[int, int]:
+    """インデックス全体および埋め込みベクトルのフィールドのディスク使用量を取得する関数
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 対象のインデックス名
+
+    Returns:
+        インデックス全体のバイト数および埋め込みベクトルのフィールドのバイト数
+    """
+    stats = es.indices.stats(index=index_name, metric="store")
+    size_total = stats["indices"][index_name]["primaries"]["store"]["size_in_bytes"]
+    usage = es.indices.disk_usage(index=index_name, run_expensive_tasks=True)
+    size_vector = usage[index_name]["fields"]["embedding"]["total_in_bytes"]
+    return size_total, size_vector
+
+
+def search_knn(
+        es: Elasticsearch,
+        index_name: str,
+        query_vector: list[float],
+        top: int,
+        num_candidates: int,
+) -> list[tuple[str, int]]:
+    """kNN 検索を実行する関数
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 対象のインデックス名
+        query_vector: クエリの埋め込みベクトル
+        top: 検索件数
+        num_candidates: 類似度計算の候補数
+
+    Returns:
+        検索結果のチャンクのキー(ドキュメントID,チャンクID)群
+    """
+    response = es.search(
+        index=index_name,
+        knn={
+            "field": "embedding",
+            "query_vector": query_vector,
+            "k": top,
+            "num_candidates": num_candidates,
+        },
+        size=top,
+        source=["doc_id", "chunk_id"],
+    )
+    return [
+        (hit["_source"]["doc_id"], hit["_source"]["chunk_id"])
+        for hit in response["hits"]["hits"]
+    ]
+
+
+def search_exact(
+        es: Elasticsearch,
+        index_name: str,
+        query_vector: list[float],
+        top: int,
+        similarity: str,
+) -> list[tuple[str, int]]:
+    """量子化しない総当たり検索を実行する関数
+
+    量子化した場合も元のベクトルを保持しているため,どのインデックスに対しても実行できる.
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 対象のインデックス名
+        query_vector: クエリの埋め込みベクトル
+        top: 検索件数
+        similarity: 類似度の算出方法
+
+    Returns:
+        検索結果のチャンクのキー(ドキュメントID,チャンクID)群
+    """
+    response = es.search(
+        index=index_name,
+        query={
+            "script_score": {
+                "query": {"match_all": {}},
+                "script": {
+                    "source": SCRIPTS_EXACT[similarity],
+                    "params": {"query_vector": query_vector},
+                },
+            }
+        },
+        size=top,
+        source=["doc_id", "chunk_id"],
+    )
+    return [
+        (hit["_source"]["doc_id"], hit["_source"]["chunk_id"])
+        for hit in response["hits"]["hits"]
+    ]
+
+
+def benchmark_search(
+        es: Elasticsearch,
+        index_name: str,
+        queries: list[tuple[tuple[str, int], list[float]]],
+        top: int,
+        num_candidates: int,
+        similarity: str,
+) -> tuple[float, float, float]:
+    """kNN 検索のレイテンシおよび再現率を計測する関数
+
+    最初のクエリで1度ウォームアップしてから計測する.
+    クエリ自身のチャンクは kNN 検索および総当たり検索の両方で必ず見つかり再現率を押し上げるため,
+    各検索は1件多く取得し,クエリ自身のチャンクを除いた上位 top 件で再現率を算出する.
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 対象のインデックス名
+        queries: クエリのチャンクのキーおよび埋め込みベクトルの組
+        top: 検索件数
+        num_candidates: 類似度計算の候補数
+        similarity: 類似度の算出方法
+
+    Returns:
+        レイテンシの50パーセンタイル(ms),95パーセンタイル(ms),および再現率
+    """
+    num_candidates = max(num_candidates, top + 1)
+    search_knn(es, index_name, queries[0][1], top + 1, num_candidates)
+
+    latencies, recalls = [], []
+    for query_key, query_vector in queries:
+        time_start = time.perf_counter()
+        keys_knn = search_knn(es, index_name, query_vector, top + 1, num_candidates)
+        latencies.append((time.perf_counter() - time_start) * 1000)
+
+        keys_exact = search_exact(es, index_name, query_vector, top + 1, similarity)
+        keys_knn = [key for key in keys_knn if key != query_key][:top]
+        keys_exact = [key for key in keys_exact if key != query_key][:top]
+        recalls.append(len(set(keys_knn) & set(keys_exact)) / max(len(keys_exact), 1))
+
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return float(p50), float(p95), float(np.mean(recalls))
+
+
+def main():
+    args = parse_arguments()
+
+    # Elasticsearch に接続
+    es = Elasticsearch(URL, request_timeout=600)
+
+    queries = sample_query_vectors(args.docs_num, args.num_queries)
+    print(f"queries: {len(queries)}, top: {args.top}, num_candidates: {args.num_candidates}")
+
+    types_failed = []
+    for index_type in args.types:
+        index_name = f"{INDEX_NAME_DOC}_bench_{index_type}"
+        index_options = {
+            "type": index_type,
+            "m": args.m,
+            "ef_construction": args.ef_construction,
+        }
+        # 登録に失敗した場合も作成済のインデックスを削除し,残りの方式の計測を続ける
+        try:
+            build_index(es, index_name, args.docs_num, SIMILARITY, index_options)
+            size_total, size_vector = get_index_size(es, index_name)
+            p50, p95, recall = benchmark_search(
+                es,
+                index_name,
+                queries,
+                args.top,
+                args.num_candidates,
+                SIMILARITY,
+            )
+            print(
+                f"{index_type}: size {size_total / 2**20:.1f}MiB "
+                f"(vector {size_vector / 2**20:.1f}MiB), "
+                f"p50 {p50:.1f}ms, p95 {p95:.1f}ms, recall@{args.top} {recall:.3f}"
+            )
+        except Exception as e:
+            types_failed.append(index_type)
+            print(f"{index_type}: failed ({e})")
+        finally:
+            if not args.keep:
+                es.indices.delete(index=index_name, ignore_unavailable=True)
+
+    if types_failed:
+        raise RuntimeError(f"benchmark failed for: {', '.join(types_failed)}")
+
+
+if __name__ == "__main__":
+    main()
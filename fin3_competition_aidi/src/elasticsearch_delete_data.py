@@ -1,9 +1,16 @@
 """Elasticsearch に登録したデータを削除するスクリプト
 
-同じインデックス名で異なるデータが登録済かつ新たに登録し直す場合，登録前に本スクリプトを実行する.
+config.json のインデックス名はエイリアス名であり,実体はバージョン付きのインデックス({name}_v{日時})である.
+デフォルトではエイリアスの参照先でない古いインデックスのみ削除する(検索は停止しない).
+--all を指定した場合はエイリアスおよび全てのバージョンのインデックスを削除する.
+elasticsearch_store_data.py は新たなインデックスを作成してから切り替えるため,登録し直す前に本スクリプトを実行する必要はない.
 """
+import argparse
+
 from common.load_config import load_config
 from elasticsearch import Elasticsearch
+from elasticsearch_store_data import (delete_old_indices,
+                                      get_versioned_indices)
 
 config = load_config()
 
@@ -12,14 +19,64 @@ URL = config["elasticsearch"]["url"]
 INDEX_NAME_DOC = config["elasticsearch"]["data"]["index"]["name"]
 
 
+def parse_arguments() -> argparse.Namespace:
+    """コマンドライン引数をパースする関数"""
+    parser = argparse.ArgumentParser(
+        description="Elasticsearch に登録したデータを削除する"
+    )
+
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="エイリアスの参照先を含む全てのインデックスを削除する"
+    )
+
+    parser.add_argument(
+        "--versions-to-keep",
+        type=int,
+        default=0,
+        help="古いインデックスのみ削除する場合に残す世代数"
+    )
+
+    return parser.parse_args()
+
+
 def main():
+    args = parse_arguments()
+
     # Elasticsearch に接続
     es = Elasticsearch(URL)
 
-    # 既存のインデックスを削除
+    if not args.all:
+        # エイリアスの参照先でない古いインデックスを削除
+        index_names = delete_old_indices(es, INDEX_NAME_DOC, args.versions_to_keep)
+        for index_name in index_names:
+            print(f"Index '{index_name}' deleted.")
+        # 従来(引数なしで全て削除)の使い方と区別できるよう,参照先は削除しないことを明示する
+        if not index_names:
+            print(
+                f"No old index of '{INDEX_NAME_DOC}' to delete; nothing deleted. "
+                "Use --all to drop the alias and all versions."
+            )
+        else:
+            print(
+                f"The index referenced by '{INDEX_NAME_DOC}' is kept. "
+                "Use --all to drop the alias and all versions."
+            )
+        return
+
+    # 全てのバージョンのインデックスを削除(エイリアスも同時に削除される)
+    index_names = get_versioned_indices(es, INDEX_NAME_DOC)
+    for index_name in index_names:
+        es.indices.delete(index=index_name)
+        print(f"Index '{index_name}' deleted.")
+
+    # バージョン管理前の同名のインデックスを削除
     if es.indices.exists(index=INDEX_NAME_DOC):
         es.indices.delete(index=INDEX_NAME_DOC)
         print(f"Index '{INDEX_NAME_DOC}' deleted.")
+    elif not index_names:
+        print(f"No index of '{INDEX_NAME_DOC}' found; nothing deleted.")
 
 
 if __name__ == "__main__":
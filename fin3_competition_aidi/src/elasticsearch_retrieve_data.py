@@ -1,10 +1,16 @@
 """Elasticsearchで検索を実行する処理をまとめたモジュール
 
 各スクリプトで Elasticsearch による検索処理が必要なときは本モジュールから呼び出す.
+
+ハイブリッド検索の方式は config.json の elasticsearch.retrieval.mode で以下から選択する:
+ - script_score: 類似度検索とキーワード検索のスコアをパラメータ化したスクリプトで重み付けし合算する
+ - rrf: 類似度検索(トップレベルの knn)とキーワード検索の順位を Reciprocal Rank Fusion で統合する
+ - linear: 類似度検索とキーワード検索を _msearch の2検索で実行し,正規化したスコアをクライアント側で重み付けし合算する
 """
+from common.calc_utils import normalize_vectors
 from common.load_config import load_config
-from elasticsearch import Elasticsearch
-from typing_extensions import Any
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from typing_extensions import Any, Iterator
 
 config = load_config()
 
@@ -12,6 +18,417 @@ config = load_config()
 URL = config["elasticsearch"]["url"]
 INDEX_NAME_DOC = config["elasticsearch"]["data"]["index"]["name"]
 DIMS_EMBEDDING = config["elasticsearch"]["data"]["index"]["dims_embedding"]
+SIMILARITY = config["elasticsearch"]["data"]["index"]["embedding"]["similarity"]
+# 登録時に正規化している場合はクエリの埋め込みベクトルも正規化する
+NORMALIZE_EMBEDDING = SIMILARITY in ["cosine", "dot_product"]
+CONFIG_MSEARCH = config["elasticsearch"]["msearch"]
+CONFIG_RETRIEVAL = config["elasticsearch"]["retrieval"]
+
+
+def make_filter(
+        doc_id_filter: str | None,
+) -> list[dict[str, Any]]:
+    """ドキュメントIDのフィルター条件を作成する関数
+
+    Args:
+        doc_id_filter: ドキュメントIDのフィルター条件(None の場合は全件)
+
+    Returns:
+        フィルター条件のクエリ群
+    """
+    if doc_id_filter is None:
+        return []
+    return [{"term": {"doc_id": doc_id_filter}}]
+
+
+def make_body_hybrid(
+        query: str,
+        query_vector: list[float],
+        doc_id_filter: str | None = None,
+        num_searches: int = 5,
+        top: int = 3,
+        num_candidates: int = 50,
+        rate_vector_search: float = 0.7,
+        minimum_should_match: int = 1,
+        include_embedding: bool = False,
+) -> dict[str, Any]:
+    """ハイブリッド検索(script_score)のリクエストボディを作成する関数
+
+    類似度検索およびキーワード検索を指定した比率で実行するクエリとする.
+    比率はスクリプトのパラメータとして渡すため,比率によらず同じスクリプトがキャッシュされる.
+    ドキュメントIDのフィルター条件を指定した場合は検索対象を絞る.
+    埋め込みベクトルは応答サイズが大きいため,指定した場合のみ返却対象とする.
+
+    Args:
+        query: クエリ(キーワード検索対象)
+        query_vector: クエリの埋め込みベクトル(類似度検索対象)
+        doc_id_filter: ドキュメントIDのフィルター条件
+        num_searches: 内部的な検索件数
+        top: 返却する検索結果件数
+        num_candidates: 類似度計算の候補数
+        rate_vector_search: 類似度検索の割合
+        minimum_should_match: 最低のマッチ個数
+        include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+
+    Returns:
+        ハイブリッド検索のリクエストボディ
+    """
+    rate_keyword_search = 1.0 - rate_vector_search  # キーワード検索の割合
+
+    query_bool = {
+        "should": [
+            {
+                "script_score": {
+                    "query": {
+                        "knn": {
+                            "field": "embedding",
+                            "query_vector": query_vector,
+                            "k": num_searches,
+                            "num_candidates": num_candidates
+                        }
+                    },
+                    "script": {
+                        "source": "_score * params.rate",
+                        "params": {"rate": rate_vector_search}
+                    }
+                }
+            },
+            {
+                "script_score": {
+                    "query": {
+                        "match": {
+                            "content": query
+                        }
+                    },
+                    "script": {
+                        "source": "_score * params.rate",
+                        "params": {"rate": rate_keyword_search}
+                    }
+                }
+            }
+        ],
+        "minimum_should_match": minimum_should_match
+    }
+    if doc_id_filter is not None:
+        # 指定された doc_id でフィルタリング
+        query_bool["must"] = make_filter(doc_id_filter)
+
+    body = {
+        "size": top,
+        "query": {"bool": query_bool},
+    }
+    if not include_embedding:
+        body["_source"] = {"excludes": ["embedding"]}
+
+    return body
+
+
+def make_body_rrf(
+        query: str,
+        query_vector: list[float],
+        doc_id_filter: str | None = None,
+        num_searches: int = 5,
+        top: int = 3,
+        num_candidates: int = 50,
+        include_embedding: bool = False,
+) -> dict[str, Any]:
+    """ハイブリッド検索(rrf)のリクエストボディを作成する関数
+
+    トップレベルの knn 検索とキーワード検索の順位を Reciprocal Rank Fusion で統合する.
+    フィルター条件は knn 検索の HNSW 探索中に適用される.
+    RRF は順位のみを使用するため,類似度検索の割合は使用しない.
+
+    Args:
+        query: クエリ(キーワード検索対象)
+        query_vector: クエリの埋め込みベクトル(類似度検索対象)
+        doc_id_filter: ドキュメントIDのフィルター条件
+        num_searches: 各検索の検索件数
+        top: 返却する検索結果件数
+        num_candidates: 類似度計算の候補数
+        include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+
+    Returns:
+        ハイブリッド検索のリクエストボディ
+    """
+    filters = make_filter(doc_id_filter)
+    body = {
+        "size": top,
+        "retriever": {
+            "rrf": {
+                "retrievers": [
+                    {
+                        "standard": {
+                            "query": {
+                                "bool": {
+                                    "must": [{"match": {"content": query}}],
+                                    "filter": filters,
+                                }
+                            }
+                        }
+                    },
+                    {
+                        "knn": {
+                            "field": "embedding",
+                            "query_vector": query_vector,
+                            "k": num_searches,
+                            "num_candidates": num_candidates,
+                            "filter": filters,
+                        }
+                    },
+                ],
+                "rank_window_size": max(num_searches, top),
+                "rank_constant": CONFIG_RETRIEVAL["rank_constant"],
+            }
+        },
+    }
+    if not include_embedding:
+        body["_source"] = {"excludes": ["embedding"]}
+
+    return body
+
+
+def make_bodies_linear(
+        query: str,
+        query_vector: list[float],
+        doc_id_filter: str | None = None,
+        num_searches: int = 5,
+        num_candidates: int = 50,
+        include_embedding: bool = False,
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    """ハイブリッド検索(linear)の類似度検索およびキーワード検索のリクエストボディを作成する関数
+
+    スコアの合算はクライアント側で行うため,各検索は num_searches 件ずつ取得する.
+
+    Args:
+        query: クエリ(キーワード検索対象)
+        query_vector: クエリの埋め込みベクトル(類似度検索対象)
+        doc_id_filter: ドキュメントIDのフィルター条件
+        num_searches: 各検索の検索件数
+        num_candidates: 類似度計算の候補数
+        include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+
+    Returns:
+        類似度検索およびキーワード検索のリクエストボディ
+    """
+    filters = make_filter(doc_id_filter)
+    body_vector = {
+        "size": num_searches,
+        "knn": {
+            "field": "embedding",
+            "query_vector": query_vector,
+            "k": num_searches,
+            "num_candidates": num_candidates,
+            "filter": filters,
+        },
+    }
+    body_keyword = {
+        "size": num_searches,
+        "query": {
+            "bool": {
+                "must": [{"match": {"content": query}}],
+                "filter": filters,
+            }
+        },
+    }
+    if not include_embedding:
+        body_vector["_source"] = {"excludes": ["embedding"]}
+        body_keyword["_source"] = {"excludes": ["embedding"]}
+
+    return body_vector, body_keyword
+
+
+def fuse_linear(
+        response_vector: dict[str, Any],
+        response_keyword: dict[str, Any],
+        rate_vector_search: float,
+        top: int,
+) -> dict[str, Any]:
+    """類似度検索およびキーワード検索の結果をスコアの重み付け和で統合する関数
+
+    各検索のスコアは最大値で正規化(0〜1)してから合算する.
+    最大値がレスポンスにない場合は各結果のスコアの最大値を使用する.
+
+    Args:
+        response_vector: 類似度検索のレスポンス
+        response_keyword: キーワード検索のレスポンス
+        rate_vector_search: 類似度検索の割合
+        top: 返却する検索結果件数
+
+    Returns:
+        統合後の検索結果(検索のレスポンスと同じ形式)
+    """
+    scores, hits = {}, {}
+    for response, rate in [
+        (response_vector, rate_vector_search),
+        (response_keyword, 1.0 - rate_vector_search),
+    ]:
+        list_hits = response["hits"]["hits"]
+        max_score = response["hits"].get("max_score") or max(
+            (hit["_score"] or 0.0 for hit in list_hits), default=0.0) or 1.0
+        for hit in list_hits:
+            scores[hit["_id"]] = scores.get(hit["_id"], 0.0) + \
+                rate * (hit["_score"] or 0.0) / max_score
+            hits[hit["_id"]] = hit
+    ids_top = sorted(scores, key=scores.get, reverse=True)[:top]
+    return {"hits": {"hits": [hits[id] for id in ids_top]}}
+
+
+def parse_hits(
+        response: dict[str, Any],
+) -> list[dict[str, Any]]:
+    """検索結果のレスポンスから返却用のデータを取り出す関数
+
+    埋め込みベクトルは返却対象とした場合のみ含める.
+
+    Args:
+        response: Elasticsearch の検索結果のレスポンス
+
+    Returns:
+        検索結果上位のデータ
+    """
+    results = []
+    for hit in response["hits"]["hits"]:
+        results.append(
+            {
+                "doc_id": hit["_source"]["doc_id"],
+                "chunk_id": hit["_source"]["chunk_id"],
+                "content": hit["_source"]["content"],
+                "metadata": hit["_source"]["metadata"],
+            }
+        )
+        if "embedding" in hit["_source"]:
+            results[-1]["embedding"] = hit["_source"]["embedding"]
+    return results
+
+
+def make_searches_hybrid(
+        requests: list[tuple[str, list[float], str | None]],
+        mode: str,
+        num_searches: int,
+        top: int,
+        num_candidates: int,
+        rate_vector_search: float,
+        minimum_should_match: int,
+        include_embedding: bool,
+) -> list[dict[str, Any]]:
+    """複数のハイブリッド検索をまとめた _msearch のリクエストボディを作成する関数
+
+    linear の場合は1件のハイブリッド検索につき2検索となる.
+    類似度が cosine または dot_product の場合はクエリの埋め込みベクトルを正規化する.
+
+    Args:
+        requests: クエリ,クエリの埋め込みベクトルおよびドキュメントIDのフィルター条件(None の場合は全件)の組
+        mode: ハイブリッド検索の方式(script_score, rrf, linear)
+        num_searches: 内部的な検索件数
+        top: 返却する検索結果件数
+        num_candidates: 類似度計算の候補数
+        rate_vector_search: 類似度検索の割合
+        minimum_should_match: 最低のマッチ個数
+        include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+
+    Returns:
+        ヘッダーとリクエストボディを交互に並べたリスト
+    """
+    searches = []
+    for query, query_vector, doc_id_filter in requests:
+        if NORMALIZE_EMBEDDING:
+            query_vector = normalize_vectors(query_vector)[0].tolist()
+        if mode == "linear":
+            bodies = make_bodies_linear(
+                query, query_vector, doc_id_filter,
+                num_searches, num_candidates, include_embedding,
+            )
+        elif mode == "rrf":
+            bodies = [make_body_rrf(
+                query, query_vector, doc_id_filter,
+                num_searches, top, num_candidates, include_embedding,
+            )]
+        else:
+            bodies = [make_body_hybrid(
+                query, query_vector, doc_id_filter,
+                num_searches, top, num_candidates,
+                rate_vector_search, minimum_should_match, include_embedding,
+            )]
+        for body in bodies:
+            searches.append({"index": INDEX_NAME_DOC})
+            searches.append(body)
+    return searches
+
+
+def make_msearch_requests(
+        requests: list[tuple[str, list[float], str | None]],
+        mode: str,
+        num_searches: int,
+        top: int,
+        num_candidates: int,
+        rate_vector_search: float,
+        minimum_should_match: int,
+        include_embedding: bool,
+        batch_size: int,
+) -> Iterator[dict[str, Any]]:
+    """複数のハイブリッド検索を batch_size 件ずつまとめた _msearch の引数を作成する関数
+
+    同期処理と非同期処理で共通の引数とし,異なるのは _msearch の実行のみとする.
+
+    Args:
+        requests: クエリ,クエリの埋め込みベクトルおよびドキュメントIDのフィルター条件(None の場合は全件)の組
+        mode: ハイブリッド検索の方式(script_score, rrf, linear)
+        num_searches: 内部的な検索件数
+        top: 返却する検索結果件数
+        num_candidates: 類似度計算の候補数
+        rate_vector_search: 類似度検索の割合
+        minimum_should_match: 最低のマッチ個数
+        include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+        batch_size: 1リクエストあたりの検索数
+
+    Returns:
+        Elasticsearch の msearch のキーワード引数
+    """
+    for i in range(0, len(requests), batch_size):
+        yield {
+            "searches": make_searches_hybrid(
+                requests[i:i+batch_size],
+                mode=mode,
+                num_searches=num_searches,
+                top=top,
+                num_candidates=num_candidates,
+                rate_vector_search=rate_vector_search,
+                minimum_should_match=minimum_should_match,
+                include_embedding=include_embedding,
+            ),
+            "max_concurrent_searches": CONFIG_MSEARCH["max_concurrent_searches"],
+        }
+
+
+def parse_responses(
+        response: dict[str, Any],
+        mode: str,
+        top: int,
+        rate_vector_search: float,
+) -> list[list[dict[str, Any]]]:
+    """_msearch のレスポンスを検索ごとの返却用のデータに分割する関数
+
+    linear の場合は2検索ずつ統合する.
+
+    Args:
+        response: Elasticsearch の _msearch のレスポンス
+        mode: ハイブリッド検索の方式(script_score, rrf, linear)
+        top: 返却する検索結果件数
+        rate_vector_search: 類似度検索の割合
+
+    Returns:
+        検索ごとの検索結果上位のデータ(リクエストの順序と一致する)
+    """
+    items = response["responses"]
+    for item in items:
+        if "error" in item:
+            raise RuntimeError(f"msearch failed: {item['error']}")
+    if mode == "linear":
+        items = [
+            fuse_linear(items[i], items[i+1], rate_vector_search, top)
+            for i in range(0, len(items), 2)
+        ]
+    return [parse_hits(item) for item in items]
 
 
 class ElasticsearchRetrivation:
@@ -36,10 +453,12 @@ class ElasticsearchRetrivation:
             num_candidates: int = 50,
             rate_vector_search: float = 0.7,
             minimum_should_match: int = 1,
+            include_embedding: bool = False,
+            mode: str = CONFIG_RETRIEVAL["mode"],
     ) -> list[dict[str, Any]]:
         """ハイブリッド検索を実行するメソッド
 
-        類似度検索およびキーワード検索を指定した比率で実行する.
+        類似度検索およびキーワード検索を指定した方式で統合する.
         検索対象は全てのデータである.
         類似度アルゴリズムは knn である.
 
@@ -51,68 +470,26 @@ class ElasticsearchRetrivation:
             num_candidates: 類似度計算の候補数
             rate_vector_search: 類似度検索の割合
             minimum_should_match: 最低のマッチ個数
+            include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+            mode: ハイブリッド検索の方式(script_score, rrf, linear)
 
         Returns:
             検索結果上位のデータ
         """
-        rate_keyword_search = 1.0 - rate_vector_search  # キーワード検索の割合
-
-        # ハイブリッド検索を実行
-        response = self.es.search(
-            index=INDEX_NAME_DOC,
-            body={
-                "size": top,
-                "query": {
-                    "bool": {
-                        "should": [
-                            {
-                                "script_score": {
-                                    "query": {
-                                        "knn": {
-                                            "field": "embedding",
-                                            "query_vector": query_vector,
-                                            "k": num_searches,
-                                            "num_candidates": num_candidates
-                                        }
-                                    },
-                                    "script": {
-                                        "source": f"_score * {rate_vector_search}"
-                                    }
-                                }
-                            },
-                            {
-                                "script_score": {
-                                    "query": {
-                                        "match": {
-                                            "content": query
-                                        }
-                                    },
-                                    "script": {
-                                        "source": f"_score * {rate_keyword_search}"
-                                    }
-                                }
-                            }
-                        ],
-                        "minimum_should_match": minimum_should_match
-                    }
-                }
-            }
+        # ハイブリッド検索を実行(方式によらず同じ処理とするため _msearch で実行)
+        results = self.retrieve_hybrid_batch(
+            [(query, query_vector, None)],
+            num_searches=num_searches,
+            top=top,
+            num_candidates=num_candidates,
+            rate_vector_search=rate_vector_search,
+            minimum_should_match=minimum_should_match,
+            include_embedding=include_embedding,
+            mode=mode,
         )
 
         # 検索結果を返却
-        results = []
-        for hit in response["hits"]["hits"]:
-            results.append(
-                {
-                    "doc_id": hit["_source"]["doc_id"],
-                    "chunk_id": hit["_source"]["chunk_id"],
-                    "content": hit["_source"]["content"],
-                    "embedding": hit["_source"]["embedding"],
-                    "metadata": hit["_source"]["metadata"],
-                }
-            )
-
-        return results
+        return results[0]
 
     def retrieve_hybrid_with_filter(
             self,
@@ -124,10 +501,12 @@ class ElasticsearchRetrivation:
             num_candidates: int = 50,
             rate_vector_search: float = 0.7,
             minimum_should_match: int = 1,
+            include_embedding: bool = False,
+            mode: str = CONFIG_RETRIEVAL["mode"],
     ) -> list[dict[str, Any]]:
         """ハイブリッド検索を実行するメソッド
 
-        類似度検索およびキーワード検索を指定した比率で実行する.
+        類似度検索およびキーワード検索を指定した方式で統合する.
         検索対象はドキュメントIDによりフィルタリングされたデータである.
         類似度アルゴリズムは knn である.
 
@@ -140,69 +519,220 @@ class ElasticsearchRetrivation:
             num_candidates: 類似度計算の候補数
             rate_vector_search: 類似度検索の割合
             minimum_should_match: 最低のマッチ個数
+            include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+            mode: ハイブリッド検索の方式(script_score, rrf, linear)
 
         Returns:
             検索結果上位のデータ
         """
-        rate_keyword_search = 1.0 - rate_vector_search  # キーワード検索の割合
-
-        # ハイブリッド検索を実行
-        response = self.es.search(
-            index=INDEX_NAME_DOC,
-            body={
-                "size": top,
-                "query": {
-                    "bool": {
-                        "must": [
-                            # 指定された doc_id でフィルタリング
-                            {"term": {"doc_id": doc_id_filter}}
-                        ],
-                        "should": [
-                            {
-                                "script_score": {
-                                    "query": {
-                                        "knn": {
-                                            "field": "embedding",
-                                            "query_vector": query_vector,
-                                            "k": num_searches,
-                                            "num_candidates": num_candidates
-                                        }
-                                    },
-                                    "script": {
-                                        "source": f"_score * {rate_vector_search}"
-                                    }
-                                }
-                            },
-                            {
-                                "script_score": {
-                                    "query": {
-                                        "match": {
-                                            "content": query
-                                        }
-                                    },
-                                    "script": {
-                                        "source": f"_score * {rate_keyword_search}"
-                                    }
-                                }
-                            }
-                        ],
-                        "minimum_should_match": minimum_should_match
-                    }
-                }
-            }
+        # ハイブリッド検索を実行(方式によらず同じ処理とするため _msearch で実行)
+        results = self.retrieve_hybrid_batch(
+            [(query, query_vector, doc_id_filter)],
+            num_searches=num_searches,
+            top=top,
+            num_candidates=num_candidates,
+            rate_vector_search=rate_vector_search,
+            minimum_should_match=minimum_should_match,
+            include_embedding=include_embedding,
+            mode=mode,
+        )
+
+        # 検索結果を返却
+        return results[0]
+
+    def retrieve_hybrid_batch(
+            self,
+            requests: list[tuple[str, list[float], str | None]],
+            num_searches: int = 5,
+            top: int = 3,
+            num_candidates: int = 50,
+            rate_vector_search: float = 0.7,
+            minimum_should_match: int = 1,
+            include_embedding: bool = False,
+            mode: str = CONFIG_RETRIEVAL["mode"],
+            batch_size: int = CONFIG_MSEARCH["batch_size"],
+    ) -> list[list[dict[str, Any]]]:
+        """複数のハイブリッド検索を _msearch でまとめて実行するメソッド
+
+        検索内容は retrieve_hybrid および retrieve_hybrid_with_filter と同一である.
+        batch_size 件ずつ1リクエストにまとめて実行する.
+        linear の場合は1件あたり2検索となる.
+
+        Args:
+            requests: クエリ,クエリの埋め込みベクトルおよびドキュメントIDのフィルター条件(None の場合は全件)の組
+            num_searches: 内部的な検索件数
+            top: 返却する検索結果件数
+            num_candidates: 類似度計算の候補数
+            rate_vector_search: 類似度検索の割合
+            minimum_should_match: 最低のマッチ個数
+            include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+            mode: ハイブリッド検索の方式(script_score, rrf, linear)
+            batch_size: 1リクエストあたりの検索数
+
+        Returns:
+            検索ごとの検索結果上位のデータ(入力の順序と一致する)
+        """
+        results = []
+        for kwargs in make_msearch_requests(
+                requests, mode, num_searches, top, num_candidates,
+                rate_vector_search, minimum_should_match, include_embedding,
+                batch_size):
+            response = self.es.msearch(**kwargs)
+            results.extend(
+                parse_responses(response, mode, top, rate_vector_search))
+
+        return results
+
+
+class AsyncElasticsearchRetrivation:
+    """Elasticsearchの非同期の検索処理をまとめたクラス
+
+    登録済のデータに対し検索処理のメソッドが定義されている.
+    検索内容は ElasticsearchRetrivation と同一である.
+
+    Attributes:
+        es: Elasticsearch 非同期クライアント
+    """
+
+    def __init__(self):
+        """イニシャライザ"""
+        self.es = AsyncElasticsearch(URL)  # Elasticsearchに接続
+
+    async def close(self) -> None:
+        """Elasticsearch との接続を閉じるメソッド"""
+        await self.es.close()
+
+    async def retrieve_hybrid(
+            self,
+            query: str,
+            query_vector: list[float],
+            num_searches: int = 5,
+            top: int = 3,
+            num_candidates: int = 50,
+            rate_vector_search: float = 0.7,
+            minimum_should_match: int = 1,
+            include_embedding: bool = False,
+            mode: str = CONFIG_RETRIEVAL["mode"],
+    ) -> list[dict[str, Any]]:
+        """ハイブリッド検索を非同期で実行するメソッド
+
+        検索対象は全てのデータである.
+
+        Args:
+            query: クエリ(キーワード検索対象)
+            query_vector: クエリの埋め込みベクトル(類似度検索対象)
+            num_searches: 内部的な検索件数
+            top: 返却する検索結果件数
+            num_candidates: 類似度計算の候補数
+            rate_vector_search: 類似度検索の割合
+            minimum_should_match: 最低のマッチ個数
+            include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+            mode: ハイブリッド検索の方式(script_score, rrf, linear)
+
+        Returns:
+            検索結果上位のデータ
+        """
+        # ハイブリッド検索を実行(方式によらず同じ処理とするため _msearch で実行)
+        results = await self.retrieve_hybrid_batch(
+            [(query, query_vector, None)],
+            num_searches=num_searches,
+            top=top,
+            num_candidates=num_candidates,
+            rate_vector_search=rate_vector_search,
+            minimum_should_match=minimum_should_match,
+            include_embedding=include_embedding,
+            mode=mode,
         )
 
         # 検索結果を返却
+        return results[0]
+
+    async def retrieve_hybrid_with_filter(
+            self,
+            query: str,
+            query_vector: list[float],
+            doc_id_filter: str,
+            num_searches: int = 5,
+            top: int = 3,
+            num_candidates: int = 50,
+            rate_vector_search: float = 0.7,
+            minimum_should_match: int = 1,
+            include_embedding: bool = False,
+            mode: str = CONFIG_RETRIEVAL["mode"],
+    ) -> list[dict[str, Any]]:
+        """ハイブリッド検索を非同期で実行するメソッド
+
+        検索対象はドキュメントIDによりフィルタリングされたデータである.
+
+        Args:
+            query: クエリ(キーワード検索対象)
+            query_vector: クエリの埋め込みベクトル(類似度検索対象)
+            doc_id_filter: ドキュメントIDのフィルター条件
+            num_searches: 内部的な検索件数
+            top: 返却する検索結果件数
+            num_candidates: 類似度計算の候補数
+            rate_vector_search: 類似度検索の割合
+            minimum_should_match: 最低のマッチ個数
+            include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+            mode: ハイブリッド検索の方式(script_score, rrf, linear)
+
+        Returns:
+            検索結果上位のデータ
+        """
+        # ハイブリッド検索を実行(方式によらず同じ処理とするため _msearch で実行)
+        results = await self.retrieve_hybrid_batch(
+            [(query, query_vector, doc_id_filter)],
+            num_searches=num_searches,
+            top=top,
+            num_candidates=num_candidates,
+            rate_vector_search=rate_vector_search,
+            minimum_should_match=minimum_should_match,
+            include_embedding=include_embedding,
+            mode=mode,
+        )
+
+        # 検索結果を返却
+        return results[0]
+
+    async def retrieve_hybrid_batch(
+            self,
+            requests: list[tuple[str, list[float], str | None]],
+            num_searches: int = 5,
+            top: int = 3,
+            num_candidates: int = 50,
+            rate_vector_search: float = 0.7,
+            minimum_should_match: int = 1,
+            include_embedding: bool = False,
+            mode: str = CONFIG_RETRIEVAL["mode"],
+            batch_size: int = CONFIG_MSEARCH["batch_size"],
+    ) -> list[list[dict[str, Any]]]:
+        """複数のハイブリッド検索を _msearch でまとめて非同期で実行するメソッド
+
+        検索内容は retrieve_hybrid および retrieve_hybrid_with_filter と同一である.
+        batch_size 件ずつ1リクエストにまとめて実行する.
+        linear の場合は1件あたり2検索となる.
+
+        Args:
+            requests: クエリ,クエリの埋め込みベクトルおよびドキュメントIDのフィルター条件(None の場合は全件)の組
+            num_searches: 内部的な検索件数
+            top: 返却する検索結果件数
+            num_candidates: 類似度計算の候補数
+            rate_vector_search: 類似度検索の割合
+            minimum_should_match: 最低のマッチ個数
+            include_embedding: 埋め込みベクトルを返却するか否かのフラグ
+            mode: ハイブリッド検索の方式(script_score, rrf, linear)
+            batch_size: 1リクエストあたりの検索数
+
+        Returns:
+            検索ごとの検索結果上位のデータ(入力の順序と一致する)
+        """
         results = []
-        for hit in response["hits"]["hits"]:
-            results.append(
-                {
-                    "doc_id": hit["_source"]["doc_id"],
-                    "chunk_id": hit["_source"]["chunk_id"],
-                    "content": hit["_source"]["content"],
-                    "embedding": hit["_source"]["embedding"],
-                    "metadata": hit["_source"]["metadata"],
-                }
-            )
+        for kwargs in make_msearch_requests(
+                requests, mode, num_searches, top, num_candidates,
+                rate_vector_search, minimum_should_match, include_embedding,
+                batch_size):
+            response = await self.es.msearch(**kwargs)
+            results.extend(
+                parse_responses(response, mode, top, rate_vector_search))
 
         return results
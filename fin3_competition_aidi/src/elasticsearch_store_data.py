@@ -3,10 +3,31 @@
 別スクリプトで作成したチャンクや埋め込みベクトルの結果を Elasticsearch のデータに登録する.
 本スクリプト実行前に,登録に使用する以下のデータをinputディレクトリに決められたファイル名で格納しておく.
  - {1..19}_embedding.json: 各ドキュメントのチャンク,各チャンクの埋め込みベクトル,およびメタデータ
+   {1..19}_embedding.jsonl が存在する場合はそちらを1チャンクずつ読み込む(.json と両方ある場合は新しい方)
+   make_npy_vectors_from_json.py で変換した {1..19}_embedding.npy (および付随ファイル)が JSON 以降に更新されている場合はそちらを使用する
+
+登録方法は以下から選択する:
+ - bulk: _bulk API によりまとめて登録する(デフォルト)
+ - index: チャンクごとに1リクエストで登録する
+
+config.json のインデックス名はエイリアス名として扱い,登録ごとにバージョン付きのインデックス({name}_v{日時})を新たに作成する.
+登録,マージおよびウォームアップの完了後にエイリアスの参照先を切り替えるため,登録中も既存のインデックスを検索できる.
+切り替え後は設定値の世代数を残して古いインデックスを削除する.
 """
-from common.file_utils import json_to_dict
+import argparse
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from common.calc_utils import normalize_vectors
+from common.file_utils import iter_items
 from common.load_config import get_input_dir, load_config
+from common.vector_utils import VectorArtifact, select_vector_source
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import parallel_bulk, streaming_bulk
+from typing_extensions import Any, Iterator
 
 config = load_config()
 input_dir = get_input_dir()
@@ -15,75 +36,698 @@ input_dir = get_input_dir()
 URL = config["elasticsearch"]["url"]
 INDEX_NAME_DOC = config["elasticsearch"]["data"]["index"]["name"]
 DIMS_EMBEDDING = config["elasticsearch"]["data"]["index"]["dims_embedding"]
+EXCLUDE_EMBEDDING_FROM_SOURCE = config["elasticsearch"]["data"]["index"]["exclude_embedding_from_source"]
+SIMILARITY = config["elasticsearch"]["data"]["index"]["embedding"]["similarity"]
+INDEX_OPTIONS = config["elasticsearch"]["data"]["index"]["embedding"]["index_options"]
+# cosine および dot_product の場合は登録前に埋め込みベクトルを正規化する
+NORMALIZE_EMBEDDING = SIMILARITY in ["cosine", "dot_product"]
+CONFIG_BULK = config["elasticsearch"]["bulk"]
+CONFIG_ALIAS = config["elasticsearch"]["alias"]
 
 # コンペルールに伴う設定値を読み込む
 DOCS_NUM = config["rules"]["docs_num"]
 
 
-def main():
+def parse_arguments() -> argparse.Namespace:
+    """コマンドライン引数をパースする関数"""
+    parser = argparse.ArgumentParser(
+        description="埋め込みベクトルの結果ファイル群を Elasticsearch に登録する"
+    )
 
-    # Elasticsearch に接続
-    es = Elasticsearch(URL)
+    parser.add_argument(
+        "-m",
+        "--mode",
+        type=str,
+        choices=["bulk", "index"],
+        default="bulk",
+        help="登録方法を指定する"
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CONFIG_BULK["chunk_size"],
+        help="bulk登録時の1リクエストあたりの最大チャンク数"
+    )
+
+    parser.add_argument(
+        "--max-chunk-bytes",
+        type=int,
+        default=CONFIG_BULK["max_chunk_bytes"],
+        help="bulk登録時の1リクエストあたりの最大バイト数"
+    )
+
+    parser.add_argument(
+        "--thread-count",
+        type=int,
+        default=CONFIG_BULK["thread_count"],
+        help="bulk登録時の並列ワーカー数(1の場合は逐次ストリーミング)"
+    )
+
+    parser.add_argument(
+        "--versions-to-keep",
+        type=int,
+        default=CONFIG_ALIAS["versions_to_keep"],
+        help="エイリアス切り替え後に残す古いインデックスの世代数"
+    )
+
+    return parser.parse_args()
 
-    # インデックス作成
-    es.indices.create(
-        index=INDEX_NAME_DOC,
-        body={
-            "settings": {
-                "analysis": {
-                    "analyzer": {
-                        "kuromoji_analyzer": {
-                            "type": "custom",
-                            "tokenizer": "kuromoji_tokenizer",
-                            "filter": ["kuromoji_baseform", "kuromoji_part_of_speech"]
-                        }
+
+def make_embedding_mapping(
+        similarity: str = SIMILARITY,
+        index_options: dict[str, Any] = INDEX_OPTIONS,
+) -> dict[str, Any]:
+    """埋め込みベクトルのフィールドのマッピングを作成する関数
+
+    index_options.type により HNSW グラフに保持するベクトルの量子化方式を指定する:
+     - hnsw: 量子化しない(float32)
+     - int8_hnsw: 1次元あたり1バイトに量子化する(メモリ使用量は約1/4)
+     - int4_hnsw: 1次元あたり4ビットに量子化する(メモリ使用量は約1/8)
+     - bbq_hnsw: 1次元あたり1ビットに量子化する(メモリ使用量は約1/32)
+    量子化した場合も元のベクトルはディスク上に保持され,候補の再スコアリングに使用できる.
+
+    Args:
+        similarity: 類似度の算出方法(l2_norm, cosine, dot_product, max_inner_product)
+        index_options: HNSW のパラメータ(type, m, ef_construction)
+
+    Returns:
+        埋め込みベクトルのフィールドのマッピング
+    """
+    return {
+        "type": "dense_vector",
+        "dims": DIMS_EMBEDDING,  # embedding モデルに対応
+        "index": True,  # k-NN 検索を有効化
+        "similarity": similarity,
+        "index_options": dict(index_options),
+    }
+
+
+def normalize_embedding(
+        embedding: Any,
+) -> list[float]:
+    """設定に応じて埋め込みベクトルを正規化する関数
+
+    dot_product は単位ベクトルのみ登録できるため,登録前に正規化しておく.
+
+    Args:
+        embedding: 埋め込みベクトル
+
+    Returns:
+        登録用の埋め込みベクトル
+    """
+    if NORMALIZE_EMBEDDING:
+        return normalize_vectors(embedding)[0].tolist()
+    if isinstance(embedding, list):
+        return embedding
+    return embedding.tolist()
+
+
+def create_index(
+        es: Elasticsearch,
+        index_name: str,
+        similarity: str = SIMILARITY,
+        index_options: dict[str, Any] = INDEX_OPTIONS,
+) -> None:
+    """登録先のインデックスを作成する関数
+
+    日本語の全文検索のため kuromoji アナライザを適用する.
+    埋め込みベクトルの類似度および量子化方式は config.json の設定値を使用する.
+    設定により埋め込みベクトルを _source に保存しない場合は,インデックスサイズが小さくなる一方で
+    検索結果から埋め込みベクトルを取得できず,再インデックス(_reindex)もできなくなることに注意する.
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 作成するインデックス名
+        similarity: 類似度の算出方法
+        index_options: HNSW のパラメータ
+
+    Returns:
+        None
+    """
+    body = {
+        "settings": {
+            "analysis": {
+                "analyzer": {
+                    "kuromoji_analyzer": {
+                        "type": "custom",
+                        "tokenizer": "kuromoji_tokenizer",
+                        "filter": ["kuromoji_baseform", "kuromoji_part_of_speech"]
                     }
                 }
-            },
-            "mappings": {
-                "dynamic": True,  # metadata のキーが消えても動的に対応
-                "properties": {
-                    "doc_id": {"type": "keyword"},  # 元のドキュメントID
-                    "chunk_id": {"type": "integer"},  # チャンクの番号
-                    "content": {
-                        "type": "text",
-                        "analyzer": "kuromoji_analyzer"  # kuromoji アナライザを適用
-                    },
-                    "embedding": {
-                        "type": "dense_vector",
-                        "dims": DIMS_EMBEDDING,  # embedding モデルに対応
-                        "index": True,  # k-NN 検索を有効化
-                        "similarity": "l2_norm"  # ユークリッド距離で類似度計算
-                    },
-                    "metadata": {
-                        "type": "object",
-                        "dynamic": True
-                    }
+            }
+        },
+        "mappings": {
+            "dynamic": True,  # metadata のキーが消えても動的に対応
+            "properties": {
+                "doc_id": {"type": "keyword"},  # 元のドキュメントID
+                "chunk_id": {"type": "integer"},  # チャンクの番号
+                "content": {
+                    "type": "text",
+                    "analyzer": "kuromoji_analyzer"  # kuromoji アナライザを適用
+                },
+                "embedding": make_embedding_mapping(similarity, index_options),
+                "metadata": {
+                    "type": "object",
+                    "dynamic": True
                 }
             }
         }
+    }
+    if EXCLUDE_EMBEDDING_FROM_SOURCE:
+        # 埋め込みベクトルは k-NN 検索用にのみ保持し _source には保存しない
+        body["mappings"]["_source"] = {"excludes": ["embedding"]}
+    es.indices.create(index=index_name, body=body)
+
+
+def generate_docs(
+        file_name_doc: str,
+        items_for_es: Iterator[tuple[str, dict[str, Any]]],
+) -> Iterator[dict[str, Any]]:
+    """埋め込みベクトルの結果から登録用のドキュメントを生成する関数
+
+    1チャンクを1ドキュメントとする.
+
+    Args:
+        file_name_doc: 登録時のドキュメントID
+        items_for_es: チャンクIDおよび埋め込みベクトルの結果の組
+
+    Returns:
+        登録用のドキュメント
+    """
+    for key, value in items_for_es:
+        yield {
+            "doc_id": file_name_doc,
+            "chunk_id": int(key),
+            "content": value["content"],
+            "embedding": normalize_embedding(value["embedding_vector"]),
+            "metadata": value["metadata"],
+        }
+
+
+def generate_docs_from_artifact(
+        file_name_doc: str,
+        artifact: VectorArtifact,
+) -> Iterator[dict[str, Any]]:
+    """ベクトルアーティファクトから登録用のドキュメントを生成する関数
+
+    1チャンクを1ドキュメントとする.
+
+    Args:
+        file_name_doc: 登録時のドキュメントID
+        artifact: 埋め込みベクトルの結果のベクトルアーティファクト
+
+    Returns:
+        登録用のドキュメント
+    """
+    for record in artifact.iter_records():
+        yield {
+            "doc_id": file_name_doc,
+            "chunk_id": int(record["id"]),
+            "content": record["content"],
+            "embedding": normalize_embedding(record["vector"]),
+            "metadata": record["metadata"],
+        }
+
+
+def load_docs(
+        file_name_doc: str,
+        path_file: Path,
+) -> Iterator[dict[str, Any]]:
+    """埋め込みベクトルの結果ファイルから登録用のドキュメントを生成する関数
+
+    拡張子が.npyの場合はベクトルアーティファクト,.jsonlの場合は1行ずつ,それ以外はJSONとして読み込む.
+
+    Args:
+        file_name_doc: 登録時のドキュメントID
+        path_file: 埋め込みベクトルの結果ファイルのパス
+
+    Returns:
+        登録用のドキュメント
+    """
+    if Path(path_file).suffix == ".npy":
+        return generate_docs_from_artifact(file_name_doc, VectorArtifact(path_file))
+    return generate_docs(file_name_doc, iter_items(path_file, "chunk_id"))
+
+
+def get_embeddings_file(
+        doc_id: int,
+) -> Path:
+    """ドキュメントの埋め込みベクトルの結果ファイルのパスを取得する関数
+
+    JSON Lines(.jsonl)とJSON(.json)は新しい方を選択する.
+    ベクトルアーティファクト(.npy)はJSON以降に更新されている場合のみ選択する.
+
+    Args:
+        doc_id: ドキュメントの番号
+
+    Returns:
+        埋め込みベクトルの結果ファイルのパス
+    """
+    path_base = input_dir / f"{str(doc_id)}_embedding"
+    return select_vector_source(
+        path_base.with_suffix(".npy"),
+        [path_base.with_suffix(".jsonl"), path_base.with_suffix(".json")],
     )
 
-    # 各ドキュメントのチャンク,埋め込みベクトル,およびメタデータを Elasticsearch に登録
-    for doc_id in range(1, DOCS_NUM+1):
-        file_name_doc = f"{str(doc_id)}.pdf"
-        path_file_json = input_dir / f"{str(doc_id)}_embedding.json"
-        data_for_es = json_to_dict(path_file_json)
-        for key, value in data_for_es.items():
-            chunk_id = int(key)
-            chunk_content = value["content"]
-            chunk_embedding_vector = value["embedding_vector"]
-            chunk_metadata = value["metadata"]
-
-            # Elasticsearch に登録
-            doc = {
-                "doc_id": file_name_doc,
-                "chunk_id": chunk_id,
-                "content": chunk_content,
-                "embedding": chunk_embedding_vector,
-                "metadata": chunk_metadata,
-            }
-            es.index(index=INDEX_NAME_DOC, body=doc)
+
+def set_bulk_settings(
+        es: Elasticsearch,
+        index_name: str,
+) -> dict[str, Any]:
+    """bulk登録向けにインデックス設定を変更する関数
+
+    登録中はリフレッシュとレプリカを無効化する.
+    登録後の復元用に変更前の設定値を返却する.
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 対象のインデックス名
+
+    Returns:
+        変更前のインデックス設定
+    """
+    current = es.indices.get_settings(
+        index=index_name,
+        include_defaults=True,
+    )[index_name]
+    settings = {**current["defaults"]["index"], **current["settings"]["index"]}
+    original_settings = {
+        "refresh_interval": settings.get("refresh_interval", "1s"),
+        "number_of_replicas": settings.get("number_of_replicas", "1"),
+    }
+    es.indices.put_settings(
+        index=index_name,
+        body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}},
+    )
+    return original_settings
+
+
+def restore_settings(
+        es: Elasticsearch,
+        index_name: str,
+        original_settings: dict[str, Any],
+) -> None:
+    """bulk登録向けに変更したインデックス設定を復元する関数
+
+    復元後にリフレッシュし,登録したデータを検索可能にする.
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 対象のインデックス名
+        original_settings: 変更前のインデックス設定
+
+    Returns:
+        None
+    """
+    es.indices.put_settings(
+        index=index_name,
+        body={"index": original_settings},
+    )
+    es.indices.refresh(index=index_name)
+
+
+def bulk_docs(
+        es: Elasticsearch,
+        index_name: str,
+        docs: Iterator[dict[str, Any]],
+        chunk_size: int,
+        max_chunk_bytes: int,
+        thread_count: int,
+) -> tuple[int, int]:
+    """_bulk API によりドキュメントを登録する関数
+
+    並列ワーカー数が1の場合は streaming_bulk,2以上の場合は parallel_bulk を使用する.
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 登録先のインデックス名
+        docs: 登録対象のドキュメント
+        chunk_size: 1リクエストあたりの最大チャンク数
+        max_chunk_bytes: 1リクエストあたりの最大バイト数
+        thread_count: 並列ワーカー数
+
+    Returns:
+        登録に成功した件数および失敗した件数
+    """
+    actions = (
+        {"_index": index_name, "_source": doc} for doc in docs
+    )
+    if thread_count <= 1:
+        results = streaming_bulk(
+            es,
+            actions,
+            chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes,
+            raise_on_error=False,
+        )
+    else:
+        results = parallel_bulk(
+            es,
+            actions,
+            thread_count=thread_count,
+            queue_size=CONFIG_BULK["queue_size"],
+            chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes,
+            raise_on_error=False,
+        )
+
+    success, failed = 0, 0
+    for ok, item in results:
+        if ok:
+            success += 1
+        else:
+            failed += 1
+            print(f"failed: {item}")
+    return success, failed
+
+
+def store_embeddings_file(
+        es: Elasticsearch,
+        index_name: str,
+        file_name_doc: str,
+        path_file: Path,
+        chunk_size: int = CONFIG_BULK["chunk_size"],
+        max_chunk_bytes: int = CONFIG_BULK["max_chunk_bytes"],
+        thread_count: int = CONFIG_BULK["thread_count"],
+) -> tuple[int, int]:
+    """1ドキュメント分の埋め込みベクトルの結果ファイルを bulk 登録する関数
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 登録先のインデックス名
+        file_name_doc: 登録時のドキュメントID
+        path_file: 埋め込みベクトルの結果ファイル(.json, .jsonl または .npy)のパス
+        chunk_size: 1リクエストあたりの最大チャンク数
+        max_chunk_bytes: 1リクエストあたりの最大バイト数
+        thread_count: 並列ワーカー数
+
+    Returns:
+        登録に成功した件数および失敗した件数
+    """
+    return bulk_docs(
+        es,
+        index_name,
+        load_docs(file_name_doc, path_file),
+        chunk_size=chunk_size,
+        max_chunk_bytes=max_chunk_bytes,
+        thread_count=thread_count,
+    )
+
+
+def make_versioned_index_name(
+        alias: str,
+) -> str:
+    """エイリアスの参照先とするバージョン付きのインデックス名を作成する関数
+
+    日時を付与するため,インデックス名の昇順は作成順と一致する.
+
+    Args:
+        alias: エイリアス名
+
+    Returns:
+        バージョン付きのインデックス名
+    """
+    return f"{alias}_v{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+
+
+def get_alias_indices(
+        es: Elasticsearch,
+        alias: str,
+) -> list[str]:
+    """エイリアスの参照先のインデックス名を取得する関数
+
+    Args:
+        es: Elasticsearch クライアント
+        alias: エイリアス名
+
+    Returns:
+        参照先のインデックス名群(エイリアスが存在しない場合は空)
+    """
+    if not es.indices.exists_alias(name=alias):
+        return []
+    return sorted(es.indices.get_alias(name=alias).keys())
+
+
+def get_versioned_indices(
+        es: Elasticsearch,
+        alias: str,
+) -> list[str]:
+    """エイリアスに対応するバージョン付きのインデックス名を作成順に取得する関数
+
+    Args:
+        es: Elasticsearch クライアント
+        alias: エイリアス名
+
+    Returns:
+        バージョン付きのインデックス名群
+    """
+    response = es.indices.get(index=f"{alias}_v*", allow_no_indices=True)
+    return sorted(response.keys())
+
+
+def finalize_index(
+        es: Elasticsearch,
+        index_name: str,
+        original_settings: dict[str, Any],
+) -> None:
+    """登録完了後のインデックスを検索向けに仕上げる関数
+
+    bulk登録向けの設定を復元したうえで1セグメントにマージする.
+    切り替え前のインデックスは書き込みがないため,マージによりセグメント数と HNSW グラフ数を最小化できる.
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 対象のインデックス名
+        original_settings: 変更前のインデックス設定
+
+    Returns:
+        None
+    """
+    restore_settings(es, index_name, original_settings)
+    es.indices.forcemerge(
+        index=index_name,
+        max_num_segments=1,
+        request_timeout=3600,
+    )
+    es.indices.refresh(index=index_name)
+
+
+def warm_index(
+        es: Elasticsearch,
+        index_name: str,
+        num_queries: int = CONFIG_ALIAS["num_warmup_queries"],
+        seed: int = 0,
+) -> None:
+    """切り替え前のインデックスに検索を実行しキャッシュを温める関数
+
+    無作為なベクトルによる kNN 検索で HNSW グラフおよびベクトルをページキャッシュに読み込む.
+    切り替え直後の検索でディスク読み込みによりレイテンシが悪化することを防ぐ.
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 対象のインデックス名
+        num_queries: 検索の回数
+        seed: 乱数のシード
+
+    Returns:
+        None
+    """
+    rng = np.random.default_rng(seed)
+    for _ in range(num_queries):
+        query_vector = normalize_vectors(
+            rng.standard_normal(DIMS_EMBEDDING))[0].tolist()
+        es.search(
+            index=index_name,
+            knn={
+                "field": "embedding",
+                "query_vector": query_vector,
+                "k": 10,
+                "num_candidates": 100,
+            },
+            size=10,
+            source=False,
+        )
+
+
+def swap_alias(
+        es: Elasticsearch,
+        alias: str,
+        index_name: str,
+) -> None:
+    """エイリアスの参照先を指定したインデックスに切り替える関数
+
+    参照先の追加と既存の参照先の削除を1リクエストで実行するため,切り替えはアトミックである.
+    エイリアスと同名のインデックス(バージョン管理前のインデックス)が存在する場合は同じリクエストで削除する.
+
+    Args:
+        es: Elasticsearch クライアント
+        alias: エイリアス名
+        index_name: 新たな参照先のインデックス名
+
+    Returns:
+        None
+    """
+    actions = [{"add": {"index": index_name, "alias": alias}}]
+    for index_old in get_alias_indices(es, alias):
+        if index_old != index_name:
+            actions.append({"remove": {"index": index_old, "alias": alias}})
+    if es.indices.exists(index=alias) and not es.indices.exists_alias(name=alias):
+        actions.append({"remove_index": {"index": alias}})
+    es.indices.update_aliases(actions=actions)
+
+
+def delete_old_indices(
+        es: Elasticsearch,
+        alias: str,
+        versions_to_keep: int = CONFIG_ALIAS["versions_to_keep"],
+) -> list[str]:
+    """エイリアスの参照先でない古いインデックスを削除する関数
+
+    切り戻し用に新しいものから versions_to_keep 世代は残す.
+
+    Args:
+        es: Elasticsearch クライアント
+        alias: エイリアス名
+        versions_to_keep: 残す古いインデックスの世代数
+
+    Returns:
+        削除したインデックス名群
+    """
+    indices_current = set(get_alias_indices(es, alias))
+    indices_old = [
+        index_name for index_name in get_versioned_indices(es, alias)
+        if index_name not in indices_current
+    ]
+    indices_delete = indices_old[:max(len(indices_old) - versions_to_keep, 0)]
+    for index_name in indices_delete:
+        es.indices.delete(index=index_name)
+    return indices_delete
+
+
+def build_index(
+        es: Elasticsearch,
+        files: list[tuple[str, Path]],
+        mode: str = "bulk",
+        chunk_size: int = CONFIG_BULK["chunk_size"],
+        max_chunk_bytes: int = CONFIG_BULK["max_chunk_bytes"],
+        thread_count: int = CONFIG_BULK["thread_count"],
+) -> str:
+    """新たなバージョンのインデックスを作成し全ドキュメントを登録する関数
+
+    エイリアスの参照先は変更しないため,登録中も既存のインデックスを検索できる.
+    登録に失敗した場合(一部のチャンクの失敗を含む)は作成途中のインデックスを削除して例外を送出する.
+
+    Args:
+        es: Elasticsearch クライアント
+        files: 登録時のドキュメントIDおよび埋め込みベクトルの結果ファイルのパスの組
+        mode: 登録方法(bulk または index)
+        chunk_size: bulk登録時の1リクエストあたりの最大チャンク数
+        max_chunk_bytes: bulk登録時の1リクエストあたりの最大バイト数
+        thread_count: bulk登録時の並列ワーカー数
+
+    Returns:
+        登録が完了したインデックス名
+    """
+    index_name = make_versioned_index_name(INDEX_NAME_DOC)
+    create_index(es, index_name)
+    print(f"Index '{index_name}' created.")
+
+    try:
+        if mode == "index":
+            for file_name_doc, path_file in files:
+                for doc in load_docs(file_name_doc, path_file):
+                    es.index(index=index_name, body=doc)
+            es.indices.refresh(index=index_name)
+
+        else:
+            original_settings = set_bulk_settings(es, index_name)
+            total_success, total_failed, total_time = 0, 0, 0.0
+            for file_name_doc, path_file in files:
+                # ドキュメント単位で登録のスループットを計測
+                time_start = time.perf_counter()
+                success, failed = store_embeddings_file(
+                    es,
+                    index_name,
+                    file_name_doc,
+                    path_file,
+                    chunk_size=chunk_size,
+                    max_chunk_bytes=max_chunk_bytes,
+                    thread_count=thread_count,
+                )
+                elapsed = time.perf_counter() - time_start
+                total_success += success
+                total_failed += failed
+                total_time += elapsed
+                print(
+                    f"{file_name_doc}: {success} chunks ({failed} failed) "
+                    f"in {elapsed:.2f}s ({success / max(elapsed, 1e-9):.1f} chunks/s)"
+                )
+            print(
+                f"total: {total_success} chunks ({total_failed} failed) in {total_time:.2f}s "
+                f"({total_success / max(total_time, 1e-9):.1f} chunks/s)"
+            )
+            if total_failed > 0:
+                # 一部のチャンクが欠けたインデックスは公開しない
+                raise RuntimeError(
+                    f"{total_failed} chunks failed to be indexed into '{index_name}'")
+
+            # 登録完了後にマージしてからキャッシュを温める
+            finalize_index(es, index_name, original_settings)
+    except BaseException:
+        # 登録に失敗した場合は作成途中のインデックスを削除し,エイリアスの参照先は変更しない
+        es.indices.delete(index=index_name)
+        print(f"Index '{index_name}' deleted. Alias '{INDEX_NAME_DOC}' is unchanged.")
+        raise
+    return index_name
+
+
+def publish_index(
+        es: Elasticsearch,
+        index_name: str,
+        versions_to_keep: int = CONFIG_ALIAS["versions_to_keep"],
+) -> None:
+    """登録が完了したインデックスをエイリアスの参照先として公開する関数
+
+    キャッシュを温めてからエイリアスの参照先を切り替え,古いインデックスを削除する.
+
+    Args:
+        es: Elasticsearch クライアント
+        index_name: 公開するインデックス名
+        versions_to_keep: 切り替え後に残す古いインデックスの世代数
+
+    Returns:
+        None
+    """
+    warm_index(es, index_name)
+
+    # エイリアスの参照先を切り替え,古いインデックスを削除
+    swap_alias(es, INDEX_NAME_DOC, index_name)
+    print(f"Alias '{INDEX_NAME_DOC}' -> '{index_name}'")
+    for index_old in delete_old_indices(es, INDEX_NAME_DOC, versions_to_keep):
+        print(f"Index '{index_old}' deleted.")
+
+
+def main():
+    args = parse_arguments()
+
+    # Elasticsearch に接続
+    es = Elasticsearch(URL)
+
+    # 各ドキュメントのチャンク,埋め込みベクトル,およびメタデータを新たなバージョンのインデックスに登録
+    files = [
+        (f"{str(doc_id)}.pdf", get_embeddings_file(doc_id))
+        for doc_id in range(1, DOCS_NUM+1)
+    ]
+    index_name = build_index(
+        es,
+        files,
+        mode=args.mode,
+        chunk_size=args.chunk_size,
+        max_chunk_bytes=args.max_chunk_bytes,
+        thread_count=args.thread_count,
+    )
+    publish_index(es, index_name, args.versions_to_keep)
 
     print("Document added successfully!")
 
@@ -0,0 +1,240 @@
+"""回答モードごとの回答精度と回答作成のレイテンシを比較するスクリプト
+
+正解付きの質問データを読み込み,検索を1度だけ実行したうえで,回答モード(two_pass / fused)ごとに同じ検索結果から回答を作成する.
+回答モードごとに以下を出力する:
+ - exact: 正規化した回答と正解の完全一致率
+ - f1: 正規化した回答と正解の文字単位の F1 スコアの平均
+ - unknown: 「分かりません」と回答した割合
+ - mean/p50/p95: 1件あたりの回答作成(回答生成および回答加工)のレイテンシ
+
+指標はいずれもローカルで算出できる簡易的なものであり,コンペの評価方法とは一致しない.
+応答のキャッシュが有効な場合はキャッシュ済の応答のレイテンシが小さくなるため,レイテンシの比較時は config.json の cache.enabled を無効にする.
+スクリプト実行前に,make_csv_submission.py と同じファイルに加えて以下のファイルをinputディレクトリに格納しておく.
+ - query_labeled.csv: 正解付きの質問データ(質問番号,質問,正解の順の列を持つ)
+"""
+import argparse
+import re
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from common.cache_utils import get_response_cache
+from common.file_utils import csv_to_list, list_to_csv
+from common.load_config import get_input_dir, get_output_dir, load_config
+from make_csv_submission import (load_companies, make_answer,
+                                 make_company_resolver, make_information,
+                                 retrieve_queries)
+
+config = load_config()
+input_dir = get_input_dir()
+output_dir = get_output_dir()
+CONFIG_SUBMISSION = config["submission"]
+CONFIG_COMPANY_RESOLVER = config["company_resolver"]
+
+ANSWER_MODES = ["two_pass", "fused"]
+
+# 比較時に無視する記号(空白,句読点など)
+IGNORED_CHARS = re.compile(r"[\s、。,.，．・「」『』\"']")
+
+
+def parse_arguments() -> argparse.Namespace:
+    """コマンドライン引数をパースする関数"""
+    parser = argparse.ArgumentParser(
+        description="正解付きの質問データで回答モードごとの回答精度とレイテンシを比較する"
+    )
+
+    parser.add_argument(
+        "-f",
+        "--labeled-file",
+        type=str,
+        default="query_labeled.csv",
+        help="inputディレクトリ内の正解付きの質問データのファイル名"
+    )
+
+    parser.add_argument(
+        "-a",
+        "--answer-modes",
+        type=str,
+        nargs="+",
+        choices=ANSWER_MODES,
+        default=ANSWER_MODES,
+        help="比較対象の回答モードを1個以上指定する"
+    )
+
+    parser.add_argument(
+        "--strip-company-locally",
+        action=argparse.BooleanOptionalAction,
+        default=CONFIG_SUBMISSION["strip_company_locally"],
+        help="企業名のみLLMで抽出し,クエリから企業名を除く処理をローカルで行う"
+    )
+
+    parser.add_argument(
+        "--local-resolver",
+        action=argparse.BooleanOptionalAction,
+        default=CONFIG_COMPANY_RESOLVER["enabled"],
+        help="既知の企業名との照合により企業をローカルで特定し,特定できない場合のみLLMおよび埋め込みを使用する"
+    )
+
+    return parser.parse_args()
+
+
+def load_labeled_rows(
+        path_labeled_file: Path,
+) -> tuple[list[list[str]], list[str]]:
+    """正解付きの質問データを読み込む関数
+
+    正解の列がない,または正解が空の行は評価の対象外とし,その質問番号を表示する.
+
+    Args:
+        path_labeled_file: 正解付きの質問データのパス
+
+    Returns:
+        正解のある質問データの行および正解
+    """
+    rows, labels, query_nos_skipped = [], [], []
+    for row in csv_to_list(path_labeled_file)[1:]:  # ヘッダーを飛ばす
+        if not row:
+            continue
+        if len(row) < 3 or not row[2].strip():
+            query_nos_skipped.append(row[0])
+            continue
+        rows.append(row)
+        labels.append(row[2])
+    if query_nos_skipped:
+        print(
+            f"warning: skipped {len(query_nos_skipped)} rows without a label "
+            f"(query_no: {', '.join(query_nos_skipped)})"
+        )
+    if not rows:
+        raise ValueError(
+            f"no labeled rows in '{path_labeled_file}' "
+            "(expected columns: query_no, query, label)"
+        )
+    return rows, labels
+
+
+def normalize_answer(
+        text: str,
+) -> str:
+    """比較用に回答を正規化する関数
+
+    NFKC 正規化,小文字化を行い,空白および句読点などの記号を除く.
+
+    Args:
+        text: 正規化対象の回答
+
+    Returns:
+        正規化後の回答
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return IGNORED_CHARS.sub("", text)
+
+
+def calc_char_f1(
+        prediction: str,
+        label: str,
+) -> float:
+    """回答と正解の文字単位の F1 スコアを算出する関数
+
+    Args:
+        prediction: 正規化済の回答
+        label: 正規化済の正解
+
+    Returns:
+        F1 スコア
+    """
+    if (not prediction) or (not label):
+        return float(prediction == label)
+    num_common = sum((Counter(prediction) & Counter(label)).values())
+    if num_common == 0:
+        return 0.0
+    precision = num_common / len(prediction)
+    recall = num_common / len(label)
+    return 2 * precision * recall / (precision + recall)
+
+
+def evaluate_answers(
+        predictions: list[str],
+        labels: list[str],
+        latencies: list[float],
+) -> dict[str, float]:
+    """回答モードごとの評価指標を算出する関数
+
+    Args:
+        predictions: 質問ごとの回答
+        labels: 質問ごとの正解
+        latencies: 質問ごとの回答作成のレイテンシ(秒)
+
+    Returns:
+        評価指標
+    """
+    if not predictions:
+        raise ValueError("no answers to evaluate")
+    normalized = [
+        (normalize_answer(prediction), normalize_answer(label))
+        for prediction, label in zip(predictions, labels)
+    ]
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {
+        "exact": float(np.mean([p == l for p, l in normalized])),
+        "f1": float(np.mean([calc_char_f1(p, l) for p, l in normalized])),
+        "unknown": float(np.mean([
+            prediction == "分かりません" for prediction in predictions])),
+        "mean": float(np.mean(latencies)),
+        "p50": float(p50),
+        "p95": float(p95),
+    }
+
+
+def main():
+    args = parse_arguments()
+    path_labeled_file = input_dir / args.labeled_file
+    path_result_file = output_dir / "eval_answer_modes.csv"
+
+    rows, labels = load_labeled_rows(path_labeled_file)
+    company_index, company_names = load_companies()
+    company_resolver = make_company_resolver(
+        company_names, args.local_resolver)
+
+    if get_response_cache() is not None:
+        print("warning: response cache is enabled; latencies include cache hits")
+
+    # 回答モードによらず検索結果は共通のため,検索は1度だけ実行する
+    es_search_results_all = retrieve_queries(
+        rows, company_index, args.strip_company_locally, company_resolver)
+    informations = [
+        make_information(es_search_results)
+        for es_search_results in es_search_results_all
+    ]
+
+    predictions_by_mode = {}
+    for answer_mode in args.answer_modes:
+        predictions, latencies = [], []
+        for row, information in zip(rows, informations):
+            time_start = time.perf_counter()
+            predictions.append(make_answer(row[1], information, answer_mode))
+            latencies.append(time.perf_counter() - time_start)
+        predictions_by_mode[answer_mode] = predictions
+
+        metrics = evaluate_answers(predictions, labels, latencies)
+        print(
+            f"{answer_mode}: exact {metrics['exact']:.3f}, f1 {metrics['f1']:.3f}, "
+            f"unknown {metrics['unknown']:.3f}, "
+            f"mean {metrics['mean'] * 1000:.0f} ms, "
+            f"p50 {metrics['p50'] * 1000:.0f} ms, p95 {metrics['p95'] * 1000:.0f} ms"
+        )
+
+    # 質問ごとの回答を保存する
+    results = [["query_no", "query", "label", *args.answer_modes]]
+    for i, row in enumerate(rows):
+        results.append([
+            row[0], row[1], labels[i],
+            *[predictions_by_mode[mode][i] for mode in args.answer_modes],
+        ])
+    list_to_csv(results, path_result_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,34 +4,117 @@
 スクリプト実行前に,回答生成に使用する以下のファイルをinputディレクトリに決められたファイル名で格納しておく.
  - query.csv: 質問データ
  - company_embedding.json: 各ドキュメントの企業名および企業名の埋め込みベクトルデータ
+   make_npy_vectors_from_json.py で変換した company_embedding.npy (および付随ファイル)が存在する場合はそちらを使用する
+
+実行モードは以下から選択する:
+ - sync: 質問を1件ずつ順番に処理する
+ - async: 指定した並列数の上限まで質問を同時に処理する
+
+回答モードは以下から選択する:
+ - two_pass: 回答生成および回答加工を順に実行する(Chatモデルを2回実行する)
+ - fused: 回答生成および回答加工を1回のChatモデルの実行で行う
 """
-from az_openai_model import AOAIEmbeddingModel
-from common.calc_utils import get_similar_vectors
+import argparse
+import asyncio
+import re
+
+from az_openai_model import AOAIEmbeddingModel, AsyncAOAIEmbeddingModel
+from common.cache_utils import get_response_cache
+from common.calc_utils import VectorIndex
+from common.company_resolver import CompanyResolver
 from common.file_utils import csv_to_list, json_to_dict, list_to_csv
 from common.load_config import get_input_dir, get_output_dir, load_config
-from elasticsearch_retrieve_data import ElasticsearchRetrivation
-from openai_model import OpenAIChatModel
-from rag import generate_answer, process_answer
+from common.model_request import StructuredOutputError
+from common.vector_utils import VectorArtifact, select_vector_source
+from elasticsearch_retrieve_data import (AsyncElasticsearchRetrivation,
+                                         ElasticsearchRetrivation)
+from openai_model import get_async_openai_chat_model, get_openai_chat_model
+from rag import (generate_answer, generate_answer_async,
+                 generate_processed_answer, generate_processed_answer_async,
+                 process_answer, process_answer_async)
+from typing_extensions import Any
 
 config = load_config()
 input_dir = get_input_dir()
 output_dir = get_output_dir()
 MAX_TOKENS_ANSWER = config["rules"]["max_tokens_answer"]
+CONFIG_SUBMISSION = config["submission"]
+CONFIG_COMPANY_RESOLVER = config["company_resolver"]
 
+# 企業名および企業情報を除いたクエリの応答のJSONスキーマ
+SCHEMA_COMPANY_AND_QUERY = {
+    "name": "company_and_query",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "company_name": {"type": "string"},
+            "query_non_company": {"type": "string"},
+        },
+        "required": ["company_name", "query_non_company"],
+        "additionalProperties": False,
+    },
+}
 
-def extract_company_name(
-        text: str,
-) -> str:
-    """テキストから企業名を抽出する関数
 
-    企業名の抽出に OpenAI のChatモデルを使用する.
+def parse_arguments() -> argparse.Namespace:
+    """コマンドライン引数をパースする関数"""
+    parser = argparse.ArgumentParser(
+        description="質問データに対する回答をRAGで生成し提出用の.csvを作成する"
+    )
+
+    parser.add_argument(
+        "-m",
+        "--mode",
+        type=str,
+        choices=["sync", "async"],
+        default=CONFIG_SUBMISSION["mode"],
+        help="実行モードを指定する"
+    )
+
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=CONFIG_SUBMISSION["concurrency"],
+        help="asyncモードで同時に処理する質問数の上限"
+    )
+
+    parser.add_argument(
+        "--strip-company-locally",
+        action=argparse.BooleanOptionalAction,
+        default=CONFIG_SUBMISSION["strip_company_locally"],
+        help="企業名のみLLMで抽出し,クエリから企業名を除く処理をローカルで行う"
+    )
+
+    parser.add_argument(
+        "--local-resolver",
+        action=argparse.BooleanOptionalAction,
+        default=CONFIG_COMPANY_RESOLVER["enabled"],
+        help="既知の企業名との照合により企業をローカルで特定し,特定できない場合のみLLMおよび埋め込みを使用する"
+    )
+
+    parser.add_argument(
+        "-a",
+        "--answer-mode",
+        type=str,
+        choices=["two_pass", "fused"],
+        default=CONFIG_SUBMISSION["answer_mode"],
+        help="回答モードを指定する"
+    )
+
+    return parser.parse_args()
+
+
+def make_prompt_extract_company_name(
+        text: str,
+) -> tuple[str, str]:
+    """企業名抽出のプロンプトを作成する関数
 
     Args:
         text: 企業名を含むことが想定されるテキスト
 
     Returns:
-        企業名
-        抽出できない場合はハイフン(-)を想定
+        システムプロンプトおよびユーザープロンプト
     """
     system_content = (
         "あなたは優秀な企業名抽出アシスタントです．"
@@ -46,27 +129,54 @@ def extract_company_name(
         " - 回答には企業名のみ含めること\n"
         " - 企業名が含まれない場合はハイフン(-)と回答すること"
     )
-    obj_chat_model = OpenAIChatModel(system_content)
-    company_name = obj_chat_model.get_response_only_text(
-        user_content, temperature=0)
 
-    return company_name
+    return system_content, user_content
 
 
-def extract_company_name_from_query(
+def make_prompt_extract_company_and_query(
         query: str,
-        company_name: str,
-) -> str:
-    """クエリに含まれる企業情報を除く関数
+) -> tuple[str, str]:
+    """企業名抽出およびクエリから企業情報を除くプロンプトを作成する関数
 
-    企業情報を除いたクエリの作成に OpenAI のChatモデルを使用する.
+    企業名と企業情報を除いたクエリを1回の応答で取得する.
+
+    Args:
+        query: クエリ
+
+    Returns:
+        システムプロンプトおよびユーザープロンプト
+    """
+    system_content = (
+        "あなたは優秀な企業名抽出アシスタント兼編集者です．"
+        "ユーザーの指示に従い企業名を抽出し，文章を直してください．"
+    )
+    user_content = (
+        "以下の<question>タグには，ある企業のESG（環境・社会・ガバナンス）レポートや統合報告書に関する質問文が含まれています．\n\n"
+        f"<question>{query}</question>\n\n"
+        "<question>タグの質問について，以下の2点を回答してください．\n"
+        " - company_name: 質問の対象の企業名．企業名のみ含め，企業名が含まれない場合はハイフン(-)とすること\n"
+        " - query_non_company: 質問をより簡潔な表現にするために企業の情報を除いた質問．"
+        "企業名が含まれない場合は質問をそのまま回答すること\n"
+        "ただし，回答には以下の点に留意してください:\n"
+        " - <question>タグの内容を参考にするが，回答に<question>タグを含めないこと\n"
+        " - 企業の情報を除く以外は質問の内容を大きく意味を変えないこと"
+    )
+
+    return system_content, user_content
+
+
+def make_prompt_extract_company_name_from_query(
+        query: str,
+        company_name: str,
+) -> tuple[str, str]:
+    """クエリから企業情報を除くプロンプトを作成する関数
 
     Args:
         query: クエリ
         company_name: 企業名
 
     Returns:
-        企業名を除いたクエリ
+        システムプロンプトおよびユーザープロンプト
     """
     system_content = (
         "あなたは優秀な編集者です．"
@@ -80,83 +190,709 @@ def extract_company_name_from_query(
         " - <question>タグの内容を参考にするが，編集結果に<question>タグを含めないこと\n"
         " - それ以外は質問の内容を大きく意味を変えないこと"
     )
-    obj_chat_model = OpenAIChatModel(system_content)
+
+    return system_content, user_content
+
+
+def strip_company_name(
+        query: str,
+        company_name: str,
+) -> str | None:
+    """クエリから企業名をローカルで除く関数
+
+    企業名がクエリにそのまま含まれる場合のみ,企業名と直後の助詞(の,は,が)を除く.
+
+    Args:
+        query: クエリ
+        company_name: 企業名
+
+    Returns:
+        企業名を除いたクエリ
+        企業名がクエリに含まれない場合は None
+    """
+    if (not company_name) or (company_name not in query):
+        return None
+    query_non_company = re.sub(
+        f"[「『]?{re.escape(company_name)}[」』]?[のはが]?", "", query)
+    query_non_company = query_non_company.strip(" 　、,")
+    return query_non_company or None
+
+
+def normalize_company_name(
+        company_name: str | None,
+) -> str:
+    """抽出した企業名の前後の空白を除き,企業名がない場合の表記をハイフン(-)にそろえる関数
+
+    空文字列や空白のみ,前後に空白のあるハイフン(" - " など)は企業名がないものとして扱う.
+    企業名の埋め込みの対象に空の入力が含まれないようにする.
+
+    Args:
+        company_name: Chatモデルが抽出した企業名
+
+    Returns:
+        企業名(企業名がない場合はハイフン(-))
+    """
+    company_name = (company_name or "").strip(" 　\t\r\n")
+    if company_name in ("", "-", "－"):
+        return "-"
+    return company_name
+
+
+def make_company_and_query(
+        query: str,
+        company_name: str,
+        query_non_company: str | None = None,
+) -> tuple[str, str]:
+    """抽出した企業名から企業名および企業情報を除いたクエリの組を作成する関数
+
+    企業名は normalize_company_name で正規化する.
+    企業情報を除いたクエリが与えられない場合は,クエリから企業名をローカルで除く.
+    いずれの場合も企業情報を除いたクエリが空の場合は元のクエリを使用する.
+
+    Args:
+        query: クエリ
+        company_name: 抽出した企業名(抽出できない場合はハイフン(-))
+        query_non_company: Chatモデルが作成した企業情報を除いたクエリ
+
+    Returns:
+        企業名および企業情報を除いたクエリ
+    """
+    company_name = normalize_company_name(company_name)
+    if company_name == "-":
+        return company_name, query
+    if query_non_company is None:
+        query_non_company = strip_company_name(query, company_name)
+    return company_name, (query_non_company or "").strip() or query
+
+
+def extract_company_name(
+        text: str,
+) -> str:
+    """テキストから企業名を抽出する関数
+
+    企業名の抽出に OpenAI のChatモデルを使用する.
+
+    Args:
+        text: 企業名を含むことが想定されるテキスト
+
+    Returns:
+        企業名
+        抽出できない場合はハイフン(-)を想定
+    """
+    system_content, user_content = make_prompt_extract_company_name(text)
+    obj_chat_model = get_openai_chat_model()
+    company_name = obj_chat_model.get_response_only_text(
+        user_content, temperature=0, system_content=system_content)
+
+    return company_name
+
+
+def extract_company_name_from_query(
+        query: str,
+        company_name: str,
+) -> str:
+    """クエリに含まれる企業情報を除く関数
+
+    企業情報を除いたクエリの作成に OpenAI のChatモデルを使用する.
+
+    Args:
+        query: クエリ
+        company_name: 企業名
+
+    Returns:
+        企業名を除いたクエリ
+    """
+    system_content, user_content = make_prompt_extract_company_name_from_query(
+        query, company_name)
+    obj_chat_model = get_openai_chat_model()
     query_non_company = obj_chat_model.get_response_only_text(
-        user_content, temperature=0)
+        user_content, temperature=0, system_content=system_content)
 
     return query_non_company
 
 
-def main():
-    path_query_file = input_dir / "query.csv"
-    path_company_file = input_dir / "company_embedding.json"
-    path_answer_file = output_dir / "predictions.csv"
+def extract_company_and_query(
+        query: str,
+        strip_locally: bool = False,
+) -> tuple[str, str]:
+    """クエリから企業名を抽出し,企業情報を除いたクエリを作成する関数
 
-    queries = csv_to_list(path_query_file)  # ヘッダー含む
-    answers = []  # 生成された回答を格納する
+    企業名の抽出およびクエリの編集は OpenAI のChatモデルの1回の実行(JSONスキーマ指定)で行う.
+    JSONスキーマに沿った応答を取得できない場合は,企業名の抽出とクエリの編集を個別に実行する.
+    strip_locally を指定した場合は企業名のみ抽出し,クエリの編集はローカルで行う.
+    このとき企業名がクエリにそのまま含まれない場合は元のクエリを使用する.
 
-    obj_aoai_embedding = AOAIEmbeddingModel()
-    obj_es_retrievation = ElasticsearchRetrivation()
+    Args:
+        query: クエリ
+        strip_locally: クエリの編集をローカルで行うか否かのフラグ
 
-    dict_companies = json_to_dict(path_company_file)
-    dict_for_similality = {}
-    for doc_id, company_info in dict_companies.items():
-        dict_for_similality[doc_id] = company_info["company_vector"]
+    Returns:
+        企業名(抽出できない場合はハイフン(-))および企業情報を除いたクエリ
+    """
+    if strip_locally:
+        return make_company_and_query(query, extract_company_name(query))
 
-    for row in queries[1:]:  # ヘッダーを飛ばす
-        query_no = row[0]
-        query = row[1]
-        query_vector = obj_aoai_embedding.get_response(query)
-        query_company = extract_company_name(query)
+    system_content, user_content = make_prompt_extract_company_and_query(query)
+    obj_chat_model = get_openai_chat_model()
+    try:
+        response = obj_chat_model.get_response_json(
+            user_content,
+            SCHEMA_COMPANY_AND_QUERY,
+            temperature=0,
+            system_content=system_content,
+        )
+    except StructuredOutputError as e:
+        # JSONの応答を取得できない場合は企業名の抽出とクエリの編集を個別に実行する
+        print(f"company extraction failed ({e}), falling back to two calls")
+        company_name = normalize_company_name(extract_company_name(query))
+        if company_name == "-":
+            return company_name, query
+        return make_company_and_query(
+            query, company_name, extract_company_name_from_query(query, company_name))
+    return make_company_and_query(
+        query, response["company_name"], response["query_non_company"])
+
+
+async def extract_company_name_async(
+        text: str,
+) -> str:
+    """テキストから企業名を非同期で抽出する関数
+
+    処理内容は extract_company_name と同一である.
+
+    Args:
+        text: 企業名を含むことが想定されるテキスト
+
+    Returns:
+        企業名
+        抽出できない場合はハイフン(-)を想定
+    """
+    system_content, user_content = make_prompt_extract_company_name(text)
+    obj_chat_model = get_async_openai_chat_model()
+    company_name = await obj_chat_model.get_response_only_text(
+        user_content, temperature=0, system_content=system_content)
+
+    return company_name
+
+
+async def extract_company_name_from_query_async(
+        query: str,
+        company_name: str,
+) -> str:
+    """クエリに含まれる企業情報を非同期で除く関数
+
+    処理内容は extract_company_name_from_query と同一である.
+
+    Args:
+        query: クエリ
+        company_name: 企業名
 
-        # クエリから企業名を抽出できた場合はElasticsearchの検索対象を絞る
+    Returns:
+        企業名を除いたクエリ
+    """
+    system_content, user_content = make_prompt_extract_company_name_from_query(
+        query, company_name)
+    obj_chat_model = get_async_openai_chat_model()
+    query_non_company = await obj_chat_model.get_response_only_text(
+        user_content, temperature=0, system_content=system_content)
+
+    return query_non_company
+
+
+async def extract_company_and_query_async(
+        query: str,
+        strip_locally: bool = False,
+) -> tuple[str, str]:
+    """クエリから企業名を非同期で抽出し,企業情報を除いたクエリを作成する関数
+
+    処理内容は extract_company_and_query と同一である.
+
+    Args:
+        query: クエリ
+        strip_locally: クエリの編集をローカルで行うか否かのフラグ
+
+    Returns:
+        企業名(抽出できない場合はハイフン(-))および企業情報を除いたクエリ
+    """
+    if strip_locally:
+        return make_company_and_query(query, await extract_company_name_async(query))
+
+    system_content, user_content = make_prompt_extract_company_and_query(query)
+    obj_chat_model = get_async_openai_chat_model()
+    try:
+        response = await obj_chat_model.get_response_json(
+            user_content,
+            SCHEMA_COMPANY_AND_QUERY,
+            temperature=0,
+            system_content=system_content,
+        )
+    except StructuredOutputError as e:
+        # JSONの応答を取得できない場合は企業名の抽出とクエリの編集を個別に実行する
+        print(f"company extraction failed ({e}), falling back to two calls")
+        company_name = normalize_company_name(await extract_company_name_async(query))
+        if company_name == "-":
+            return company_name, query
+        return make_company_and_query(
+            query, company_name, await extract_company_name_from_query_async(query, company_name))
+    return make_company_and_query(
+        query, response["company_name"], response["query_non_company"])
+
+
+def make_information(
+        es_search_results: list[dict[str, Any]],
+) -> str:
+    """検索結果から回答生成に使用する補足情報を作成する関数
+
+    Args:
+        es_search_results: 検索上位のデータ
+
+    Returns:
+        補足情報
+    """
+    infomation_for_answer = ""
+    for i, result in enumerate(es_search_results):
+        content = result["content"]
+        infomation_for_answer += "\n" + \
+            f"{i+1}個目の情報:" + "\n============\n" + f"{content}" + "\n"
+    return infomation_for_answer
+
+
+def resolve_companies(
+        query_companies: list[str],
+        obj_aoai_embedding: AOAIEmbeddingModel,
+        company_index: VectorIndex,
+) -> list[str | None]:
+    """企業名群に対応するドキュメントIDをまとめて取得する関数
+
+    企業名の埋め込みおよび類似度検索はそれぞれ1回の処理でまとめて実行する.
+
+    Args:
+        query_companies: クエリから抽出された企業名群(抽出できない場合はハイフン(-))
+        obj_aoai_embedding: Embeddingモデル
+        company_index: 各ドキュメントの企業名の埋め込みベクトル
+
+    Returns:
+        各企業名に最も類似する企業に対応するドキュメントID
+        企業名が抽出できていない場合は None
+    """
+    doc_ids = [None] * len(query_companies)
+    indices = [
+        i for i, query_company in enumerate(query_companies)
+        if query_company != "-"
+    ]
+    if not indices:
+        return doc_ids
+
+    query_company_vectors = obj_aoai_embedding.get_responses(
+        [query_companies[i] for i in indices])
+    # 各ドキュメントから抽出された企業名との類似度で最大の類似度をとる企業に対応するドキュメントIDを取得
+    results = company_index.search_batch(query_company_vectors, top=1)
+    for i, result in zip(indices, results):
+        doc_ids[i] = result[0][0]
+
+    return doc_ids
+
+
+def resolve_query_locally(
+        query: str,
+        company_resolver: CompanyResolver | None,
+) -> tuple[Any, str] | None:
+    """既知の企業名との照合によりクエリの対象の企業をローカルで特定する関数
+
+    特定できた場合は LLM による企業名の抽出および企業名の埋め込みを省略できる.
+
+    Args:
+        query: クエリ
+        company_resolver: 企業名の照合(None の場合は照合しない)
+
+    Returns:
+        ドキュメントIDおよび企業情報を除いたクエリ
+        特定できない(曖昧な)場合は None
+    """
+    if company_resolver is None:
+        return None
+    doc_id = company_resolver.resolve(query)
+    if doc_id is None:
+        return None
+    for company_name in company_resolver.get_surfaces(doc_id):
+        query_non_company = strip_company_name(query, company_name)
+        if query_non_company is not None:
+            return doc_id, query_non_company
+    return doc_id, query
+
+
+def make_answer(
+        query: str,
+        information: str,
+        answer_mode: str,
+) -> str:
+    """補足情報を元にクエリの最終回答を作成する関数
+
+    Args:
+        query: クエリ
+        information: 補足情報
+        answer_mode: 回答モード(two_pass または fused)
+
+    Returns:
+        加工後の回答
+    """
+    if answer_mode == "fused":
+        processed_answer = generate_processed_answer(
+            query, information)["answer"]
+    else:
+        answer = generate_answer(query, information)
+        processed_answer = process_answer(
+            query, answer, max_tokens=MAX_TOKENS_ANSWER)
+    if (processed_answer == "") or (processed_answer is None):
+        processed_answer = "分かりません"
+
+    return processed_answer
+
+
+async def make_answer_async(
+        query: str,
+        information: str,
+        answer_mode: str,
+) -> str:
+    """補足情報を元にクエリの最終回答を非同期で作成する関数
+
+    処理内容は make_answer と同一である.
+
+    Args:
+        query: クエリ
+        information: 補足情報
+        answer_mode: 回答モード(two_pass または fused)
+
+    Returns:
+        加工後の回答
+    """
+    if answer_mode == "fused":
+        processed_answer = (await generate_processed_answer_async(
+            query, information))["answer"]
+    else:
+        answer = await generate_answer_async(query, information)
+        processed_answer = await process_answer_async(
+            query, answer, max_tokens=MAX_TOKENS_ANSWER)
+    if (processed_answer == "") or (processed_answer is None):
+        processed_answer = "分かりません"
+
+    return processed_answer
+
+
+def answer_query(
+        query: str,
+        es_search_results: list[dict[str, Any]],
+        answer_mode: str = CONFIG_SUBMISSION["answer_mode"],
+) -> str:
+    """1件の質問に対する回答を生成する関数
+
+    回答モードに応じて回答生成および回答加工を実行する.
+    検索は事前に全ての質問についてまとめて実行しておく.
+
+    Args:
+        query: クエリ
+        es_search_results: 検索上位のデータ
+        answer_mode: 回答モード(two_pass または fused)
+
+    Returns:
+        加工後の回答
+    """
+    # 検索上位のコンテンツから提出ファイルに必要な各質問に対する回答を生成する
+    infomation_for_answer = make_information(es_search_results)
+
+    return make_answer(query, infomation_for_answer, answer_mode)
+
+
+async def answer_query_async(
+        query: str,
+        obj_aoai_embedding: AsyncAOAIEmbeddingModel,
+        obj_es_retrievation: AsyncElasticsearchRetrivation,
+        company_index: VectorIndex,
+        strip_locally: bool = False,
+        company_resolver: CompanyResolver | None = None,
+        answer_mode: str = CONFIG_SUBMISSION["answer_mode"],
+) -> str:
+    """1件の質問に対する回答を非同期で生成する関数
+
+    企業名の抽出およびドキュメントIDの特定も含めて1件ずつ実行する.
+
+    Args:
+        query: クエリ
+        obj_aoai_embedding: Embeddingモデル(非同期)
+        obj_es_retrievation: Elasticsearch の検索クライアント(非同期)
+        company_index: 各ドキュメントの企業名の埋め込みベクトル
+        strip_locally: クエリから企業名を除く処理をローカルで行うか否かのフラグ
+        company_resolver: 企業名の照合(None の場合は照合しない)
+        answer_mode: 回答モード(two_pass または fused)
+
+    Returns:
+        加工後の回答
+    """
+    resolved = resolve_query_locally(query, company_resolver)
+    if resolved is not None:
+        # 企業をローカルで特定できた場合は LLM および企業名の埋め込みを省略する
+        doc_id_for_filter, query_non_company = resolved
+        query_vector_non_company = await obj_aoai_embedding.get_response(
+            query_non_company)
+    else:
+        query_company, query_non_company = await extract_company_and_query_async(
+            query, strip_locally)
         if query_company != "-":
-            query_company_vector = obj_aoai_embedding.get_response(
-                query_company)
-            # 各ドキュメントから抽出された企業名との類似度で最大の類似度をとる企業に対応するドキュメントIDを取得
-            doc_id_for_filter = get_similar_vectors(
-                query_company_vector, dict_for_similality, top=1)[0][0]
-            query_non_company = extract_company_name_from_query(
-                query, query_company)
-            query_vector_non_company = obj_aoai_embedding.get_response(
-                query_non_company)
-            # ドキュメントIDでフィルタリングした対象に対し検索を実行
-            es_search_results = obj_es_retrievation.retrieve_hybrid_with_filter(
-                query=query_non_company,
-                query_vector=query_vector_non_company,
-                doc_id_filter=doc_id_for_filter,
-                num_searches=10,
-                top=5,
-                num_candidates=100,
+            # 企業名とクエリの埋め込みは互いに独立しているため同時に実行する
+            query_company_vector, query_vector_non_company = await asyncio.gather(
+                obj_aoai_embedding.get_response(query_company),
+                obj_aoai_embedding.get_response(query_non_company),
+            )
+            doc_id_for_filter = company_index.search(
+                query_company_vector, top=1)[0][0]
+        else:
+            doc_id_for_filter = None
+            query_vector_non_company = await obj_aoai_embedding.get_response(
+                query)
+
+    # 企業を特定できた場合はElasticsearchの検索対象を絞る
+    if doc_id_for_filter is not None:
+        es_search_results = await obj_es_retrievation.retrieve_hybrid_with_filter(
+            query=query_non_company,
+            query_vector=query_vector_non_company,
+            doc_id_filter=doc_id_for_filter,
+            num_searches=10,
+            top=5,
+            num_candidates=100,
+        )
+
+    # 企業を特定できなかった場合はElasticsearchの検索対象を全件とする
+    else:
+        es_search_results = await obj_es_retrievation.retrieve_hybrid(
+            query=query,
+            query_vector=query_vector_non_company,
+            num_searches=10,
+            top=5,
+            num_candidates=100,
+        )
+
+    infomation_for_answer = make_information(es_search_results)
+
+    return await make_answer_async(query, infomation_for_answer, answer_mode)
+
+
+async def answer_queries_async(
+        rows: list[list[str]],
+        company_index: VectorIndex,
+        concurrency: int,
+        strip_locally: bool = False,
+        company_resolver: CompanyResolver | None = None,
+        answer_mode: str = CONFIG_SUBMISSION["answer_mode"],
+) -> list[list[str]]:
+    """複数の質問に対する回答を並行して生成する関数
+
+    同時に処理する質問数はセマフォで制限する.
+    戻り値の順序は入力の質問の順序と一致する.
+
+    Args:
+        rows: 質問データ(ヘッダーを除く)
+        company_index: 各ドキュメントの企業名の埋め込みベクトル
+        concurrency: 同時に処理する質問数の上限
+        strip_locally: クエリから企業名を除く処理をローカルで行うか否かのフラグ
+        company_resolver: 企業名の照合(None の場合は照合しない)
+        answer_mode: 回答モード(two_pass または fused)
+
+    Returns:
+        質問番号と回答の組
+    """
+    obj_aoai_embedding = AsyncAOAIEmbeddingModel()
+    obj_es_retrievation = AsyncElasticsearchRetrivation()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer_row(row: list[str]) -> list[str]:
+        query_no = row[0]
+        query = row[1]
+        async with semaphore:
+            processed_answer = await answer_query_async(
+                query,
+                obj_aoai_embedding,
+                obj_es_retrievation,
+                company_index,
+                strip_locally,
+                company_resolver,
+                answer_mode,
             )
+        print(f"{query_no}: {processed_answer}")
+        return [query_no, processed_answer]
+
+    try:
+        # gather は完了順によらず入力順で結果を返す
+        answers = await asyncio.gather(*(answer_row(row) for row in rows))
+    finally:
+        await obj_es_retrievation.close()
+
+    return list(answers)
+
+
+def load_companies() -> tuple[VectorIndex, dict[str, str]]:
+    """各ドキュメントの企業名および企業名の埋め込みベクトルを読み込む関数
 
-        # クエリから企業名を抽出できなかった場合はElasticsearchの検索対象を全件とする
+    company_embedding.npy が company_embedding.json 以降に更新されている場合はそちらを使用する.
+
+    Args:
+        None
+
+    Returns:
+        各ドキュメントの企業名の埋め込みベクトルおよびドキュメントIDごとの企業名
+    """
+    path_company_file = select_vector_source(
+        input_dir / "company_embedding.npy",
+        [input_dir / "company_embedding.json"],
+    )
+
+    if path_company_file.suffix == ".npy":
+        artifact = VectorArtifact(path_company_file)
+        company_index = VectorIndex(artifact.ids, artifact.vectors)
+        company_names = {
+            doc_id: artifact.get_content(i)
+            for i, doc_id in enumerate(artifact.ids)
+        }
+    else:
+        dict_companies = json_to_dict(path_company_file)
+        dict_for_similality = {}
+        company_names = {}
+        for doc_id, company_info in dict_companies.items():
+            dict_for_similality[doc_id] = company_info["company_vector"]
+            company_names[doc_id] = company_info["company_name"]
+        company_index = VectorIndex.from_dict(dict_for_similality)
+
+    return company_index, company_names
+
+
+def make_company_resolver(
+        company_names: dict[str, str],
+        enabled: bool,
+) -> CompanyResolver | None:
+    """企業名の照合を作成する関数
+
+    Args:
+        company_names: ドキュメントIDごとの企業名
+        enabled: 企業名の照合を行うか否か
+
+    Returns:
+        企業名の照合(照合しない場合は None)
+    """
+    if not enabled:
+        return None
+    return CompanyResolver(
+        company_names,
+        ngram=CONFIG_COMPANY_RESOLVER["ngram"],
+        min_coverage=CONFIG_COMPANY_RESOLVER["min_coverage"],
+        min_margin=CONFIG_COMPANY_RESOLVER["min_margin"],
+    )
+
+
+def retrieve_queries(
+        rows: list[list[str]],
+        company_index: VectorIndex,
+        strip_locally: bool = False,
+        company_resolver: CompanyResolver | None = None,
+) -> list[list[dict[str, Any]]]:
+    """全ての質問の検索をまとめて実行する関数
+
+    企業名の抽出,ドキュメントIDの特定,検索用のクエリの埋め込みおよび検索をそれぞれまとめて実行する.
+
+    Args:
+        rows: 質問データ(ヘッダーを除く)
+        company_index: 各ドキュメントの企業名の埋め込みベクトル
+        strip_locally: クエリから企業名を除く処理をローカルで行うか否かのフラグ
+        company_resolver: 企業名の照合(None の場合は照合しない)
+
+    Returns:
+        質問ごとの検索上位のデータ
+    """
+    obj_aoai_embedding = AOAIEmbeddingModel()
+    obj_es_retrievation = ElasticsearchRetrivation()
+
+    # 全クエリの企業名および企業情報を除いたクエリを取得し,対応するドキュメントIDをまとめて特定する
+    # 企業をローカルで特定できたクエリは LLM および企業名の埋め込みを省略する
+    query_companies, search_queries, doc_ids_local = [], [], []
+    for row in rows:
+        resolved = resolve_query_locally(row[1], company_resolver)
+        if resolved is not None:
+            doc_id, search_query = resolved
+            query_company = "-"  # 企業名の埋め込みの対象外とする
         else:
-            es_search_results = obj_es_retrievation.retrieve_hybrid(
-                query=query,
-                query_vector=query_vector,
-                num_searches=10,
-                top=5,
-                num_candidates=100,
+            doc_id = None
+            query_company, search_query = extract_company_and_query(
+                row[1], strip_locally)
+        query_companies.append(query_company)
+        search_queries.append(search_query)
+        doc_ids_local.append(doc_id)
+    doc_ids_for_filter = [
+        doc_id_local if doc_id_local is not None else doc_id
+        for doc_id_local, doc_id in zip(
+            doc_ids_local,
+            resolve_companies(
+                query_companies, obj_aoai_embedding, company_index),
+        )
+    ]
+    print(
+        f"companies resolved locally: "
+        f"{sum(doc_id is not None for doc_id in doc_ids_local)}/{len(rows)}"
+    )
+
+    # 全クエリの検索をまとめて実行する
+    # 企業名を抽出できた場合はドキュメントIDで検索対象を絞り,できなかった場合は全件を検索対象とする
+    search_vectors = obj_aoai_embedding.get_responses(search_queries)
+    es_search_results_all = obj_es_retrievation.retrieve_hybrid_batch(
+        list(zip(search_queries, search_vectors, doc_ids_for_filter)),
+        num_searches=10,
+        top=5,
+        num_candidates=100,
+    )
+
+    return es_search_results_all
+
+
+def main():
+    args = parse_arguments()
+    path_query_file = input_dir / "query.csv"
+    path_answer_file = output_dir / "predictions.csv"
+
+    queries = csv_to_list(path_query_file)  # ヘッダー含む
+    company_index, company_names = load_companies()
+    company_resolver = make_company_resolver(
+        company_names, args.local_resolver)
+
+    if args.mode == "async":
+        answers = asyncio.run(
+            answer_queries_async(
+                queries[1:],  # ヘッダーを飛ばす
+                company_index,
+                args.concurrency,
+                args.strip_company_locally,
+                company_resolver,
+                args.answer_mode,
             )
+        )
 
-        # 検索上位のコンテンツから提出ファイルに必要な各質問に対する回答を生成する
-        infomation_for_answer = ""
-        for i, result in enumerate(es_search_results):
-            content = result["content"]
-            infomation_for_answer += "\n" + \
-                f"{i+1}個目の情報:" + "\n============\n" + f"{content}" + "\n"
-        answer = generate_answer(query, infomation_for_answer)
-        processed_answer = process_answer(
-            query, answer, max_tokens=MAX_TOKENS_ANSWER)
-        if (processed_answer == "") or (processed_answer is None):
-            processed_answer = "分かりません"
-        print(f"{query_no}: {processed_answer}")
-        answers.append([query_no, processed_answer])
+    else:
+        answers = []  # 生成された回答を格納する
+        rows = queries[1:]  # ヘッダーを飛ばす
+        es_search_results_all = retrieve_queries(
+            rows, company_index, args.strip_company_locally, company_resolver)
+
+        for row, es_search_results in zip(rows, es_search_results_all):
+            query_no = row[0]
+            query = row[1]
+            processed_answer = answer_query(
+                query, es_search_results, args.answer_mode)
+            print(f"{query_no}: {processed_answer}")
+            answers.append([query_no, processed_answer])
 
     # 回答データを保存する
     list_to_csv(answers, path_answer_file)
 
+    cache = get_response_cache()
+    if cache is not None:
+        print(cache.report())
+
 
 if __name__ == "__main__":
     main()
@@ -1,23 +1,39 @@
 """Markdownファイルのテキストをチャンク分割したチャンク結果ファイルを作成するスクリプト
 
 Markdonw構造に最適な分割手法は LangChain 経由で使用する.
-実行結果ファイルは以下の通り複数となる:
- - チャンク結果のメタデータおよびコンテンツ(.json)
- - チャンク結果のコンテンツ(.md)
+見出しで分割したセクションがトークン数の上限を超える場合は,トークン数の上限ごとに1パスで分割する.
+実行結果ファイルは以下の通りとなる:
+ - チャンク結果のメタデータおよびコンテンツ(.json または .jsonl, config.json の artifacts で指定)
+ - チャンク結果のコンテンツ(.md, --write-md を指定した場合のみ.確認用)
+ - 全ドキュメントのチャンク結果をまとめたチャンクストア(chunks.sqlite3, --store を指定した場合のみ)
+
+ディレクトリを指定した場合は,含まれる.mdをプロセスプールで並列にチャンク分割する.
+ドキュメントごとの結果ファイルに加えて,全ドキュメントのチャンク数をまとめたマニフェスト(chunks_manifest.json)を作成する.
+チャンクIDはドキュメントごとに0から採番するため,1ファイルずつ実行した場合と同じとなる.
 """
 import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
-from common.file_utils import dict_to_json, file_to_str, str_to_md_file
-from common.load_config import get_input_dir, get_output_dir, load_config
-from common.string_utils import count_tokens
+from common.chunk_store import ChunkStore
+from common.file_utils import (dict_to_json, file_to_str, items_to_file,
+                               str_to_md_file)
+from common.load_config import (get_artifact_suffix, get_input_dir,
+                                get_output_dir, load_config)
+from common.string_utils import split_text_by_tokens
 from langchain.schema import Document
-from langchain.text_splitter import (MarkdownHeaderTextSplitter,
-                                     RecursiveCharacterTextSplitter)
+from langchain.text_splitter import MarkdownHeaderTextSplitter
 
 config = load_config()
 input_dir = get_input_dir()
 output_dir = get_output_dir()
+MODEL_NAME = config["azure_openai"]["embedding"]["model_name"]
+MAX_TOKENS = config["azure_openai"]["embedding"]["max_tokens"]
+CONFIG_CHUNKING = config["chunking"]
+FILE_NAME_CHUNK_STORE = "chunks.sqlite3"
+SUFFIX_ARTIFACT = get_artifact_suffix()
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -26,13 +42,40 @@ def parse_arguments() -> argparse.Namespace:
         description="指定した.mdのMarkdonw見出し構造に応じたチャンク分割結果ファイル群を作成する"
     )
 
-    parser.add_argument(
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
         "-i",
         "--input",
         type=str,
-        required=True,
         help="チャンク分割対象の.mdファイル名を1個指定する"
     )
+    group.add_argument(
+        "-d",
+        "--directory",
+        type=str,
+        help="チャンク分割対象の.mdを含むディレクトリ名を指定する"
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="ディレクトリを指定した場合に並列に処理するプロセス数"
+    )
+
+    parser.add_argument(
+        "--write-md",
+        action="store_true",
+        help="確認用にチャンクごとの.mdを作成する"
+    )
+
+    parser.add_argument(
+        "-s",
+        "--store",
+        action="store_true",
+        help="outputディレクトリのチャンクストアにチャンク結果を格納する"
+    )
 
     return parser.parse_args()
 
@@ -62,80 +105,172 @@ def split_markdown(
     return splitter.split_text(md_text)
 
 
-def split_recursive_character(
-        text: str,
-        chunk_size: int = 3000,
-        chunk_overlap: int = 500,
-        separators: list[str] = ["\n\n", "\n", "。", "、", " "]
+def split_section(
+        content: str,
 ) -> list[str]:
-    """テキストを再起的に分割する関数
+    """セクションのコンテンツをトークン数の上限ごとに分割する関数
 
-    分割ルールを引数で指定する.
+    トークン数の上限は Embedding モデルの入力上限とする.
+    上限を超えない場合は分割しない.
 
     Args:
-        text: 分割対象の文字列
-        chunk_size: 1チャンクの最大文字数
-        chunk_overlap: オーバラップサイズ
-        separators: 優先度の高い分割ポイント
+        content: 分割対象のセクションのコンテンツ
 
     Returns:
         分割結果
     """
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=separators,
+    return split_text_by_tokens(
+        content,
+        MODEL_NAME,
+        MAX_TOKENS,
+        overlap_tokens=CONFIG_CHUNKING["overlap_tokens"],
+        separators=CONFIG_CHUNKING["separators"],
+        snap_ratio=CONFIG_CHUNKING["snap_ratio"],
     )
-    return splitter.split_text(text)
 
 
-def main():
-    args = parse_arguments()
-    file_name_input = args.input
-    base_file_name = Path(file_name_input).stem
-    path_input_file = input_dir / file_name_input
+def chunk_markdown_file(
+        path_input_file: Path,
+        path_output_dir: Path,
+        write_md: bool = False,
+        path_chunk_store: Path | None = None,
+) -> tuple[Path, int]:
+    """Markdownファイルをチャンク分割し結果ファイル群を作成する関数
+
+    チャンクストアのドキュメントIDは Elasticsearch 登録時のドキュメントID({ベース名}.pdf)に合わせる.
+
+    Args:
+        path_input_file: チャンク分割対象の.mdのパス
+        path_output_dir: 結果ファイル群の出力先ディレクトリ
+        write_md: チャンクごとの.mdを作成するか否かのフラグ
+        path_chunk_store: 格納先のチャンクストアのパス(None の場合は格納しない)
+
+    Returns:
+        チャンク分割結果の.json(または.jsonl)のパスおよびチャンク数
+    """
+    base_file_name = path_input_file.stem
     md_content = file_to_str(path_input_file)
     documents = split_markdown(md_content)
     dict_chunk_result = {}
-    model_name = config["azure_openai"]["embedding"]["model_name"]
-    max_tokens = config["azure_openai"]["embedding"]["max_tokens"]
-    additonal_id = 0  # 全体のチャンクID加算用
-    chunk_total = 0
-    for i, doc in enumerate(documents):
-        metadata = doc.metadata
-        content = doc.page_content
-        content_tokens = count_tokens(content, model_name)
-        # チャンクのトークン数が上限を下回る場合はそのチャンクをそのままチャンク結果とする
-        if content_tokens <= max_tokens:
-            id = i + additonal_id
-            path_output_md = output_dir / f"{base_file_name}_chunked_{id}.md"
-            str_to_md_file(content, path_output_md)
+    id = 0  # 全体のチャンクID
+    for doc in documents:
+        # 分割したチャンクにはセクションの見出し情報をメタデータとして引き継ぐ
+        for content in split_section(doc.page_content):
+            if write_md:
+                path_output_md = path_output_dir / \
+                    f"{base_file_name}_chunked_{id}.md"
+                str_to_md_file(content, path_output_md)
             item = {
-                "metadata": metadata,
+                "metadata": doc.metadata,
                 "content": content,
             }
             dict_chunk_result[id] = item
-            chunk_total += 1
-        # チャンクのトークン数が上限を上回る場合は追加で再帰分割した結果をチャンク結果とする
-        # 同じチャンクIDが後続で使用されないよう値の管理に注意する必要がある
-        else:
-            sub_contents = split_recursive_character(content)
-            sub_length = len(sub_contents)
-            for j, sub_content in enumerate(sub_contents):
-                id = i + additonal_id + j
-                path_output_md = output_dir / \
-                    f"{base_file_name}_chunked_{id}.md"
-                str_to_md_file(sub_content, path_output_md)
-                item = {
-                    "metadata": metadata,
-                    "content": sub_content,
-                }
-                dict_chunk_result[id] = item
-                chunk_total += 1
-            additonal_id += sub_length - 1
-    path_output_json = output_dir / f"{base_file_name}_chunked.json"
-    dict_to_json(dict_chunk_result, path_output_json)
-    print(f"total chunks: {chunk_total}")
+            id += 1
+    path_output_json = path_output_dir / \
+        f"{base_file_name}_chunked{SUFFIX_ARTIFACT}"
+    items_to_file(dict_chunk_result.items(), path_output_json, "chunk_id")
+    if path_chunk_store is not None:
+        chunk_store = ChunkStore(path_chunk_store)
+        chunk_store.put_document(
+            f"{base_file_name}.pdf", dict_chunk_result.items())
+        chunk_store.close()
+    print(f"{path_input_file.name}: total chunks: {id}")
+
+    return path_output_json, id
+
+
+def get_input_files(
+        path_input_dir: Path,
+) -> list[Path]:
+    """ディレクトリ内のチャンク分割対象の.mdのパスを取得する関数
+
+    チャンク分割結果の.md({ベース名}_chunked_{ID}.md)は対象外とする.
+
+    Args:
+        path_input_dir: 対象のディレクトリ
+
+    Returns:
+        チャンク分割対象の.mdのパス群(ファイル名順)
+    """
+    return sorted(
+        path for path in path_input_dir.glob("*.md")
+        if "_chunked_" not in path.stem
+    )
+
+
+def chunk_markdown_files(
+        paths_input_file: list[Path],
+        path_output_dir: Path,
+        max_workers: int,
+        write_md: bool = False,
+        path_chunk_store: Path | None = None,
+) -> Path:
+    """複数のMarkdownファイルを並列にチャンク分割し結果ファイル群を作成する関数
+
+    ドキュメントごとの結果ファイルに加えて,チャンク数をまとめたマニフェストを作成する.
+
+    Args:
+        paths_input_file: チャンク分割対象の.mdのパス群
+        path_output_dir: 結果ファイル群の出力先ディレクトリ
+        max_workers: 並列に処理するプロセス数
+        write_md: チャンクごとの.mdを作成するか否かのフラグ
+        path_chunk_store: 格納先のチャンクストアのパス(None の場合は格納しない)
+
+    Returns:
+        マニフェストの.jsonのパス
+    """
+    documents = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                chunk_markdown_file,
+                path,
+                path_output_dir,
+                write_md,
+                path_chunk_store,
+            ): path
+            for path in paths_input_file
+        }
+        for future in as_completed(futures):
+            path_output_json, chunk_total = future.result()
+            documents[futures[future].stem] = {
+                "file": path_output_json.name,
+                "chunks": chunk_total,
+            }
+
+    # 完了順によらず同じ内容となるようドキュメント名順に並べる
+    dict_manifest = {
+        "documents": {key: documents[key] for key in sorted(documents)},
+        "total_chunks": sum(item["chunks"] for item in documents.values()),
+    }
+    path_output_manifest = path_output_dir / "chunks_manifest.json"
+    dict_to_json(dict_manifest, path_output_manifest)
+
+    return path_output_manifest
+
+
+def main():
+    args = parse_arguments()
+    path_chunk_store = output_dir / FILE_NAME_CHUNK_STORE if args.store else None
+    if args.input is not None:
+        file_name_input = args.input
+        path_input_file = input_dir / file_name_input
+        chunk_markdown_file(
+            path_input_file, output_dir, args.write_md, path_chunk_store)
+        return
+
+    paths_input_file = get_input_files(input_dir / args.directory)
+    print(f"target files: {len(paths_input_file)}")
+    time_start = time.perf_counter()
+    path_output_manifest = chunk_markdown_files(
+        paths_input_file,
+        output_dir,
+        args.workers,
+        args.write_md,
+        path_chunk_store,
+    )
+    elapsed = time.perf_counter() - time_start
+    print(f"{path_output_manifest.name}: done ({elapsed:.1f}s)")
 
 
 if __name__ == "__main__":
@@ -5,6 +5,7 @@
  - {1..19}.md: 各ドキュメント{1..19}.pdfをMarkdown化したファイル
 """
 from az_openai_model import AOAIEmbeddingModel
+from common.cache_utils import get_response_cache
 from common.file_utils import dict_to_json, file_to_str
 from common.load_config import get_input_dir, get_output_dir, load_config
 from openai_model import OpenAIChatModel
@@ -70,6 +71,10 @@ def main():
     path_output_file = output_dir / "company_embedding.json"
     dict_to_json(dict_for_json, path_output_file)
 
+    cache = get_response_cache()
+    if cache is not None:
+        print(cache.report())
+
 
 if __name__ == "__main__":
     main()
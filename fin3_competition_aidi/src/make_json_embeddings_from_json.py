@@ -1,12 +1,22 @@
 """チャンク分割結果の各チャンクの埋め込みベクトルを取得した結果ファイルを作成するスクリプト
 
 埋め込みベクトルは Azure OpenAI (AOAI) の Embedding モデルを実行することで取得する.
+API はチャンクをトークン数の上限までまとめたリクエスト単位で実行する.
+各リクエストの結果はチェックポイントファイル(.ckpt.jsonl)に逐次追記する.
+異常終了後に再実行した場合は,チェックポイントに記録済のチャンクの API 実行を省略する.
+入出力ファイルの拡張子が.jsonlの場合は1チャンクずつ読み書きするため,メモリ使用量はチャンク数によらない.
 """
 import argparse
+import hashlib
+from itertools import islice
+from pathlib import Path
 
 from az_openai_model import AOAIEmbeddingModel
-from common.file_utils import dict_to_json, json_to_dict
-from common.load_config import get_input_dir, get_output_dir
+from common.cache_utils import get_response_cache
+from common.file_utils import (append_jsonl, items_to_file, iter_items,
+                               loads_json_line, repair_jsonl)
+from common.load_config import (get_artifact_suffix, get_input_dir,
+                                get_output_dir)
 
 input_dir = get_input_dir()
 output_dir = get_output_dir()
@@ -23,43 +33,171 @@ def parse_arguments() -> argparse.Namespace:
         "--input",
         type=str,
         required=True,
-        help="チャンク分割結果の.jsonファイル名を1個指定する"
+        help="チャンク分割結果の.json(または.jsonl)ファイル名を1個指定する"
     )
 
     parser.add_argument(
         "-o",
         "--output",
         type=str,
-        default="result_embeddings.json",
-        help="Embedding結果を格納する.jsonファイル名を1個指定する"
+        default=f"result_embeddings{get_artifact_suffix()}",
+        help="Embedding結果を格納する.json(または.jsonl)ファイル名を1個指定する"
     )
 
     return parser.parse_args()
 
 
+def get_checkpoint_path(
+        path_output_file: Path,
+) -> Path:
+    """結果ファイルに対応するチェックポイントファイルのパスを取得する関数
+
+    Args:
+        path_output_file: 結果ファイルのパス
+
+    Returns:
+        チェックポイントファイルのパス
+    """
+    return path_output_file.with_name(path_output_file.name + ".ckpt.jsonl")
+
+
+def content_sha256(
+        content: str,
+) -> str:
+    """チャンクのコンテンツのハッシュ値を算出する関数
+
+    チェックポイントの埋め込みベクトルが現在のコンテンツに対応するかの判定に使用する.
+
+    Args:
+        content: チャンクのコンテンツ
+
+    Returns:
+        SHA-256 のハッシュ値
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def index_checkpoint(
+        path_checkpoint: Path,
+        dict_hashes: dict[str, str],
+) -> dict[str, int]:
+    """チェックポイントファイル内の各チャンクの位置を取得する関数
+
+    埋め込みベクトル自体はメモリに保持せず,ファイル内のバイト位置のみを記録する.
+    コンテンツのハッシュ値が現在のチャンクと一致しない記録は無視する.
+
+    Args:
+        path_checkpoint: チェックポイントファイルのパス
+        dict_hashes: チャンクIDごとのコンテンツのハッシュ値
+
+    Returns:
+        チャンクIDごとのチェックポイントファイル内のバイト位置
+    """
+    dict_offsets = {}
+    if not path_checkpoint.exists():
+        return dict_offsets
+
+    repair_jsonl(path_checkpoint)  # 書き込み途中の行を取り除く
+    with open(path_checkpoint, "rb") as f:
+        offset = f.tell()
+        for line in iter(f.readline, b""):
+            record = loads_json_line(line)
+            chunk_id = str(record["chunk_id"])
+            if dict_hashes.get(chunk_id) == record["content_sha256"]:
+                dict_offsets[chunk_id] = offset
+            offset = f.tell()
+    return dict_offsets
+
+
+def make_embeddings_file(
+        path_input_file: Path,
+        path_output_file: Path,
+        obj_aoai_embedding: AOAIEmbeddingModel,
+) -> None:
+    """チャンク分割結果の各チャンクの埋め込みベクトルを取得し結果ファイルを作成する関数
+
+    埋め込みベクトルはリクエストが完了するたびにチェックポイントファイルに追記する.
+    チェックポイントに記録済のチャンクは API を実行しない.
+    結果ファイルの作成後にチェックポイントファイルを削除する.
+
+    Args:
+        path_input_file: チャンク分割結果の.json(または.jsonl)のパス
+        path_output_file: 作成する結果ファイルのパス
+        obj_aoai_embedding: Embeddingモデル
+
+    Returns:
+        None
+    """
+    path_checkpoint = get_checkpoint_path(path_output_file)
+    # コンテンツ自体は保持せず,チャンクIDとハッシュ値のみを保持する
+    dict_hashes = {
+        chunk_id: content_sha256(chunk_info["content"])
+        for chunk_id, chunk_info in iter_items(path_input_file, "chunk_id")
+    }
+    dict_offsets = index_checkpoint(path_checkpoint, dict_hashes)
+    print(
+        f"chunks: {len(dict_hashes)} "
+        f"(checkpointed: {len(dict_offsets)}, "
+        f"pending: {len(dict_hashes) - len(dict_offsets)})"
+    )
+
+    # 未取得のチャンクを1リクエストの最大入力数ずつ読み込み,
+    # 埋め込みベクトルをリクエスト単位で取得しチェックポイントに追記する
+    items_pending = (
+        (chunk_id, chunk_info)
+        for chunk_id, chunk_info in iter_items(path_input_file, "chunk_id")
+        if chunk_id not in dict_offsets
+    )
+    while window := list(
+            islice(items_pending, obj_aoai_embedding.max_inputs_per_request)):
+        chunk_ids = [chunk_id for chunk_id, _ in window]
+        contents = [chunk_info["content"] for _, chunk_info in window]
+        for indices, embedding_vectors in obj_aoai_embedding.iter_responses(contents):
+            records = [
+                {
+                    "chunk_id": chunk_ids[i],
+                    "content_sha256": dict_hashes[chunk_ids[i]],
+                    "embedding_vector": embedding_vector,
+                }
+                for i, embedding_vector in zip(indices, embedding_vectors)
+            ]
+            append_jsonl(records, path_checkpoint)
+            print(f"{len(records)} chunks are OK!")
+
+    # チェックポイントから1チャンクずつ読み込み,入力の順序で結果ファイルを作成する
+    # チャンクがない(テキストのないPDFなど)場合もチェックポイントは空のファイルとして扱う
+    path_checkpoint.touch()
+    dict_offsets = index_checkpoint(path_checkpoint, dict_hashes)
+
+    def generate_items():
+        with open(path_checkpoint, "rb") as f:
+            for chunk_id, chunk_info in iter_items(path_input_file, "chunk_id"):
+                f.seek(dict_offsets[chunk_id])
+                record = loads_json_line(f.readline())
+                item = {
+                    "metadata": chunk_info["metadata"],
+                    "content": chunk_info["content"],
+                    "embedding_vector": record["embedding_vector"],
+                }
+                yield chunk_id, item
+
+    items_to_file(generate_items(), path_output_file, "chunk_id")
+    path_checkpoint.unlink(missing_ok=True)
+    print(f"total chunks: {len(dict_hashes)} is OK!")
+
+
 def main():
     args = parse_arguments()
     file_name_input = args.input
     file_name_output = args.output
     path_input_file = input_dir / file_name_input
     path_output_file = output_dir / file_name_output
-    chunked_results = json_to_dict(path_input_file)
-    embedding_results = {}
     obj_aoai_embedding = AOAIEmbeddingModel()
+    make_embeddings_file(path_input_file, path_output_file, obj_aoai_embedding)
 
-    for chunk_id, chunk_info in chunked_results.items():
-        metadata = chunk_info["metadata"]
-        content = chunk_info["content"]
-        embedding_vector = obj_aoai_embedding.get_response(content)
-        item = {
-            "metadata": metadata,
-            "content": content,
-            "embedding_vector": embedding_vector,
-        }
-        embedding_results[chunk_id] = item
-        print(f"chunk_id: {chunk_id} is OK!")
-
-    dict_to_json(embedding_results, path_output_file)
+    cache = get_response_cache()
+    if cache is not None:
+        print(cache.report())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+"""埋め込みベクトルの結果ファイル(.json)をベクトルアーティファクト(.npy)に変換するスクリプト
+
+以下の結果ファイルを変換の対象とする:
+ - {n}_embedding.json: 各ドキュメントのチャンク,各チャンクの埋め込みベクトル,およびメタデータ
+ - company_embedding.json: 各ドキュメントの企業名および企業名の埋め込みベクトルデータ
+
+変換後のファイル(.npy, .meta.jsonl, .content.txt)はoutputディレクトリに同じファイル名のベースで作成する.
+"""
+import argparse
+from pathlib import Path
+
+from common.file_utils import iter_items
+from common.load_config import get_input_dir, get_output_dir
+from common.vector_utils import save_vector_artifact
+
+input_dir = get_input_dir()
+output_dir = get_output_dir()
+
+
+def parse_arguments() -> argparse.Namespace:
+    """コマンドライン引数をパースする関数"""
+    parser = argparse.ArgumentParser(
+        description="埋め込みベクトルの結果ファイル(.json)をベクトルアーティファクト(.npy)に変換する"
+    )
+
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        nargs="+",
+        required=True,
+        help="inputディレクトリ内の変換対象の.json(または.jsonl)ファイル名を1個以上指定する"
+    )
+
+    return parser.parse_args()
+
+
+def convert_embeddings_file(
+        path_input_file: Path,
+        path_output_file: Path,
+) -> int:
+    """埋め込みベクトルの結果ファイルをベクトルアーティファクトに変換する関数
+
+    チャンクの結果ファイル(embedding_vector)と企業名の結果ファイル(company_vector)の両方に対応する.
+    企業名の結果ファイルは企業名をコンテンツとする.
+
+    Args:
+        path_input_file: 変換対象の.json(または.jsonl)のパス
+        path_output_file: 作成する.npyのパス
+
+    Returns:
+        変換した件数
+    """
+    ids, vectors, contents, metadata = [], [], [], []
+    for key, value in iter_items(path_input_file, "chunk_id"):
+        ids.append(key)
+        if "company_vector" in value:
+            vectors.append(value["company_vector"])
+            contents.append(value["company_name"])
+            metadata.append({})
+        else:
+            vectors.append(value["embedding_vector"])
+            contents.append(value["content"])
+            metadata.append(value["metadata"])
+    save_vector_artifact(path_output_file, ids, vectors, contents, metadata)
+    return len(ids)
+
+
+def main():
+    args = parse_arguments()
+    for file_name in args.input:
+        path_input_file = input_dir / file_name
+        path_output_file = output_dir / f"{Path(file_name).stem}.npy"
+        count = convert_embeddings_file(path_input_file, path_output_file)
+        print(f"{file_name} -> {path_output_file.name}: {count} vectors")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,22 @@
 実行結果ファイルは以下の通り複数となる:
  - 無加工の実行結果(.json)
  - 実行結果を加工したコンテンツ(.md)
+
+ディレクトリまたはglobパターンを指定した場合は,複数の.pdfを並行して構造解析する.
 """
 import argparse
-import json
+import time
 from pathlib import Path
 
 from az_ai_document_intelligence import AzAIDocumentIntelligence
 from azure.ai.documentintelligence.models import AnalyzeResult
-from common.file_utils import str_to_md_file
-from common.load_config import get_input_dir, get_output_dir
+from common.file_utils import dict_to_json, str_to_md_file
+from common.load_config import get_input_dir, get_output_dir, load_config
 
+config = load_config()
 input_dir = get_input_dir()
 output_dir = get_output_dir()
+CONCURRENCY = config["az_ai_document_intelligence"]["concurrency"]
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -23,13 +27,27 @@ def parse_arguments() -> argparse.Namespace:
         description="指定した.pdfをAIDIで構造解析し実行結果ファイル群を作成する"
     )
 
-    parser.add_argument(
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
         "-i",
         "--input",
         type=str,
-        required=True,
         help="構造解析対象の.pdfファイル名を1個指定する"
     )
+    group.add_argument(
+        "-g",
+        "--glob",
+        type=str,
+        help="構造解析対象の.pdfを含むディレクトリ名またはglobパターンを指定する(例: \"*.pdf\")"
+    )
+
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=CONCURRENCY,
+        help="複数の.pdfを指定した場合に同時に構造解析する件数の上限"
+    )
 
     return parser.parse_args()
 
@@ -42,6 +60,7 @@ def result_to_json(
     """AIDI実行結果をJSONファイルに書き出す関数
 
     指定したパスに.jsonファイルを作成する.
+    実行結果は大きくなるため,インデントせずに書き出す.
 
     Args:
         result: AIDIによるドキュメントの構造解析結果
@@ -52,22 +71,86 @@ def result_to_json(
         None
     """
     result_dict = result.as_dict()
-    with open(path_file_json, "w", encoding=encoding) as f:
-        json.dump(result_dict, f, ensure_ascii=False, indent=4)
+    dict_to_json(result_dict, path_file_json, encoding, indent=None)
 
 
-def main():
-    args = parse_arguments()
-    file_name_input = args.input
-    base_file_name = Path(file_name_input).stem
-    path_input_file = input_dir / file_name_input
-    path_output_json = output_dir / f"{base_file_name}.json"
-    path_output_md = output_dir / f"{base_file_name}.md"
-    obj_aidi = AzAIDocumentIntelligence()
-    result: AnalyzeResult = obj_aidi.get_analyzed_result(path_input_file)
+def get_input_files(
+        pattern: str,
+) -> list[Path]:
+    """構造解析対象の.pdfのパス群を取得する関数
+
+    inputディレクトリを起点にディレクトリ名またはglobパターンを解釈する.
+
+    Args:
+        pattern: ディレクトリ名またはglobパターン
+
+    Returns:
+        構造解析対象の.pdfのパス群
+    """
+    path_dir = input_dir / pattern
+    if path_dir.is_dir():
+        return sorted(path_dir.glob("*.pdf"))
+    return sorted(input_dir.glob(pattern))
+
+
+def save_result(
+        obj_aidi: AzAIDocumentIntelligence,
+        result: AnalyzeResult,
+        base_file_name: str,
+        path_output_dir: Path,
+) -> tuple[Path, Path]:
+    """構造解析結果から結果ファイル群を作成する関数
+
+    Args:
+        obj_aidi: AIDIクライアント
+        result: AIDIによるドキュメントの構造解析結果
+        base_file_name: 結果ファイル名のベース
+        path_output_dir: 結果ファイル群の出力先ディレクトリ
+
+    Returns:
+        作成した.jsonおよび.mdのパス
+    """
+    path_output_json = path_output_dir / f"{base_file_name}.json"
+    path_output_md = path_output_dir / f"{base_file_name}.md"
     content = obj_aidi.get_content(result)
     result_to_json(result, path_output_json)
     str_to_md_file(content, path_output_md)
+    return path_output_json, path_output_md
+
+
+def main():
+    args = parse_arguments()
+    obj_aidi = AzAIDocumentIntelligence()
+
+    if args.input is not None:
+        file_name_input = args.input
+        base_file_name = Path(file_name_input).stem
+        path_input_file = input_dir / file_name_input
+        result: AnalyzeResult = obj_aidi.get_analyzed_result(path_input_file)
+        save_result(obj_aidi, result, base_file_name, output_dir)
+        return
+
+    # 複数の.pdfを並行して構造解析し,完了したものから結果ファイルを作成する
+    paths_input_file = get_input_files(args.glob)
+    print(f"target files: {len(paths_input_file)}")
+    time_start = time.perf_counter()
+    failed = []
+    for path_input_file, future in obj_aidi.get_analyzed_results(
+            paths_input_file, max_workers=args.concurrency):
+        try:
+            result = future.result()
+        except Exception as e:
+            failed.append(path_input_file.name)
+            print(f"{path_input_file.name}: failed ({e})")
+            continue
+        save_result(obj_aidi, result, path_input_file.stem, output_dir)
+        elapsed = time.perf_counter() - time_start
+        print(f"{path_input_file.name}: done ({elapsed:.1f}s)")
+
+    print(
+        f"total: {len(paths_input_file) - len(failed)} succeeded, "
+        f"{len(failed)} failed"
+    )
 
 
 if __name__ == "__main__":
@@ -1,11 +1,24 @@
 """OpenAI による機能をまとめたモジュール
 
 各スクリプトで OpenAI の処理が必要なときは本モジュールから呼び出す.
+API実行の要求内容の作成および応答の処理は common.model_request に共通化している.
 """
-import os
+from functools import lru_cache
 
-from dotenv import load_dotenv
-from openai import OpenAI
+from common.cache_utils import get_response_cache
+from common.client_registry import (get_async_openai_client, get_env,
+                                    get_openai_client)
+from common.load_config import load_config
+from common.model_request import AsyncChatModelMixin, ChatModelMixin
+from common.rate_limiter import get_rate_limiter
+from common.string_utils import resolve_model_name
+from openai import APIConnectionError
+
+# ステータスコードによらずリトライする例外(タイムアウトを含む接続エラー)
+RETRY_ON = (APIConnectionError,)
+
+config = load_config()
+CONFIG_CHAT = config["openai"]["chat"]
 
 
 class OpenAIModel:
@@ -15,68 +28,124 @@ class OpenAIModel:
 
     Attributes:
         client: OpenAIクライアント
+        cache: 応答のキャッシュ(無効の場合は None)
+        rate_limiter: API実行のレート制限
     """
 
+    provider = "openai"
+
     def __init__(self):
         """イニシャライザ"""
-        load_dotenv()
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-        )
+        self.client = get_openai_client()  # プロセス内で共有するクライアント
+        self.cache = get_response_cache()
+        self.rate_limiter = get_rate_limiter("openai_chat", RETRY_ON)
 
 
-class OpenAIChatModel(OpenAIModel):
+class OpenAIChatModel(OpenAIModel, ChatModelMixin):
     """OpenAI の Chat モデルの機能をまとめたクラス
 
-    必要なパラメータを設定し, AOAIのAPIを実行する.
+    必要なパラメータを設定し, OpenAIのAPIを実行する.
 
     Attributes:
         dep_id_chat_comp: ChatモデルID
-        system_content: システムプロンプト
+        model_name: トークン数カウントに使用するモデル名
+        system_content: システムプロンプトの既定値
     """
 
     def __init__(
             self,
-            system_content: str,
+            system_content: str = "",
     ):
         """イニシャライザ
 
+        クライアントはプロセス内で共有するため,インスタンスを使い回す場合は
+        呼び出しごとにシステムプロンプトを指定する.
+
         Args:
-            system_content: システムプロンプト
+            system_content: システムプロンプトの既定値
         """
         super().__init__()
-        self.dep_id_chat_comp = os.getenv(
-            "OPENAI_CHAT_MODEL")
+        self.dep_id_chat_comp = get_env("OPENAI_CHAT_MODEL")
+        self.model_name = resolve_model_name(
+            self.dep_id_chat_comp, CONFIG_CHAT["model_name"])
         self.system_content = system_content
 
-    def get_response_only_text(
+
+class AsyncOpenAIModel:
+    """OpenAI のLLMモデルの非同期処理の機能をまとめたクラス
+
+    各モデル利用のための共通機能をまとめる.
+
+    Attributes:
+        client: OpenAI非同期クライアント
+        cache: 応答のキャッシュ(無効の場合は None)
+        rate_limiter: API実行のレート制限
+    """
+
+    provider = "openai"
+
+    def __init__(self):
+        """イニシャライザ"""
+        self.client = get_async_openai_client()  # プロセス内で共有するクライアント
+        self.cache = get_response_cache()
+        self.rate_limiter = get_rate_limiter("openai_chat", RETRY_ON)
+
+
+class AsyncOpenAIChatModel(AsyncOpenAIModel, AsyncChatModelMixin):
+    """OpenAI の Chat モデルの非同期処理の機能をまとめたクラス
+
+    必要なパラメータを設定し, OpenAIのAPIを非同期で実行する.
+
+    Attributes:
+        dep_id_chat_comp: ChatモデルID
+        model_name: トークン数カウントに使用するモデル名
+        system_content: システムプロンプトの既定値
+    """
+
+    def __init__(
             self,
-            user_content: str,
-            max_tokens: int = 4000,
-            temperature: float = 0.2,
-    ) -> str:
-        """OpenAIのChatモデルのAPIを実行し応答を取得するメソッド
+            system_content: str = "",
+    ):
+        """イニシャライザ
 
-        インプットはテキストのみを想定する.
-        Chat履歴をリセットしてAPIを実行する.
+        クライアントはプロセス内で共有するため,インスタンスを使い回す場合は
+        呼び出しごとにシステムプロンプトを指定する.
 
         Args:
-            user_content: ユーザープロンプト
-            max_tokens: Chatモデル入出力合計トークン数の上限値
-            temperature: Chatモデル応答のランダム性(創造性)
-
-        Returns:
-            Chatモデルが生成した応答テキスト
+            system_content: システムプロンプトの既定値
         """
-        messages = [
-            {"role": "system", "content": self.system_content},
-            {"role": "user", "content": user_content},
-        ]
-        response = self.client.chat.completions.create(
-            model=self.dep_id_chat_comp,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-        ).choices[0].message.content
-
-        return response
+        super().__init__()
+        self.dep_id_chat_comp = get_env("OPENAI_CHAT_MODEL")
+        self.model_name = resolve_model_name(
+            self.dep_id_chat_comp, CONFIG_CHAT["model_name"])
+        self.system_content = system_content
+
+
+@lru_cache(maxsize=None)
+def get_openai_chat_model() -> OpenAIChatModel:
+    """プロセス内で共有する OpenAI の Chat モデルを取得する関数
+
+    システムプロンプトは呼び出しごとに get_response_only_text に指定する.
+
+    Args:
+        None
+
+    Returns:
+        OpenAI の Chat モデル
+    """
+    return OpenAIChatModel()
+
+
+@lru_cache(maxsize=None)
+def get_async_openai_chat_model() -> AsyncOpenAIChatModel:
+    """プロセス内で共有する OpenAI の Chat モデル(非同期)を取得する関数
+
+    システムプロンプトは呼び出しごとに get_response_only_text に指定する.
+
+    Args:
+        None
+
+    Returns:
+        OpenAI の Chat モデル(非同期)
+    """
+    return AsyncOpenAIChatModel()
@@ -2,24 +2,65 @@
 
 各スクリプトで RAG の処理が必要なときは本モジュールから呼び出す.
 """
-from az_openai_model import AOAIChatModel  # AOAIモデルを利用する場合
-from openai_model import OpenAIChatModel  # OpenAIモデルを利用する場合
+from az_openai_model import get_aoai_chat_model  # AOAIモデルを利用する場合
+from az_openai_model import get_async_aoai_chat_model  # AOAIモデルを非同期で利用する場合
+from common.load_config import load_config
+from common.model_request import StructuredOutputError
+from common.string_utils import split_text_by_tokens
+from openai_model import get_openai_chat_model  # OpenAIモデルを利用する場合
+from openai_model import get_async_openai_chat_model  # OpenAIモデルを非同期で利用する場合
+from typing_extensions import Any
 
+config = load_config()
+MAX_TOKENS_ANSWER = config["rules"]["max_tokens_answer"]
+CONFIG_GENERATION = config["generation"]
+# 回答生成の出力トークン数の予算(回答加工後の上限トークン数の倍数とする)
+TOKEN_BUDGET_ANSWER = MAX_TOKENS_ANSWER * CONFIG_GENERATION["token_budget_ratio"]
+# 回答生成を打ち切ってよい最小の文字数
+MIN_CHARS_ANSWER = MAX_TOKENS_ANSWER * CONFIG_GENERATION["min_chars_ratio"]
+STOP_SEQUENCES = CONFIG_GENERATION["stop_sequences"] or None
+SENTENCE_ENDINGS = ("。", "．")
+# 回答生成および回答加工を1回で行う場合の出力トークン数の上限(根拠を含むJSON全体)
+MAX_TOKENS_FUSED = CONFIG_GENERATION["fused_max_tokens"]
 
-def generate_answer(
+# 回答生成および回答加工を1回で行う場合の応答のJSONスキーマ(根拠を先に生成させる)
+SCHEMA_ANSWER_WITH_RATIONALE = {
+    "name": "answer_with_rationale",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "rationale": {"type": "string"},
+            "answer": {"type": "string"},
+        },
+        "required": ["rationale", "answer"],
+        "additionalProperties": False,
+    },
+}
+SCHEMA_ANSWER = {
+    "name": "answer",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "answer": {"type": "string"},
+        },
+        "required": ["answer"],
+        "additionalProperties": False,
+    },
+}
+
+
+def make_prompt_generate_answer(
         query: str,
         information: str,
-) -> str:
-    """補足情報を元にクエリの回答を生成する関数
-
-    回答の生成には Azure OpenAI のChatモデルを使用する.
+) -> tuple[str, str]:
+    """回答生成のプロンプトを作成する関数
 
     Args:
         query: クエリ
         information: 補足情報
 
     Returns:
-        補足情報を元にしたクエリに対する回答
+        システムプロンプトおよびユーザープロンプト
     """
     system_content = (
         "あなたは優秀なQAアシスタントです．"
@@ -35,29 +76,22 @@ def generate_answer(
         " - 数量で回答するべき質問の回答には単位をつけること\n"
         " - 質問に対して<information>タグにある情報で，質問に答えるための情報がない場合は「分かりません」と答えること"
     )
-    # obj_chat_model = AOAIChatModel(system_content)  # AOAIモデルを利用する場合
-    obj_chat_model = OpenAIChatModel(system_content)  # OpenAIモデルを利用する場合
-    answer = obj_chat_model.get_response_only_text(user_content)
 
-    return answer
+    return system_content, user_content
 
 
-def process_answer(
+def make_prompt_process_answer(
         query: str,
         answer: str,
-        max_tokens: int,
-) -> str:
-    """クエリに対して生成された回答を加工する関数
-
-    最終的な回答に相応しい内容に加工する.
+) -> tuple[str, str]:
+    """回答加工のプロンプトを作成する関数
 
     Args:
         query: クエリ
         answer: クエリに対して生成された回答
-        max_tokens: 最大トークン数
 
     Returns:
-        加工後の回答
+        システムプロンプトおよびユーザープロンプト
     """
     system_content = (
         "あなたはプロの編集者です．"
@@ -84,12 +118,329 @@ def process_answer(
         " - 文法の誤りを残さないこと\n"
         " - 「分かりません」「不明」という意味に近い回答の場合は「分かりません」と回答すること"
     )
-    # obj_chat_model = AOAIChatModel(system_content)  # AOAIモデルを使用する場合
-    obj_chat_model = OpenAIChatModel(system_content)  # OpenAIモデルを使用する場合
+
+    return system_content, user_content
+
+
+def is_answer_sufficient(
+        text: str,
+) -> bool:
+    """生成途中の回答が回答加工に十分な内容を含むか判定する関数
+
+    回答は回答加工で MAX_TOKENS_ANSWER トークン以内に要約されるため,
+    MIN_CHARS_ANSWER 文字以上で文が完結した場合に十分とする.
+
+    Args:
+        text: 生成途中の回答
+
+    Returns:
+        回答生成を打ち切ってよいか否か
+    """
+    text = text.strip()
+    return (len(text) >= MIN_CHARS_ANSWER) and text.endswith(SENTENCE_ENDINGS)
+
+
+def make_prompt_generate_processed_answer(
+        query: str,
+        information: str,
+        with_rationale: bool,
+) -> tuple[str, str]:
+    """回答生成および回答加工を1回で行うプロンプトを作成する関数
+
+    回答生成のプロンプトの留意事項に回答加工のプロンプトの留意事項を加え,最終回答を直接生成させる.
+
+    Args:
+        query: クエリ
+        information: 補足情報
+        with_rationale: 回答の根拠を合わせて生成させるか否か
+
+    Returns:
+        システムプロンプトおよびユーザープロンプト
+    """
+    system_content = (
+        "あなたは優秀なQAアシスタントです．"
+        "ユーザーの指示に従い，簡潔な最終回答を生成してください．"
+    )
+    if with_rationale:
+        output_format = (
+            "rationale には回答の根拠となる<information>タグの記述を簡潔に要約し，"
+            "answer には最終回答のみを記載してください．\n\n"
+        )
+    else:
+        output_format = "answer には最終回答のみを記載してください．\n\n"
+    user_content = (
+        "以下の<information>タグには，私が知りたい情報に関する企業のESG（環境・社会・ガバナンス）レポートや統合報告書の抜粋が含まれています．\n\n"
+        f"<information>{information}</information>\n\n"
+        "<information>タグの情報をもとに，以下の<question>タグの質問に対する回答を提供してください．\n"
+        f"<question>{query}</question>\n\n"
+        f"{output_format}"
+        "# 最終回答の留意事項\n"
+        " - <information>タグの内容を参考にするが，回答に<information>タグを含めないこと\n"
+        f" - 最も簡潔に重要な内容のみ回答し，{MAX_TOKENS_ANSWER}トークン以内とすること．単語のみを回答しても構わない\n"
+        " - 句点(。)を含まないようにすること\n"
+        " - 複数の回答がある場合は，読点(、)で区切ること\n"
+        " - 以下の例のように質問文の問われ方に適した回答となっていること\n"
+        "  - 例1: 質問で聞かれていないことには回答しない\n"
+        "  - 例2: 数量が問われている場合は単位とともに数量だけ回答する\n"
+        "  - 例3: 単語が問われている場合は単語のみ答える\n"
+        "  - 例4: 数量が問われていない場合は数量の情報を含めない\n"
+        "  - 例5: 比較結果が問われいる場合は比較結果のみ答える\n"
+        "  - 例6: 単語を選択する場合は選択肢の単語から適切なものだけを答える\n"
+        " - 文法の誤りを残さないこと\n"
+        " - <information>タグに質問に答えるための情報がない場合は「分かりません」と回答すること"
+    )
+
+    return system_content, user_content
+
+
+def truncate_answer(
+        answer: str,
+        model_name: str,
+) -> str:
+    """最終回答を上限トークン数以内に切り詰める関数
+
+    回答加工では API の出力トークン数の上限で切り詰められるため,同等の処理をローカルで行う.
+    トークン数は回答を生成したChatモデルのエンコーディングでカウントする.
+
+    Args:
+        answer: 最終回答
+        model_name: トークン数カウントに使用するモデル名
+
+    Returns:
+        MAX_TOKENS_ANSWER トークン以内の最終回答
+    """
+    return split_text_by_tokens(
+        answer.strip(), model_name, MAX_TOKENS_ANSWER)[0]
+
+
+def generate_answer(
+        query: str,
+        information: str,
+        stream: bool = CONFIG_GENERATION["stream"],
+        stats: dict[str, Any] | None = None,
+) -> str:
+    """補足情報を元にクエリの回答を生成する関数
+
+    回答の生成には Azure OpenAI のChatモデルを使用する.
+    stream が有効な場合はストリーミングで生成し,回答加工に十分な内容が得られた時点で生成を打ち切る.
+
+    Args:
+        query: クエリ
+        information: 補足情報
+        stream: ストリーミングで生成するか否か
+        stats: ストリーミング時の計測結果(ttft など)の格納先
+
+    Returns:
+        補足情報を元にしたクエリに対する回答
+    """
+    system_content, user_content = make_prompt_generate_answer(
+        query, information)
+    # obj_chat_model = get_aoai_chat_model()  # AOAIモデルを利用する場合
+    obj_chat_model = get_openai_chat_model()  # OpenAIモデルを利用する場合
+    if not stream:
+        answer = obj_chat_model.get_response_only_text(
+            user_content, system_content=system_content)
+        return answer
+
+    answer = "".join(obj_chat_model.get_response_only_text_stream(
+        user_content,
+        max_tokens=TOKEN_BUDGET_ANSWER,
+        system_content=system_content,
+        stop=STOP_SEQUENCES,
+        stop_condition=is_answer_sufficient,
+        stats=stats,
+    ))
+
+    return answer
+
+
+def process_answer(
+        query: str,
+        answer: str,
+        max_tokens: int,
+) -> str:
+    """クエリに対して生成された回答を加工する関数
+
+    最終的な回答に相応しい内容に加工する.
+
+    Args:
+        query: クエリ
+        answer: クエリに対して生成された回答
+        max_tokens: 最大トークン数
+
+    Returns:
+        加工後の回答
+    """
+    system_content, user_content = make_prompt_process_answer(query, answer)
+    # obj_chat_model = get_aoai_chat_model()  # AOAIモデルを使用する場合
+    obj_chat_model = get_openai_chat_model()  # OpenAIモデルを使用する場合
     processed_answer = obj_chat_model.get_response_only_text(
         user_content=user_content,
         max_tokens=max_tokens,
         temperature=0,
+        system_content=system_content,
     )
 
     return processed_answer
+
+
+def generate_processed_answer(
+        query: str,
+        information: str,
+        with_rationale: bool = CONFIG_GENERATION["fused_rationale"],
+) -> dict[str, str]:
+    """補足情報を元にクエリの最終回答を1回のChatモデルの実行で生成する関数
+
+    generate_answer および process_answer を1回の実行にまとめ,JSONスキーマに沿った応答から最終回答を取得する.
+    最終回答は MAX_TOKENS_ANSWER トークン以内に切り詰める.
+    応答が打ち切られた場合など JSONスキーマに沿った応答を取得できない場合は,
+    generate_answer および process_answer を順に実行した結果とする.
+
+    Args:
+        query: クエリ
+        information: 補足情報
+        with_rationale: 回答の根拠を合わせて生成させるか否か
+
+    Returns:
+        最終回答(answer)および回答の根拠(rationale,生成しない場合は空文字)
+    """
+    system_content, user_content = make_prompt_generate_processed_answer(
+        query, information, with_rationale)
+    # obj_chat_model = get_aoai_chat_model()  # AOAIモデルを利用する場合
+    obj_chat_model = get_openai_chat_model()  # OpenAIモデルを利用する場合
+    try:
+        response = obj_chat_model.get_response_json(
+            user_content,
+            SCHEMA_ANSWER_WITH_RATIONALE if with_rationale else SCHEMA_ANSWER,
+            max_tokens=MAX_TOKENS_FUSED,
+            temperature=0,
+            system_content=system_content,
+        )
+    except StructuredOutputError as e:
+        # 1回の実行で最終回答を取得できない場合は回答生成および回答加工を順に実行する
+        print(f"fused answer failed ({e}), falling back to two_pass")
+        answer = generate_answer(query, information)
+        processed_answer = process_answer(
+            query, answer, max_tokens=MAX_TOKENS_ANSWER)
+        return {"answer": processed_answer, "rationale": ""}
+
+    return {
+        "answer": truncate_answer(
+            response["answer"], obj_chat_model.model_name),
+        "rationale": response.get("rationale", ""),
+    }
+
+
+async def generate_answer_async(
+        query: str,
+        information: str,
+        stream: bool = CONFIG_GENERATION["stream"],
+        stats: dict[str, Any] | None = None,
+) -> str:
+    """補足情報を元にクエリの回答を非同期で生成する関数
+
+    処理内容は generate_answer と同一である.
+
+    Args:
+        query: クエリ
+        information: 補足情報
+        stream: ストリーミングで生成するか否か
+        stats: ストリーミング時の計測結果(ttft など)の格納先
+
+    Returns:
+        補足情報を元にしたクエリに対する回答
+    """
+    system_content, user_content = make_prompt_generate_answer(
+        query, information)
+    # obj_chat_model = get_async_aoai_chat_model()  # AOAIモデルを利用する場合
+    obj_chat_model = get_async_openai_chat_model()  # OpenAIモデルを利用する場合
+    if not stream:
+        answer = await obj_chat_model.get_response_only_text(
+            user_content, system_content=system_content)
+        return answer
+
+    deltas = obj_chat_model.get_response_only_text_stream(
+        user_content,
+        max_tokens=TOKEN_BUDGET_ANSWER,
+        system_content=system_content,
+        stop=STOP_SEQUENCES,
+        stop_condition=is_answer_sufficient,
+        stats=stats,
+    )
+    answer = "".join([delta async for delta in deltas])
+
+    return answer
+
+
+async def process_answer_async(
+        query: str,
+        answer: str,
+        max_tokens: int,
+) -> str:
+    """クエリに対して生成された回答を非同期で加工する関数
+
+    処理内容は process_answer と同一である.
+
+    Args:
+        query: クエリ
+        answer: クエリに対して生成された回答
+        max_tokens: 最大トークン数
+
+    Returns:
+        加工後の回答
+    """
+    system_content, user_content = make_prompt_process_answer(query, answer)
+    # obj_chat_model = get_async_aoai_chat_model()  # AOAIモデルを使用する場合
+    obj_chat_model = get_async_openai_chat_model()  # OpenAIモデルを使用する場合
+    processed_answer = await obj_chat_model.get_response_only_text(
+        user_content=user_content,
+        max_tokens=max_tokens,
+        temperature=0,
+        system_content=system_content,
+    )
+
+    return processed_answer
+
+
+async def generate_processed_answer_async(
+        query: str,
+        information: str,
+        with_rationale: bool = CONFIG_GENERATION["fused_rationale"],
+) -> dict[str, str]:
+    """補足情報を元にクエリの最終回答を1回のChatモデルの実行で非同期に生成する関数
+
+    処理内容は generate_processed_answer と同一である.
+
+    Args:
+        query: クエリ
+        information: 補足情報
+        with_rationale: 回答の根拠を合わせて生成させるか否か
+
+    Returns:
+        最終回答(answer)および回答の根拠(rationale,生成しない場合は空文字)
+    """
+    system_content, user_content = make_prompt_generate_processed_answer(
+        query, information, with_rationale)
+    # obj_chat_model = get_async_aoai_chat_model()  # AOAIモデルを利用する場合
+    obj_chat_model = get_async_openai_chat_model()  # OpenAIモデルを利用する場合
+    try:
+        response = await obj_chat_model.get_response_json(
+            user_content,
+            SCHEMA_ANSWER_WITH_RATIONALE if with_rationale else SCHEMA_ANSWER,
+            max_tokens=MAX_TOKENS_FUSED,
+            temperature=0,
+            system_content=system_content,
+        )
+    except StructuredOutputError as e:
+        # 1回の実行で最終回答を取得できない場合は回答生成および回答加工を順に実行する
+        print(f"fused answer failed ({e}), falling back to two_pass")
+        answer = await generate_answer_async(query, information)
+        processed_answer = await process_answer_async(
+            query, answer, max_tokens=MAX_TOKENS_ANSWER)
+        return {"answer": processed_answer, "rationale": ""}
+
+    return {
+        "answer": truncate_answer(
+            response["answer"], obj_chat_model.model_name),
+        "rationale": response.get("rationale", ""),
+    }
@@ -0,0 +1,284 @@
+"""PDFから Elasticsearch への登録までの前処理を一括で実行するスクリプト
+
+以下のステージを順に実行する:
+ - aidi: PDFの構造解析(make_results_aidi_from_pdf.py)
+ - chunk: Markdownのチャンク分割(make_files_chunked_from_md.py)
+ - embedding: チャンクの埋め込みベクトル化(make_json_embeddings_from_json.py)
+ - store: Elasticsearch への登録(elasticsearch_store_data.py)
+
+各ステージはドキュメント単位で入力・設定・出力のハッシュ値をマニフェストに記録する.
+再実行時は変更があったドキュメントのみ処理し,異常終了後は完了済のドキュメントの次から再開する.
+中間ファイルはすべてoutputディレクトリに作成する.
+"""
+import argparse
+from pathlib import Path
+
+from az_ai_document_intelligence import AzAIDocumentIntelligence
+from az_openai_model import AOAIEmbeddingModel
+from common.load_config import (get_artifact_suffix, get_input_dir,
+                                get_output_dir, load_config)
+from common.manifest_utils import StageManifest, dict_sha256
+from elasticsearch import Elasticsearch
+from elasticsearch_store_data import URL, build_index, publish_index
+from make_files_chunked_from_md import chunk_markdown_file
+from make_json_embeddings_from_json import make_embeddings_file
+from make_results_aidi_from_pdf import save_result
+
+config = load_config()
+input_dir = get_input_dir()
+output_dir = get_output_dir()
+manifest_dir = output_dir / "manifests"
+CONCURRENCY_AIDI = config["az_ai_document_intelligence"]["concurrency"]
+SUFFIX_ARTIFACT = get_artifact_suffix()
+
+STAGES = ["aidi", "chunk", "embedding", "store"]
+
+
+def parse_arguments() -> argparse.Namespace:
+    """コマンドライン引数をパースする関数"""
+    parser = argparse.ArgumentParser(
+        description="PDFの構造解析から Elasticsearch への登録までを差分のみ実行する"
+    )
+
+    parser.add_argument(
+        "-g",
+        "--glob",
+        type=str,
+        default="*.pdf",
+        help="inputディレクトリ内の処理対象.pdfのglobパターンを指定する"
+    )
+
+    parser.add_argument(
+        "-s",
+        "--stages",
+        type=str,
+        nargs="+",
+        choices=STAGES,
+        default=STAGES,
+        help="実行するステージを指定する"
+    )
+
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="マニフェストによらず全ドキュメントを再処理する"
+    )
+
+    return parser.parse_args()
+
+
+def get_pending_units(
+        manifest: StageManifest,
+        units: list[tuple[str, list[Path], list[Path]]],
+        config_hash: str,
+        force: bool,
+) -> list[tuple[str, list[Path], list[Path]]]:
+    """再処理が必要な単位を取得する関数
+
+    Args:
+        manifest: ステージのマニフェスト
+        units: 処理単位のキー,入力ファイルのパス群,出力ファイルのパス群の組
+        config_hash: 処理に影響する設定値のハッシュ値
+        force: 全単位を再処理するか否かのフラグ
+
+    Returns:
+        再処理が必要な単位
+        入力ファイルが存在しない単位は含めない
+    """
+    pending = []
+    for unit, inputs, outputs in units:
+        # 前段のステージが未完了の場合は処理できないため対象外とする
+        if not all(path.exists() for path in inputs):
+            print(f"  {unit}: input not found (skipped)")
+        elif force or not manifest.is_up_to_date(unit, inputs, config_hash, outputs):
+            pending.append((unit, inputs, outputs))
+        else:
+            print(f"  {unit}: up to date (skipped)")
+    return pending
+
+
+def run_stage_aidi(
+        base_file_names: list[str],
+        force: bool,
+) -> None:
+    """PDFの構造解析ステージを実行する関数
+
+    再処理が必要なドキュメントは並行して構造解析する.
+
+    Args:
+        base_file_names: 処理対象ドキュメントのファイル名のベース
+        force: 全ドキュメントを再処理するか否かのフラグ
+
+    Returns:
+        None
+    """
+    manifest = StageManifest(manifest_dir / "aidi.json")
+    config_aidi = config["az_ai_document_intelligence"]
+    config_hash = dict_sha256({
+        "model_id": config_aidi["model_id"],
+        "output_content_format": config_aidi["output_content_format"],
+    })
+    units = [
+        (
+            base,
+            [input_dir / f"{base}.pdf"],
+            [output_dir / f"{base}.json", output_dir / f"{base}.md"],
+        )
+        for base in base_file_names
+    ]
+    pending = get_pending_units(manifest, units, config_hash, force)
+    if not pending:
+        return
+
+    obj_aidi = AzAIDocumentIntelligence()
+    dict_pending = {inputs[0]: (unit, inputs) for unit, inputs, _ in pending}
+    for path_input_file, future in obj_aidi.get_analyzed_results(
+            list(dict_pending.keys()), max_workers=CONCURRENCY_AIDI):
+        unit, inputs = dict_pending[path_input_file]
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"  {unit}: failed ({e})")
+            continue
+        outputs = save_result(obj_aidi, result, unit, output_dir)
+        manifest.record(unit, inputs, config_hash, list(outputs))
+        print(f"  {unit}: done")
+
+
+def run_stage_chunk(
+        base_file_names: list[str],
+        force: bool,
+) -> None:
+    """Markdownのチャンク分割ステージを実行する関数
+
+    Args:
+        base_file_names: 処理対象ドキュメントのファイル名のベース
+        force: 全ドキュメントを再処理するか否かのフラグ
+
+    Returns:
+        None
+    """
+    manifest = StageManifest(manifest_dir / "chunk.json")
+    config_hash = dict_sha256({
+        "model_name": config["azure_openai"]["embedding"]["model_name"],
+        "max_tokens": config["azure_openai"]["embedding"]["max_tokens"],
+        "chunking": config["chunking"],
+    })
+    units = [
+        (
+            base,
+            [output_dir / f"{base}.md"],
+            [output_dir / f"{base}_chunked{SUFFIX_ARTIFACT}"],
+        )
+        for base in base_file_names
+    ]
+    for unit, inputs, _ in get_pending_units(manifest, units, config_hash, force):
+        path_output_json, _ = chunk_markdown_file(inputs[0], output_dir)
+        manifest.record(unit, inputs, config_hash, [path_output_json])
+        print(f"  {unit}: done")
+
+
+def run_stage_embedding(
+        base_file_names: list[str],
+        force: bool,
+) -> None:
+    """チャンクの埋め込みベクトル化ステージを実行する関数
+
+    Args:
+        base_file_names: 処理対象ドキュメントのファイル名のベース
+        force: 全ドキュメントを再処理するか否かのフラグ
+
+    Returns:
+        None
+    """
+    manifest = StageManifest(manifest_dir / "embedding.json")
+    obj_aoai_embedding = AOAIEmbeddingModel()
+    config_hash = dict_sha256({
+        "model_name": obj_aoai_embedding.model_name,
+        "deployment": obj_aoai_embedding.dep_id_embedding_comp,
+    })
+    units = [
+        (
+            base,
+            [output_dir / f"{base}_chunked{SUFFIX_ARTIFACT}"],
+            [output_dir / f"{base}_embedding{SUFFIX_ARTIFACT}"],
+        )
+        for base in base_file_names
+    ]
+    for unit, inputs, outputs in get_pending_units(manifest, units, config_hash, force):
+        make_embeddings_file(inputs[0], outputs[0], obj_aoai_embedding)
+        manifest.record(unit, inputs, config_hash, outputs)
+        print(f"  {unit}: done")
+
+
+def run_stage_store(
+        base_file_names: list[str],
+        force: bool,
+) -> None:
+    """Elasticsearch への登録ステージを実行する関数
+
+    変更があったドキュメントがある場合は,新たなバージョンのインデックスに登録済の全ドキュメントを登録し直す.
+    登録・マージ・ウォームアップの完了後にエイリアスの参照先を切り替えるため,登録中も既存のインデックスを検索できる.
+    登録済のドキュメントは処理対象外(glob パターンに一致しない)の場合も新たなインデックスに含める.
+
+    Args:
+        base_file_names: 処理対象ドキュメントのファイル名のベース
+        force: 全ドキュメントを再処理するか否かのフラグ
+
+    Returns:
+        None
+    """
+    manifest = StageManifest(manifest_dir / "store.json")
+    config_hash = dict_sha256({
+        "url": URL,
+        "index": config["elasticsearch"]["data"]["index"],
+    })
+    units = [
+        (base, [output_dir / f"{base}_embedding{SUFFIX_ARTIFACT}"], [])
+        for base in base_file_names
+    ]
+    pending = get_pending_units(manifest, units, config_hash, force)
+    if not pending:
+        return
+
+    # 登録済のドキュメントを加えたインデックス全体の登録対象
+    units = {unit: (unit, inputs, outputs) for unit, inputs, outputs in pending}
+    for base in sorted(manifest.units.keys()):
+        if base in units:
+            continue
+        path_input_file = output_dir / f"{base}_embedding{SUFFIX_ARTIFACT}"
+        if not path_input_file.exists():
+            print(f"  {base}: input not found (dropped from the new index)")
+            continue
+        units[base] = (base, [path_input_file], [])
+
+    es = Elasticsearch(URL)
+    index_name = build_index(
+        es, [(f"{unit}.pdf", inputs[0]) for unit, inputs, _ in units.values()])
+    publish_index(es, index_name)
+    for unit, inputs, outputs in units.values():
+        manifest.record(unit, inputs, config_hash, outputs)
+    print(f"  {len(units)} documents stored ({len(pending)} changed)")
+
+
+def main():
+    args = parse_arguments()
+    base_file_names = [path.stem for path in sorted(input_dir.glob(args.glob))]
+    print(f"target documents: {len(base_file_names)}")
+
+    functions_stage = {
+        "aidi": run_stage_aidi,
+        "chunk": run_stage_chunk,
+        "embedding": run_stage_embedding,
+        "store": run_stage_store,
+    }
+    for stage in STAGES:
+        if stage not in args.stages:
+            continue
+        print(f"[{stage}]")
+        functions_stage[stage](base_file_names, args.force)
+
+
+if __name__ == "__main__":
+    main()
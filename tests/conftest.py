@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# スクリプトと同様に src 直下のモジュールを import できるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "fin3_competition_aidi" / "src"))
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from common.calc_utils import VectorIndex, cos_similarity, get_similar_vectors
+
+
+def get_similar_vectors_baseline(vector_origin, dict_vectors, top):
+    # 全候補の類似度を cos_similarity で算出しソートする従来の実装
+    list_similarities = [
+        (key, cos_similarity(vector_origin, vector))
+        for key, vector in dict_vectors.items()
+    ]
+    list_similarities.sort(key=lambda x: x[1], reverse=True)
+    return list_similarities[0:top]
+
+
+@pytest.fixture
+def dict_vectors():
+    rng = np.random.default_rng(0)
+    return {key: rng.normal(size=16).tolist() for key in range(20)}
+
+
+@pytest.mark.parametrize("top", [1, 5, 20, 30])
+def test_get_similar_vectors(dict_vectors, top):
+    vector_origin = np.random.default_rng(1).normal(size=16).tolist()
+
+    results = get_similar_vectors(vector_origin, dict_vectors, top)
+    expected = get_similar_vectors_baseline(vector_origin, dict_vectors, top)
+
+    assert [key for key, _ in results] == [key for key, _ in expected]
+    assert [score for _, score in results] == pytest.approx(
+        [score for _, score in expected], abs=1e-6)
+
+
+@pytest.mark.parametrize("dict_vectors, top", [
+    ({}, 3),
+    ({"a": [1.0, 0.0]}, 0),
+])
+def test_get_similar_vectors_without_results(dict_vectors, top):
+    assert get_similar_vectors([1.0, 0.0], dict_vectors, top) == []
+
+
+def test_search_batch_without_candidates():
+    index = VectorIndex([], [])
+    assert index.search_batch([[1.0, 0.0], [0.0, 1.0]], 3) == [[], []]
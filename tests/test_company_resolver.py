@@ -0,0 +1,33 @@
+import pytest
+from common.company_resolver import CompanyResolver
+
+NAMES = {
+    1: "高松コンストラクショングループ株式会社",
+    2: "株式会社キッツ",
+    3: "全国保証株式会社",
+}
+
+
+@pytest.fixture
+def resolver():
+    return CompanyResolver(NAMES)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("高松コンストラクショングループの安全対策は?", 1),
+    ("(株)キッツの売上高は?", 2),
+    ("全國保証の従業員数は?", 3),
+    ("髙松コンストラクションの施工実績は?", 1),
+    ("高松コンストラクシヨングループの施工実績は?", 1),
+])
+def test_resolve_company_in_query(resolver, query, expected):
+    assert resolver.resolve(query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "コンストラクション企業の安全対策は?",
+    "グループ会社の保証制度は?",
+    "建設業界の売上高の動向は?",
+])
+def test_resolve_query_without_company(resolver, query):
+    assert resolver.resolve(query) is None
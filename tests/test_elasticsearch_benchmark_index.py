@@ -0,0 +1,54 @@
+import elasticsearch_benchmark_index
+import pytest
+from elasticsearch_benchmark_index import benchmark_search, build_index
+
+
+class FakeIndices:
+    def __init__(self):
+        self.calls = []
+
+    def exists(self, index):
+        return False
+
+    def __getattr__(self, name):
+        return lambda **kwargs: self.calls.append(name)
+
+
+class FakeElasticsearch:
+    def __init__(self):
+        self.indices = FakeIndices()
+
+
+def test_benchmark_search_excludes_query_chunk(monkeypatch):
+    # 総当たり検索の上位: 自身, 1, 2 / kNN 検索の上位: 自身, 1, 3
+    monkeypatch.setattr(
+        elasticsearch_benchmark_index, "search_knn",
+        lambda es, index_name, query_vector, top, num_candidates:
+            [("1.pdf", 0), ("1.pdf", 1), ("1.pdf", 3)][:top])
+    monkeypatch.setattr(
+        elasticsearch_benchmark_index, "search_exact",
+        lambda es, index_name, query_vector, top, similarity:
+            [("1.pdf", 0), ("1.pdf", 1), ("1.pdf", 2)][:top])
+
+    _, _, recall = benchmark_search(
+        None, "bench", [(("1.pdf", 0), [0.1, 0.2])], 2, 10, "cosine")
+
+    # 自身のチャンクを除いた上位2件 {1, 3} と {1, 2} の再現率
+    assert recall == pytest.approx(0.5)
+
+
+def test_build_index_raises_on_failed_chunks(monkeypatch):
+    results = iter([(10, 0), (8, 2)])
+    monkeypatch.setattr(elasticsearch_benchmark_index, "create_index", lambda *args: None)
+    monkeypatch.setattr(elasticsearch_benchmark_index, "set_bulk_settings", lambda *args: {})
+    monkeypatch.setattr(elasticsearch_benchmark_index, "restore_settings", lambda *args: None)
+    monkeypatch.setattr(elasticsearch_benchmark_index, "get_embeddings_file", lambda doc_id: None)
+    monkeypatch.setattr(
+        elasticsearch_benchmark_index, "store_embeddings_file", lambda *args: next(results))
+    es = FakeElasticsearch()
+
+    with pytest.raises(RuntimeError, match="2 chunks failed"):
+        build_index(es, "bench", 2, "cosine", {"type": "hnsw"})
+
+    # 不完全なインデックスはマージせずに計測を中止する
+    assert "forcemerge" not in es.indices.calls
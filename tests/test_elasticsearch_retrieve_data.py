@@ -0,0 +1,102 @@
+import pytest
+from elasticsearch_retrieve_data import (fuse_linear, make_body_rrf,
+                                         parse_responses)
+
+
+def make_hit(chunk_id, score):
+    return {
+        "_id": f"doc1_{chunk_id}",
+        "_score": score,
+        "_source": {
+            "doc_id": "doc1",
+            "chunk_id": chunk_id,
+            "content": f"チャンク{chunk_id}",
+            "metadata": {},
+        },
+    }
+
+
+def make_response(scores, max_score="auto"):
+    hits = [make_hit(chunk_id, score) for chunk_id, score in scores]
+    if max_score == "auto":
+        max_score = max((score for _, score in scores), default=None)
+    return {"hits": {"max_score": max_score, "hits": hits}}
+
+
+def hit_ids(response):
+    return [hit["_id"] for hit in response["hits"]["hits"]]
+
+
+def test_fuse_linear_ids_in_both_responses():
+    response_vector = make_response([(1, 0.9), (2, 0.6), (3, 0.3)])
+    response_keyword = make_response([(3, 12.0), (4, 6.0)])
+
+    fused = fuse_linear(response_vector, response_keyword, 0.7, 10)
+
+    # 1: 0.7, 2: 0.7 * 2/3, 3: 0.7 * 1/3 + 0.3, 4: 0.3 * 1/2
+    assert hit_ids(fused) == ["doc1_1", "doc1_3", "doc1_2", "doc1_4"]
+
+
+def test_fuse_linear_top():
+    response_vector = make_response([(1, 0.9), (2, 0.6), (3, 0.3)])
+    response_keyword = make_response([(4, 10.0), (5, 5.0)])
+
+    assert hit_ids(fuse_linear(response_vector, response_keyword, 0.5, 2)) == ["doc1_1", "doc1_4"]
+    assert hit_ids(fuse_linear(response_vector, response_keyword, 0.5, 0)) == []
+
+
+@pytest.mark.parametrize("max_score", [None, 0.0])
+def test_fuse_linear_without_max_score(max_score):
+    # max_score がない(または0の)場合も各結果のスコアで正規化する
+    response_vector = make_response([(1, 0.8), (2, 0.4)], max_score=max_score)
+    response_keyword = make_response([(3, 20.0)])
+
+    fused = fuse_linear(response_vector, response_keyword, 0.5, 3)
+
+    assert hit_ids(fused) == ["doc1_1", "doc1_3", "doc1_2"]
+
+
+def test_fuse_linear_zero_scores():
+    response_vector = make_response([(1, 0.0)], max_score=0.0)
+    response_keyword = make_response([], max_score=None)
+
+    assert hit_ids(fuse_linear(response_vector, response_keyword, 0.7, 3)) == ["doc1_1"]
+
+
+@pytest.mark.parametrize("num_searches, top, expected", [
+    (5, 3, 5),
+    (3, 10, 10),
+])
+def test_make_body_rrf_rank_window_size(num_searches, top, expected):
+    body = make_body_rrf("売上高", [0.1, 0.2], "doc1", num_searches=num_searches, top=top)
+
+    rrf = body["retriever"]["rrf"]
+    assert body["size"] == top
+    assert rrf["rank_window_size"] == expected
+    assert rrf["rank_window_size"] >= top
+    assert rrf["retrievers"][1]["knn"]["filter"] == [{"term": {"doc_id": "doc1"}}]
+    assert body["_source"] == {"excludes": ["embedding"]}
+
+
+def test_parse_responses_linear():
+    response = {"responses": [
+        make_response([(1, 0.9), (2, 0.5)]),
+        make_response([(2, 3.0)]),
+        make_response([(5, 0.7)]),
+        make_response([]),
+    ]}
+
+    results = parse_responses(response, "linear", 1, 0.5)
+
+    assert [[result["chunk_id"] for result in hits] for hits in results] == [[2], [5]]
+    assert "embedding" not in results[0][0]
+
+
+def test_parse_responses_error():
+    response = {"responses": [
+        make_response([(1, 0.9)]),
+        {"error": {"type": "index_not_found_exception"}, "status": 404},
+    ]}
+
+    with pytest.raises(RuntimeError, match="index_not_found_exception"):
+        parse_responses(response, "script_score", 3, 0.7)
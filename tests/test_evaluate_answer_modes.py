@@ -0,0 +1,41 @@
+import pytest
+from common.file_utils import list_to_csv
+from evaluate_answer_modes import evaluate_answers, load_labeled_rows
+
+
+def test_load_labeled_rows_skips_rows_without_label(tmp_path, capsys):
+    path_labeled_file = tmp_path / "query_labeled.csv"
+    list_to_csv([
+        ["query_no", "query", "label"],
+        ["1", "キッツの売上高は?", "100億円"],
+        ["2", "全国保証の従業員数は?"],
+        ["3", "高松コンストラクショングループの施工実績は?", " "],
+        ["4", "キッツの社長は?", "河野誠"],
+    ], path_labeled_file)
+
+    rows, labels = load_labeled_rows(path_labeled_file)
+
+    assert [row[0] for row in rows] == ["1", "4"]
+    assert labels == ["100億円", "河野誠"]
+    assert "query_no: 2, 3" in capsys.readouterr().out
+
+
+def test_load_labeled_rows_without_labels(tmp_path):
+    path_labeled_file = tmp_path / "query_labeled.csv"
+    list_to_csv([["query_no", "query"], ["1", "キッツの売上高は?"]], path_labeled_file)
+
+    with pytest.raises(ValueError, match="no labeled rows"):
+        load_labeled_rows(path_labeled_file)
+
+
+def test_evaluate_answers():
+    metrics = evaluate_answers(["100億円。", "分かりません"], ["100 億円", "河野誠"], [0.1, 0.3])
+
+    assert metrics["exact"] == pytest.approx(0.5)
+    assert metrics["unknown"] == pytest.approx(0.5)
+    assert metrics["mean"] == pytest.approx(0.2)
+
+
+def test_evaluate_answers_without_answers():
+    with pytest.raises(ValueError):
+        evaluate_answers([], [], [])
@@ -0,0 +1,66 @@
+import asyncio
+
+import make_csv_submission
+import pytest
+from common.model_request import StructuredOutputError
+from make_csv_submission import (extract_company_and_query,
+                                 extract_company_and_query_async,
+                                 make_company_and_query)
+
+QUERY = "キッツの売上高は?"
+
+
+class FakeChatModel:
+    """企業名の抽出に固定の応答を返却する Chat モデル"""
+
+    def __init__(self, response_json, company_name):
+        self.response_json = response_json
+        self.company_name = company_name
+
+    def get_response_json(self, *args, **kwargs):
+        if self.response_json is None:
+            raise StructuredOutputError("truncated")
+        return self.response_json
+
+    def get_response_only_text(self, *args, **kwargs):
+        return self.company_name
+
+
+class AsyncFakeChatModel(FakeChatModel):
+
+    async def get_response_json(self, *args, **kwargs):
+        return super().get_response_json()
+
+    async def get_response_only_text(self, *args, **kwargs):
+        return super().get_response_only_text()
+
+
+@pytest.mark.parametrize("company_name", ["-", "", " ", " - ", "\n-\n", "－"])
+def test_make_company_and_query_without_company(company_name):
+    assert make_company_and_query(QUERY, company_name, "売上高は?") == ("-", QUERY)
+
+
+@pytest.mark.parametrize("company_name, query_non_company, expected", [
+    (" キッツ ", " 売上高は? ", ("キッツ", "売上高は?")),
+    ("キッツ", "", ("キッツ", QUERY)),
+    ("キッツ", None, ("キッツ", "売上高は?")),
+])
+def test_make_company_and_query(company_name, query_non_company, expected):
+    assert make_company_and_query(QUERY, company_name, query_non_company) == expected
+
+
+@pytest.mark.parametrize("response_json, company_name", [
+    ({"company_name": " ", "query_non_company": "売上高は?"}, "キッツ"),
+    (None, " - "),  # JSONの応答を取得できない場合
+    (None, ""),
+])
+def test_extract_company_and_query_without_company(monkeypatch, response_json, company_name):
+    monkeypatch.setattr(
+        make_csv_submission, "get_openai_chat_model",
+        lambda: FakeChatModel(response_json, company_name))
+    monkeypatch.setattr(
+        make_csv_submission, "get_async_openai_chat_model",
+        lambda: AsyncFakeChatModel(response_json, company_name))
+
+    assert extract_company_and_query(QUERY) == ("-", QUERY)
+    assert asyncio.run(extract_company_and_query_async(QUERY)) == ("-", QUERY)
@@ -0,0 +1,141 @@
+import pytest
+from common.file_utils import items_to_file, iter_items
+from make_json_embeddings_from_json import (get_checkpoint_path,
+                                            make_embeddings_file)
+
+
+class FakeEmbeddingModel:
+    """テキストごとに決まった埋め込みベクトルを返却する Embedding モデル
+
+    texts_per_request 件ずつを1リクエストとし,crash_after 回のリクエスト後に異常終了する.
+    """
+
+    def __init__(self, max_inputs_per_request=4, texts_per_request=2, crash_after=None):
+        self.max_inputs_per_request = max_inputs_per_request
+        self.texts_per_request = texts_per_request
+        self.crash_after = crash_after
+        self.embedded_texts = []
+        self.num_requests = 0
+
+    def iter_responses(self, texts):
+        for start in range(0, len(texts), self.texts_per_request):
+            if self.num_requests == self.crash_after:
+                raise RuntimeError("crash")
+            self.num_requests += 1
+            indices = list(range(start, min(start + self.texts_per_request, len(texts))))
+            self.embedded_texts.extend(texts[i] for i in indices)
+            yield indices, [embed(texts[i]) for i in indices]
+
+
+def embed(text):
+    return [float(len(text)), float(sum(map(ord, text)) % 997)]
+
+
+def make_chunks(n):
+    # 入力の順序がチャンクIDの辞書順と一致しないようにする
+    return {
+        str(chunk_id): {"metadata": {"page": chunk_id}, "content": f"チャンク{chunk_id}"}
+        for chunk_id in [10, 2, 7, 1, 5][:n]
+    }
+
+
+@pytest.fixture(params=[".json", ".jsonl"])
+def suffix(request):
+    return request.param
+
+
+def write_input(tmp_path, chunks, suffix):
+    path_input_file = tmp_path / f"input_chunked{suffix}"
+    items_to_file(chunks.items(), path_input_file, "chunk_id")
+    return path_input_file
+
+
+def assert_output(path_output_file, chunks):
+    items = list(iter_items(path_output_file, "chunk_id"))
+    assert [chunk_id for chunk_id, _ in items] == list(chunks)
+    for chunk_id, item in items:
+        assert item == {**chunks[chunk_id], "embedding_vector": embed(chunks[chunk_id]["content"])}
+
+
+def test_make_embeddings_file(tmp_path, suffix):
+    chunks = make_chunks(5)
+    path_input_file = write_input(tmp_path, chunks, suffix)
+    path_output_file = tmp_path / f"result_embeddings{suffix}"
+    model = FakeEmbeddingModel()
+
+    make_embeddings_file(path_input_file, path_output_file, model)
+
+    assert_output(path_output_file, chunks)
+    assert model.num_requests == 3
+    assert not get_checkpoint_path(path_output_file).exists()
+
+
+def test_resume_after_crash(tmp_path, suffix):
+    chunks = make_chunks(5)
+    path_input_file = write_input(tmp_path, chunks, suffix)
+    path_output_file = tmp_path / f"result_embeddings{suffix}"
+
+    with pytest.raises(RuntimeError):
+        make_embeddings_file(path_input_file, path_output_file, FakeEmbeddingModel(crash_after=1))
+    assert not path_output_file.exists()
+    assert get_checkpoint_path(path_output_file).exists()
+
+    model = FakeEmbeddingModel()
+    make_embeddings_file(path_input_file, path_output_file, model)
+
+    # 1回目のリクエストで取得済のチャンクは API を実行しない
+    contents = [chunk["content"] for chunk in chunks.values()]
+    assert model.embedded_texts == contents[2:]
+    assert_output(path_output_file, chunks)
+    assert not get_checkpoint_path(path_output_file).exists()
+
+
+def test_resume_with_half_written_line(tmp_path):
+    chunks = make_chunks(5)
+    path_input_file = write_input(tmp_path, chunks, ".jsonl")
+    path_output_file = tmp_path / "result_embeddings.jsonl"
+    path_checkpoint = get_checkpoint_path(path_output_file)
+
+    with pytest.raises(RuntimeError):
+        make_embeddings_file(path_input_file, path_output_file, FakeEmbeddingModel(crash_after=1))
+    # 最後の行の書き込み途中で異常終了した状態にする
+    data = path_checkpoint.read_bytes()
+    path_checkpoint.write_bytes(data[:-10])
+
+    model = FakeEmbeddingModel()
+    make_embeddings_file(path_input_file, path_output_file, model)
+
+    contents = [chunk["content"] for chunk in chunks.values()]
+    assert model.embedded_texts == contents[1:]
+    assert_output(path_output_file, chunks)
+
+
+def test_reembed_changed_content(tmp_path):
+    chunks = make_chunks(5)
+    path_input_file = write_input(tmp_path, chunks, ".jsonl")
+    path_output_file = tmp_path / "result_embeddings.jsonl"
+
+    with pytest.raises(RuntimeError):
+        make_embeddings_file(path_input_file, path_output_file, FakeEmbeddingModel(crash_after=1))
+    # チェックポイント作成後にチャンクのコンテンツが変わった場合
+    chunks["10"]["content"] = "変更後のチャンク10"
+    write_input(tmp_path, chunks, ".jsonl")
+
+    model = FakeEmbeddingModel()
+    make_embeddings_file(path_input_file, path_output_file, model)
+
+    contents = [chunk["content"] for chunk in chunks.values()]
+    assert model.embedded_texts == [contents[0]] + contents[2:]
+    assert_output(path_output_file, chunks)
+
+
+def test_make_embeddings_file_without_chunks(tmp_path, suffix):
+    path_input_file = write_input(tmp_path, {}, suffix)
+    path_output_file = tmp_path / f"result_embeddings{suffix}"
+    model = FakeEmbeddingModel()
+
+    make_embeddings_file(path_input_file, path_output_file, model)
+
+    assert list(iter_items(path_output_file, "chunk_id")) == []
+    assert model.num_requests == 0
+    assert not get_checkpoint_path(path_output_file).exists()
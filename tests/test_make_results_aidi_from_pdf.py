@@ -0,0 +1,20 @@
+import json
+
+from azure.ai.documentintelligence.models import AnalyzeResult
+from make_results_aidi_from_pdf import result_to_json
+
+
+def test_result_to_json(tmp_path):
+    result = AnalyzeResult({
+        "apiVersion": "2024-11-30",
+        "modelId": "prebuilt-layout",
+        "content": "# 統合報告書\n本文",
+        "pages": [{"pageNumber": 1, "spans": [{"offset": 0, "length": 12}]}],
+    })
+    path_file_json = tmp_path / "result.json"
+
+    result_to_json(result, path_file_json)
+
+    text = path_file_json.read_text(encoding="utf-8")
+    assert "\n" not in text  # インデントせずに書き出す
+    assert json.loads(text) == result.as_dict()
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import openai
+import pytest
+from common import rate_limiter
+from common.rate_limiter import RateLimiter, TokenBucket, get_retry_after
+
+
+def make_error(error_type, status_code, headers=None):
+    request = httpx.Request("POST", "https://example.com/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return error_type("error", response=response, body=None)
+
+
+class FlakyFunc:
+    """指定した例外を順に送出した後に成功する関数"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.num_calls = 0
+
+    def __call__(self):
+        self.num_calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # 実際には待機せず,待機秒数のみを記録する
+    list_sleeps = []
+    monkeypatch.setattr(rate_limiter.time, "sleep", list_sleeps.append)
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda a, b: a)
+    return list_sleeps
+
+
+def test_retry_429_with_retry_after_ms(sleeps):
+    limiter = RateLimiter(max_retries=3)
+    func = FlakyFunc(make_error(openai.RateLimitError, 429, {"retry-after-ms": "2000"}))
+
+    started_at = time.monotonic()
+    assert limiter.call(func) == "ok"
+
+    assert func.num_calls == 2
+    assert sleeps[1] == pytest.approx(2.0)
+    # 同じレート制限を共有する呼び出しも再開時刻まで待機する
+    assert limiter.resume_at >= started_at + 2.0
+    assert limiter.reserve() == pytest.approx(2.0, abs=0.1)
+
+
+def test_call_async_retries_429(monkeypatch):
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    sleeps = []
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", sleep)
+    limiter = RateLimiter(max_retries=3)
+    func = FlakyFunc(make_error(openai.RateLimitError, 429, {"retry-after-ms": "500"}))
+
+    async def call():
+        return func()
+
+    assert asyncio.run(limiter.call_async(call)) == "ok"
+    assert func.num_calls == 2
+    assert max(sleeps) >= 0.5
+
+
+def test_400_is_not_retried(sleeps):
+    limiter = RateLimiter(max_retries=3)
+    func = FlakyFunc(make_error(openai.BadRequestError, 400))
+
+    with pytest.raises(openai.BadRequestError):
+        limiter.call(func)
+
+    assert func.num_calls == 1
+    assert limiter.resume_at == 0.0
+
+
+def test_max_retries_exhausted(sleeps):
+    limiter = RateLimiter(max_retries=2)
+    func = FlakyFunc(*[make_error(openai.InternalServerError, 500) for _ in range(3)])
+
+    with pytest.raises(openai.InternalServerError):
+        limiter.call(func)
+
+    assert func.num_calls == 3
+    # 500 では全体の実行を待機させない
+    assert limiter.resume_at == 0.0
+
+
+def test_reserve_over_capacity():
+    bucket = TokenBucket(60)
+
+    # 容量を超える消費量は容量として予約し,満タンであれば待機しない
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.level == pytest.approx(0.0, abs=0.1)
+    # 次の予約は容量分が補充されるまで(1分)待機する
+    assert bucket.reserve(1000) == pytest.approx(60.0, abs=0.1)
+
+
+def test_get_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    error = make_error(openai.RateLimitError, 429, {"retry-after": format_datetime(retry_at, usegmt=True)})
+
+    assert get_retry_after(error) == pytest.approx(30.0, abs=1.5)
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "1500", "retry-after": "3"}, 1.5),
+    ({"retry-after": "3"}, 3.0),
+    ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),
+    ({"retry-after": "later"}, None),
+    ({}, None),
+])
+def test_get_retry_after(headers, expected):
+    error = make_error(openai.RateLimitError, 429, headers)
+    assert get_retry_after(error) == expected
@@ -0,0 +1,131 @@
+import random
+
+import pytest
+from common import string_utils
+from common.string_utils import resolve_model_name, split_text_by_tokens
+
+SEPARATORS = ["\n\n", "\n", "。", "、", " "]
+
+
+class CharEncoding:
+    """1文字を1トークンとするエンコーディング"""
+
+    def encode(self, text):
+        return [ord(c) for c in text]
+
+    def decode_tokens_bytes(self, tokens):
+        return [chr(token).encode("utf-8") for token in tokens]
+
+
+class ByteEncoding:
+    """UTF-8の1バイトを1トークンとするエンコーディング(マルチバイト文字は文字の途中で区切られる)"""
+
+    def encode(self, text):
+        return list(text.encode("utf-8"))
+
+    def decode_tokens_bytes(self, tokens):
+        return [bytes([token]) for token in tokens]
+
+
+@pytest.fixture(params=[CharEncoding, ByteEncoding])
+def encoding(request, monkeypatch):
+    # BPE ファイルをダウンロードせずに実行できるようエンコーディングを差し替える
+    obj_encoding = request.param()
+    monkeypatch.setattr(string_utils, "get_encoding", lambda model_name: obj_encoding)
+    return obj_encoding
+
+
+def make_text(seed, n_words=400):
+    rng = random.Random(seed)
+    words = [
+        "".join(rng.choices("abcxyzあいう漢字", k=rng.randint(1, 12)))
+        for _ in range(n_words)
+    ]
+    return "".join(word + rng.choice(SEPARATORS + [""] * 3) for word in words)
+
+
+def locate_chunks(text, chunks):
+    """各チャンクの文字位置を取得する(直前のチャンクと重複または隣接する位置を探す)"""
+    starts = [0]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        previous_end = starts[-1] + len(previous)
+        start = next(
+            p for p in range(previous_end, starts[-1], -1) if text.startswith(chunk, p)
+        )
+        starts.append(start)
+    return starts
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("max_tokens, overlap_tokens", [
+    (50, 0),
+    (64, 10),
+    (200, 40),
+])
+def test_split_text_by_tokens(encoding, seed, max_tokens, overlap_tokens):
+    text = make_text(seed)
+
+    chunks = split_text_by_tokens(text, "stub", max_tokens, overlap_tokens, SEPARATORS)
+    starts = locate_chunks(text, chunks)
+
+    assert len(chunks) > 1
+    # 各チャンクのトークン数は上限以下となる
+    assert all(len(encoding.encode(chunk)) <= max_tokens for chunk in chunks)
+    # 全てのテキストがいずれかのチャンクに含まれる
+    assert text.startswith(chunks[0])
+    assert starts[-1] + len(chunks[-1]) == len(text)
+    # 隣接するチャンクは overlap_tokens 程度重複する(文字の途中のトークンは重複させない)
+    for start, previous_start, previous in zip(starts[1:], starts, chunks):
+        overlap = text[start:previous_start + len(previous)]
+        assert overlap_tokens - 3 <= len(encoding.encode(overlap)) <= overlap_tokens
+
+
+def expected_end(text, start, max_tokens, snap_ratio):
+    # 1文字1トークンの場合の分割位置: 末尾 snap_ratio の範囲で優先度の高い区切り文字の直後
+    end = start + max_tokens
+    lower = max(start + 1, end - int(max_tokens * snap_ratio))
+    for separator in SEPARATORS:
+        position = text.rfind(separator, lower, end)
+        if position >= 0:
+            return position + len(separator)
+    return end
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("snap_ratio", [0.1, 0.25, 0.5])
+def test_split_text_by_tokens_snaps_to_separators(monkeypatch, seed, snap_ratio):
+    monkeypatch.setattr(string_utils, "get_encoding", lambda model_name: CharEncoding())
+    text = make_text(seed)
+    max_tokens = 80
+
+    chunks = split_text_by_tokens(text, "stub", max_tokens, 0, SEPARATORS, snap_ratio)
+    starts = locate_chunks(text, chunks)
+
+    for start, chunk in zip(starts[:-1], chunks[:-1]):
+        assert start + len(chunk) == expected_end(text, start, max_tokens, snap_ratio)
+
+
+@pytest.mark.parametrize("text, expected", [
+    # 区切り文字がチャンクの末尾と一致する場合はその位置で分割する
+    ("あいう、えお。かきくけ\n\nこさしすせそ", ["あいう、えお。かきくけ\n\n", "こさしすせそ"]),
+    # 優先度の高い区切り文字を優先する
+    ("あいうえ\nおか、きくけこ\nさしすせそ", ["あいうえ\nおか、きくけこ\n", "さしすせそ"]),
+    # 区切り文字がない場合はトークンの境界で分割する
+    ("あいうえおかきくけこさしすせそ", ["あいうえおかきくけこさしす", "せそ"]),
+])
+def test_split_text_by_tokens_examples(monkeypatch, text, expected):
+    monkeypatch.setattr(string_utils, "get_encoding", lambda model_name: CharEncoding())
+    assert split_text_by_tokens(text, "stub", 13, 0, SEPARATORS, 0.5) == expected
+
+
+def test_split_text_within_max_tokens(encoding):
+    assert split_text_by_tokens("あいう\nえお", "stub", 20) == ["あいう\nえお"]
+
+
+@pytest.mark.parametrize("deployment, expected", [
+    ("gpt-4o-mini", "gpt-4o-mini"),  # デプロイ名がモデル名の場合はデプロイ名を使用する
+    ("4omini", "gpt-4o"),  # 任意のデプロイ名の場合は設定値を使用する
+    (None, "gpt-4o"),
+])
+def test_resolve_model_name(deployment, expected):
+    assert resolve_model_name(deployment, "gpt-4o") == expected